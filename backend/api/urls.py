@@ -1,20 +1,23 @@
 from django.urls import path, include
 from social.views import PlatformViewSet
 from rest_framework.routers import DefaultRouter
-from poll.views import PollViewSet, PollResultViewSet
+from poll.views import PollViewSet, PollResultViewSet, poll_stream
 from question_answers.views import QuestionViewSet, AnswerViewSet
-from campaign.views import CampaignViewSet, QueryViewSet, QueryResultViewSet
+from campaign.views import CampaignViewSet, QueryViewSet, QueryResultViewSet, IngestJobViewSet
 
 router = DefaultRouter()
 router.register(r"platforms", PlatformViewSet, basename="platform")
 router.register(r"campaigns", CampaignViewSet, basename="campaign")
 router.register(r"queries", QueryViewSet, basename="query")
 router.register(r"query-results", QueryResultViewSet, basename="QueryResult")
+router.register(r"ingest-jobs", IngestJobViewSet, basename="IngestJob")
 router.register(r"questions", QuestionViewSet, basename="question")
 router.register(r"answers", AnswerViewSet, basename="answer")
 router.register(r"polls", PollViewSet, basename="poll")
 router.register(r"poll-results", PollResultViewSet, basename="PollResult")
 
 urlpatterns = [
+    # Async view, kept out of the router
+    path("polls/<int:pk>/stream/", poll_stream, name="poll-stream"),
     path("", include(router.urls))
 ]
\ No newline at end of file
@@ -0,0 +1,170 @@
+# campaign/export.py
+import csv
+import json
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+from .models import QueryResults
+
+# Rows fetched per round trip from the server-side cursor, and per Parquet row group
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_COLUMNS = [
+    "qres_id", "query_id", "plt_id", "source_id", "firescore",
+    "poll_result_id", "created_at", "modified_at",
+]
+EXPORT_FORMATS = ("csv", "ndjson", "parquet")
+
+
+# Export responses are streamed by the view itself; these renderers only let
+# DRF's content negotiation accept ?format=csv|ndjson|parquet (and render errors).
+class _ExportRenderer(BaseRenderer):
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return json.dumps(data, cls=DjangoJSONEncoder).encode("utf-8")
+
+
+class CSVExportRenderer(_ExportRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+class NDJSONExportRenderer(_ExportRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+
+class ParquetExportRenderer(_ExportRenderer):
+    media_type = "application/vnd.apache.parquet"
+    format = "parquet"
+
+
+class _Echo:
+    # csv.writer needs a file; hand back each line instead of buffering it
+    def write(self, value):
+        return value
+
+
+class _ChunkSink:
+    # File-like target for the Parquet writer that gives back what was written so far
+    def __init__(self):
+        self.buffer = bytearray()
+        self.closed = False
+        self.position = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self.buffer = bytes(self.buffer), bytearray()
+        return data
+
+
+def _user_data_value(user_data, path):
+    value = user_data
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def iter_export_rows(query, user_data_keys):
+    """
+    Yield plain dicts for every active result of the query, straight from a
+    server-side cursor. Chosen user_data keys (dotted paths allowed) are
+    flattened into "user_data.<key>" columns.
+    """
+    paths = [key.split(".") for key in user_data_keys]
+    fields = EXPORT_COLUMNS + (["account__profile"] if paths else [])
+    rows = (
+        QueryResults.objects.filter(query=query)
+        .order_by("qres_id")
+        .values_list(*fields)
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    for values in rows:
+        row = dict(zip(EXPORT_COLUMNS, values))
+        if paths:
+            user_data = values[-1] or {}
+            for key, path in zip(user_data_keys, paths):
+                row[f"user_data.{key}"] = _user_data_value(user_data, path)
+        yield row
+
+
+def _cell(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def stream_csv(rows, columns):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_cell(row[c]) for c in columns])
+
+
+def stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+
+def stream_parquet(rows, columns):
+    """
+    One row group per EXPORT_CHUNK_SIZE rows, each sent as soon as it is
+    written. Needs pyarrow (import checked by the view).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {
+        "qres_id": pa.int64(), "query_id": pa.int64(), "plt_id": pa.int64(),
+        "poll_result_id": pa.int64(), "source_id": pa.string(), "firescore": pa.float64(),
+        "created_at": pa.timestamp("us", tz="UTC"), "modified_at": pa.timestamp("us", tz="UTC"),
+    }
+    schema = pa.schema([(c, types.get(c, pa.string())) for c in columns])
+
+    def to_table(chunk):
+        data = {}
+        for c in columns:
+            values = [row[c] for row in chunk]
+            if c == "firescore":
+                values = [None if v is None else float(v) for v in values]
+            elif c not in types:
+                values = [None if v is None else (v if isinstance(v, str) else json.dumps(v, cls=DjangoJSONEncoder))
+                          for v in values]
+            data[c] = values
+        return pa.Table.from_pydict(data, schema=schema)
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= EXPORT_CHUNK_SIZE:
+            writer.write_table(to_table(chunk))
+            chunk = []
+            yield sink.drain()
+    if chunk:
+        writer.write_table(to_table(chunk))
+    writer.close()
+    yield sink.drain()
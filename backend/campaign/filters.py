@@ -0,0 +1,114 @@
+# campaign/filters.py
+import json
+import re
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from .models import PROMOTED_USER_DATA_KEYS, SourceAccount
+
+# ?user_data={"lang": "en"}            containment, served by the GIN index
+# ?ud.<key>=<value>                    equality, e.g. ud.lang=en or ud.verified=true
+# ?ud.<key>__gt|gte|lt|lte=<number>    numeric range, e.g. ud.followers__gt=1000
+# ?ud.<key>__in=<v1>,<v2>              any of the values
+# ?ud.<key>__exists=true|false         key present or not
+# Nested keys use dots: ud.profile.location=Sydney
+# user_data is the owner's SourceAccount profile, so every predicate goes through the account.
+PROFILE = "account__profile"
+USER_DATA_PARAM = "user_data"
+KEY_PARAM_PREFIX = "ud."
+RANGE_OPS = ("gt", "gte", "lt", "lte")
+OPS = RANGE_OPS + ("in", "exists")
+
+_KEY_RE = re.compile(r"^[A-Za-z0-9_\-]+(\.[A-Za-z0-9_\-]+)*$")
+
+
+def _parse_value(raw):
+    # JSON literals when possible (numbers, true/false/null), otherwise the plain string
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw
+
+
+def _nest(path, value):
+    for key in reversed(path):
+        value = {key: value}
+    return value
+
+
+def _not_a_number(path, op):
+    name = f"{KEY_PARAM_PREFIX}{'.'.join(path)}" + (f"__{op}" if op else "")
+    return ValidationError({name: "Must be a number."})
+
+
+def _column_value(name, path, op, raw):
+    # Promoted keys are typed columns: coerce here rather than fail in the query.
+    # null still means "no value", like it does for the JSON keys.
+    if _parse_value(raw) is None:
+        return None
+    try:
+        return SourceAccount._meta.get_field(name).output_field.to_python(raw)
+    except DjangoValidationError:
+        raise _not_a_number(path, op)
+
+
+def _key_q(path, op, raw):
+    name = PROMOTED_USER_DATA_KEYS.get(path[0]) if len(path) == 1 else None
+    column = name and f"account__{name}"
+    lookup = column or "__".join([PROFILE, *path])
+
+    if op is None:
+        if column:
+            return Q(**{column: _column_value(name, path, op, raw)})
+        # Equality as containment so it can use the GIN index
+        return Q(**{f"{PROFILE}__contains": _nest(path, _parse_value(raw))})
+
+    if op in RANGE_OPS:
+        try:
+            value = float(raw)
+        except ValueError:
+            raise _not_a_number(path, op)
+        return Q(**{f"{lookup}__{op}": value})
+
+    if op == "in":
+        raws = [v.strip() for v in raw.split(",") if v.strip()]
+        if column:
+            return Q(**{f"{column}__in": [_column_value(name, path, op, v) for v in raws]})
+        q = Q()
+        for value in raws:
+            q |= Q(**{f"{PROFILE}__contains": _nest(path, _parse_value(value))})
+        return q
+
+    # exists
+    present = str(raw).strip().lower() in ("1", "true", "yes")
+    q = Q(**{"__".join([PROFILE, *path[:-1]]) + "__has_key": path[-1]})
+    return q if present else ~q
+
+
+def filter_user_data(qs, params):
+    """
+    Apply the user_data filters found in the query params to a QueryResults queryset.
+    Every predicate is pushed down to the database.
+    """
+    raw = params.get(USER_DATA_PARAM)
+    if raw:
+        try:
+            contains = json.loads(raw)
+        except ValueError:
+            contains = None
+        if not isinstance(contains, dict):
+            raise ValidationError({USER_DATA_PARAM: "Must be a JSON object."})
+        qs = qs.filter(**{f"{PROFILE}__contains": contains})
+
+    for name in params:
+        if not name.startswith(KEY_PARAM_PREFIX):
+            continue
+        key, _, op = name[len(KEY_PARAM_PREFIX):].partition("__")
+        if not _KEY_RE.match(key) or (op and op not in OPS):
+            raise ValidationError({name: "Unsupported user_data filter."})
+        for raw_value in params.getlist(name):
+            qs = qs.filter(_key_q(key.split("."), op or None, raw_value))
+
+    return qs
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0008_ingestjob'),
+        ('poll', '0003_pollresult_uq_active_result_per_user_per_poll'),
+        ('social', '0006_alter_userplatformconnection_external_account_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='queryresults',
+            index=models.Index(fields=['query', '-created_at', '-qres_id'], name='campaign_qu_query_i_6a5c25_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='queryresults',
+            index=models.Index(fields=['-created_at', '-qres_id'], name='campaign_qu_created_52cd06_idx'),
+        ),
+    ]
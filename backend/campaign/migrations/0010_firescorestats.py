@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0009_queryresults_campaign_qu_query_i_6a5c25_idx_and_more'),
+        ('social', '0006_alter_userplatformconnection_external_account_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FirescoreStats',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('stats_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('result_count', models.PositiveIntegerField(default=0)),
+                ('linked_count', models.PositiveIntegerField(default=0)),
+                ('scored_count', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.DecimalField(decimal_places=3, default=0, max_digits=20)),
+                ('score_sq_sum', models.FloatField(default=0)),
+                ('histogram', models.JSONField(blank=True, default=list)),
+                ('plt', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='firescore_stats', to='social.platform')),
+                ('query', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='firescore_stats', to='campaign.query')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('query', 'plt'), name='uq_firescore_stats_per_query_platform')],
+            },
+        ),
+    ]
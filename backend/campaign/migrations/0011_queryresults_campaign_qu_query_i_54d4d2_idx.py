@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0010_firescorestats'),
+        ('poll', '0004_pollresult_poll_pollre_poll_id_8d0869_idx_and_more'),
+        ('social', '0006_alter_userplatformconnection_external_account_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='queryresults',
+            index=models.Index(fields=['query', 'is_active', '-firescore'], name='campaign_qu_query_i_54d4d2_idx'),
+        ),
+    ]
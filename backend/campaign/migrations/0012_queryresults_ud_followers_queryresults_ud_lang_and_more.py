@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:55
+
+import django.contrib.postgres.indexes
+import django.db.models.fields.json
+import django.db.models.functions.comparison
+import django.db.models.lookups
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0011_queryresults_campaign_qu_query_i_54d4d2_idx'),
+        ('poll', '0004_pollresult_poll_pollre_poll_id_8d0869_idx_and_more'),
+        ('social', '0006_alter_userplatformconnection_external_account_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queryresults',
+            name='ud_followers',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(django.db.models.lookups.Exact(models.Func(django.db.models.fields.json.KeyTransform('followers', 'user_data'), function='jsonb_typeof', output_field=models.TextField()), models.Value('number')), then=django.db.models.functions.comparison.Cast(django.db.models.fields.json.KeyTextTransform('followers', 'user_data'), models.FloatField())), default=None, output_field=models.FloatField()), output_field=models.FloatField()),
+        ),
+        migrations.AddField(
+            model_name='queryresults',
+            name='ud_lang',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.fields.json.KeyTextTransform('lang', 'user_data'), output_field=models.TextField()),
+        ),
+        migrations.AddIndex(
+            model_name='queryresults',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['user_data'], name='qres_user_data_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='queryresults',
+            index=models.Index(fields=['query', 'ud_followers'], name='campaign_qu_query_i_d6f897_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='queryresults',
+            index=models.Index(fields=['query', 'ud_lang'], name='campaign_qu_query_i_87235b_idx'),
+        ),
+    ]
@@ -0,0 +1,133 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:58
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+import django.db.models.fields.json
+import django.db.models.functions.comparison
+import django.db.models.lookups
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def _profile_hash(profile):
+    if profile is None:
+        return ""
+    canonical = json.dumps(profile, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def copy_profiles_to_accounts(apps, schema_editor):
+    """
+    One SourceAccount per (campaign owner, plt, source_id) holding that
+    owner's most recently modified user_data, then point every QueryResults
+    row at its account. Profiles never cross from one user to another.
+    """
+    QueryResults = apps.get_model("campaign", "QueryResults")
+    SourceAccount = apps.get_model("campaign", "SourceAccount")
+
+    # Latest row per account, ids only to keep memory small
+    latest = {}
+    rows = (
+        QueryResults.objects.order_by("modified_at", "qres_id")
+        .values_list("qres_id", "query__campaign__user_id", "plt_id", "source_id")
+    )
+    for qres_id, user_id, plt_id, source_id in rows.iterator(chunk_size=BATCH_SIZE):
+        latest[(user_id, plt_id, source_id)] = qres_id
+
+    account_ids = {}
+    keys = list(latest)
+    for i in range(0, len(keys), BATCH_SIZE):
+        chunk = keys[i:i + BATCH_SIZE]
+        profiles = dict(
+            QueryResults.objects.filter(qres_id__in=[latest[k] for k in chunk]).values_list("qres_id", "user_data")
+        )
+        new = []
+        for user_id, plt_id, source_id in chunk:
+            profile = profiles[latest[(user_id, plt_id, source_id)]]
+            new.append(SourceAccount(user_id=user_id, plt_id=plt_id, source_id=source_id,
+                                     profile=profile, profile_hash=_profile_hash(profile)))
+        accounts = SourceAccount.objects.bulk_create(new)
+        for account in accounts:
+            account_ids[(account.user_id, account.plt_id, account.source_id)] = account.pk
+
+    batch = []
+    rows = (
+        QueryResults.objects.annotate(owner_id=models.F("query__campaign__user_id"))
+        .only("qres_id", "plt_id", "source_id")
+    )
+    for obj in rows.iterator(chunk_size=BATCH_SIZE):
+        obj.account_id = account_ids[(obj.owner_id, obj.plt_id, obj.source_id)]
+        batch.append(obj)
+        if len(batch) >= BATCH_SIZE:
+            QueryResults.objects.bulk_update(batch, ["account"])
+            batch = []
+    if batch:
+        QueryResults.objects.bulk_update(batch, ["account"])
+
+
+def copy_profiles_back(apps, schema_editor):
+    QueryResults = apps.get_model("campaign", "QueryResults")
+    batch = []
+    rows = QueryResults.objects.select_related("account").filter(account__isnull=False)
+    for obj in rows.iterator(chunk_size=BATCH_SIZE):
+        obj.user_data = obj.account.profile
+        batch.append(obj)
+        if len(batch) >= BATCH_SIZE:
+            QueryResults.objects.bulk_update(batch, ["user_data"])
+            batch = []
+    if batch:
+        QueryResults.objects.bulk_update(batch, ["user_data"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0012_queryresults_ud_followers_queryresults_ud_lang_and_more'),
+        ('social', '0006_alter_userplatformconnection_external_account_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SourceAccount',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('account_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('source_id', models.CharField(max_length=255)),
+                ('profile', models.JSONField(blank=True, null=True)),
+                ('profile_hash', models.CharField(blank=True, max_length=64)),
+                ('ud_followers', models.GeneratedField(db_persist=True, expression=models.Case(models.When(django.db.models.lookups.Exact(models.Func(django.db.models.fields.json.KeyTransform('followers', 'profile'), function='jsonb_typeof', output_field=models.TextField()), models.Value('number')), then=django.db.models.functions.comparison.Cast(django.db.models.fields.json.KeyTextTransform('followers', 'profile'), models.FloatField())), default=None, output_field=models.FloatField()), output_field=models.FloatField())),
+                ('ud_lang', models.GeneratedField(db_persist=True, expression=django.db.models.fields.json.KeyTextTransform('lang', 'profile'), output_field=models.TextField())),
+                ('plt', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='source_accounts', to='social.platform')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='source_accounts', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='queryresults',
+            name='account',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='results', to='campaign.sourceaccount'),
+        ),
+        migrations.AddIndex(
+            model_name='sourceaccount',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['profile'], name='srcacct_profile_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='sourceaccount',
+            index=models.Index(fields=['ud_followers'], name='campaign_so_ud_foll_139960_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sourceaccount',
+            index=models.Index(fields=['ud_lang'], name='campaign_so_ud_lang_e0a30f_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='sourceaccount',
+            constraint=models.UniqueConstraint(fields=('user', 'plt', 'source_id'), name='uq_source_account_per_user_platform'),
+        ),
+        migrations.RunPython(copy_profiles_to_accounts, copy_profiles_back),
+    ]
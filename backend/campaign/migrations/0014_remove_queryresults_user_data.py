@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:58
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0013_sourceaccount'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='queryresults',
+            name='qres_user_data_gin',
+        ),
+        migrations.RemoveIndex(
+            model_name='queryresults',
+            name='campaign_qu_query_i_d6f897_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='queryresults',
+            name='campaign_qu_query_i_87235b_idx',
+        ),
+        migrations.RemoveField(
+            model_name='queryresults',
+            name='ud_followers',
+        ),
+        migrations.RemoveField(
+            model_name='queryresults',
+            name='ud_lang',
+        ),
+        migrations.RemoveField(
+            model_name='queryresults',
+            name='user_data',
+        ),
+    ]
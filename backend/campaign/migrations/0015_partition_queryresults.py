@@ -0,0 +1,102 @@
+# Turns campaign_queryresults into a table partitioned by HASH (query_id).
+#
+# PostgreSQL only; other backends keep the plain table. Declarative
+# partitioning needs the partition key in every unique constraint, so the
+# primary key becomes (qres_id, query_id) in the database. Django still
+# treats qres_id as the pk, and it stays unique because it comes from a
+# single sequence. The partitioned table can't keep the identity column
+# before PostgreSQL 17, so qres_id defaults to its own sequence instead.
+# Indexes and foreign keys are recreated with their original names, which
+# keeps later Django migrations working on the table.
+#
+# A lasting consequence: with (qres_id, query_id) as the primary key no
+# foreign key can reference this table any more, since PostgreSQL needs a
+# unique constraint on exactly the referenced columns.
+
+from django.db import migrations
+
+TABLE = "campaign_queryresults"
+OLD_TABLE = f"{TABLE}_unpartitioned"
+SEQUENCE = f"{TABLE}_qres_id_seq"
+PARTITIONS = 16
+
+
+def _capture(cursor):
+    cursor.execute(
+        "SELECT indexname, indexdef FROM pg_indexes "
+        "WHERE schemaname = current_schema() AND tablename = %s",
+        [TABLE],
+    )
+    indexes = [defn for name, defn in cursor.fetchall() if name != f"{TABLE}_pkey"]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype IN ('f', 'c')",
+        [TABLE],
+    )
+    constraints = cursor.fetchall()
+    return indexes, constraints
+
+
+def _rebuild(schema_editor, partitioned):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        indexes, constraints = _capture(cursor)
+
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{OLD_TABLE}"')
+        partition_by = " PARTITION BY HASH (query_id)" if partitioned else ""
+        cursor.execute(
+            f'CREATE TABLE "{TABLE}" (LIKE "{OLD_TABLE}" INCLUDING DEFAULTS INCLUDING GENERATED)'
+            f"{partition_by}"
+        )
+        # Going back, LIKE copies the nextval() default of the sequence about to be dropped
+        cursor.execute(f'ALTER TABLE "{TABLE}" ALTER COLUMN qres_id DROP DEFAULT')
+        if partitioned:
+            for remainder in range(PARTITIONS):
+                cursor.execute(
+                    f'CREATE TABLE "{TABLE}_p{remainder}" PARTITION OF "{TABLE}" '
+                    f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})"
+                )
+
+        cursor.execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{OLD_TABLE}"')
+        cursor.execute(f'DROP TABLE "{OLD_TABLE}"')
+
+        pk = "qres_id, query_id" if partitioned else "qres_id"
+        cursor.execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_pkey" PRIMARY KEY ({pk})')
+        for defn in indexes:
+            cursor.execute(defn)
+        for name, defn in constraints:
+            cursor.execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{name}" {defn}')
+
+        cursor.execute(f'SELECT COALESCE(MAX(qres_id), 0) + 1 FROM "{TABLE}"')
+        (start,) = cursor.fetchone()
+        if partitioned:
+            cursor.execute(f'CREATE SEQUENCE "{SEQUENCE}" OWNED BY "{TABLE}".qres_id START {start}')
+            cursor.execute(
+                f"ALTER TABLE \"{TABLE}\" ALTER COLUMN qres_id SET DEFAULT nextval('\"{SEQUENCE}\"')"
+            )
+        else:
+            cursor.execute(
+                f'ALTER TABLE "{TABLE}" ALTER COLUMN qres_id '
+                f"ADD GENERATED BY DEFAULT AS IDENTITY (START WITH {start})"
+            )
+
+
+def partition(apps, schema_editor):
+    _rebuild(schema_editor, partitioned=True)
+
+
+def unpartition(apps, schema_editor):
+    _rebuild(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0014_remove_queryresults_user_data'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
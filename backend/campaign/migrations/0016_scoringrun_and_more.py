@@ -0,0 +1,55 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0015_partition_queryresults'),
+        ('poll', '0004_pollresult_poll_pollre_poll_id_8d0869_idx_and_more'),
+        ('social', '0006_alter_userplatformconnection_external_account_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoringRun',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('run_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='running', max_length=16)),
+                ('scorer', models.CharField(max_length=255)),
+                ('incremental', models.BooleanField(default=False)),
+                ('since', models.DateTimeField(blank=True, null=True)),
+                ('watermark', models.DateTimeField()),
+                ('rows_considered', models.PositiveIntegerField(default=0)),
+                ('rows_scored', models.PositiveIntegerField(default=0)),
+                ('rows_changed', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='queryresults',
+            index=models.Index(fields=['query', 'modified_at'], name='campaign_qu_query_i_11c54f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sourceaccount',
+            index=models.Index(fields=['modified_at'], name='campaign_so_modifie_ec89b9_idx'),
+        ),
+        migrations.AddField(
+            model_name='scoringrun',
+            name='query',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scoring_runs', to='campaign.query'),
+        ),
+        migrations.AddIndex(
+            model_name='scoringrun',
+            index=models.Index(fields=['query', 'status', '-watermark'], name='campaign_sc_query_i_d06894_idx'),
+        ),
+    ]
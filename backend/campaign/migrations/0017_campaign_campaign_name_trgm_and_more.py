@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:11
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0016_scoringrun_and_more'),
+        ('social', '0006_alter_userplatformconnection_external_account_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Also used by question_answers.Question, see its 0005
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='campaign',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='campaign_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='query',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_term'], name='query_search_term_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
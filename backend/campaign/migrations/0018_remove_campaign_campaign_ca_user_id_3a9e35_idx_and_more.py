@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:14
+
+import core.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0017_campaign_campaign_name_trgm_and_more'),
+        ('poll', '0005_pollresult_poll_pollre_poll_id_bffe30_idx'),
+        ('social', '0006_alter_userplatformconnection_external_account_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='campaign',
+            name='campaign_ca_user_id_3a9e35_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='queryresults',
+            name='campaign_qu_query_i_6a5c25_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='queryresults',
+            name='campaign_qu_created_52cd06_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='queryresults',
+            name='campaign_qu_query_i_54d4d2_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='queryresults',
+            name='campaign_qu_query_i_11c54f_idx',
+        ),
+        migrations.AddIndex(
+            model_name='campaign',
+            index=core.models.AliveIndex(condition=models.Q(('is_active', True)), fields=['user', 'plt', 'name'], name='campaign_ca_user_id_a5d543_alv'),
+        ),
+        migrations.AddIndex(
+            model_name='queryresults',
+            index=core.models.AliveIndex(condition=models.Q(('is_active', True)), fields=['query', '-created_at', '-qres_id'], name='campaign_qu_query_i_337fd1_alv'),
+        ),
+        migrations.AddIndex(
+            model_name='queryresults',
+            index=core.models.AliveIndex(condition=models.Q(('is_active', True)), fields=['-created_at', '-qres_id'], name='campaign_qu_created_e70868_alv'),
+        ),
+        migrations.AddIndex(
+            model_name='queryresults',
+            index=core.models.AliveIndex(condition=models.Q(('is_active', True)), fields=['query', '-firescore'], name='campaign_qu_query_i_e1c612_alv'),
+        ),
+        migrations.AddIndex(
+            model_name='queryresults',
+            index=core.models.AliveIndex(condition=models.Q(('is_active', True)), fields=['query', 'modified_at'], name='campaign_qu_query_i_5ff573_alv'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0018_remove_campaign_campaign_ca_user_id_3a9e35_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultsVersion',
+            fields=[
+                ('version_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='results_version', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
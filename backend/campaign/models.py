@@ -1,7 +1,11 @@
 from django.db import models
-from django.db.models import Q
+from django.db.models import Q, Func, Value
 from django.conf import settings
-from core.models import SoftDeleteModel
+from django.db.models.lookups import Exact
+from django.db.models.functions import Cast
+from django.contrib.postgres.indexes import GinIndex
+from django.db.models.fields.json import KeyTextTransform, KeyTransform
+from core.models import AliveIndex, SoftDeleteModel, TimeStampedModel
 from django.db.models.functions import Lower
 from django.core.exceptions import ValidationError
 
@@ -24,7 +28,11 @@ class Campaign(SoftDeleteModel):
     
     class Meta:
         ordering = ["-created_at"]
-        indexes = [models.Index(fields=["user", "plt", "name", "is_active"])]
+        indexes = [
+            AliveIndex(fields=["user", "plt", "name"]),
+            # ?search= on name, see core/mixins.py
+            GinIndex(fields=["name"], name="campaign_name_trgm", opclasses=["gin_trgm_ops"]),
+        ]
 
         constraints = [
             models.UniqueConstraint (
@@ -45,7 +53,11 @@ class Query(SoftDeleteModel):
 
     class Meta:
         ordering = ["-created_at"]
-        indexes = [models.Index(fields=["campaign", "search_term", "created_at"])]
+        indexes = [
+            models.Index(fields=["campaign", "search_term", "created_at"]),
+            # ?search= on search_term, see core/mixins.py
+            GinIndex(fields=["search_term"], name="query_search_term_trgm", opclasses=["gin_trgm_ops"]),
+        ]
 
         constraints = [
             models.UniqueConstraint(
@@ -59,16 +71,97 @@ class Query(SoftDeleteModel):
         return self.search_term[:80]
 
 
+# Hot profile keys are promoted to generated columns so they can be
+# range-filtered and indexed like ordinary columns, see campaign/filters.py
+PROMOTED_USER_DATA_KEYS = {
+    "followers": "ud_followers",
+    "lang": "ud_lang",
+}
+
+
+def _json_number(field, key):
+    # NULL unless the key holds a JSON number, so a bad value can never fail the cast
+    return models.Case(
+        models.When(
+            Exact(Func(KeyTransform(key, field), function="jsonb_typeof", output_field=models.TextField()),
+                  Value("number")),
+            then=Cast(KeyTextTransform(key, field), models.FloatField()),
+        ),
+        default=None,
+        output_field=models.FloatField(),
+    )
+
+
+class SourceAccount(TimeStampedModel):
+    """
+    One social account (source_id on a platform) and its latest profile as
+    seen by one user, shared by every QueryResults row of that user's
+    campaigns that found it. The profile is only rewritten when its content
+    hash changes.
+    """
+    account_id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="source_accounts")
+    plt = models.ForeignKey("social.Platform", on_delete=models.PROTECT, related_name="source_accounts")
+    source_id = models.CharField(max_length=255)
+    profile = models.JSONField(blank=True, null=True)
+    profile_hash = models.CharField(max_length=64, blank=True)
+
+    ud_followers = models.GeneratedField(
+        expression=_json_number("profile", "followers"), output_field=models.FloatField(), db_persist=True
+    )
+    ud_lang = models.GeneratedField(
+        expression=KeyTextTransform("lang", "profile"), output_field=models.TextField(), db_persist=True
+    )
+
+    class Meta:
+        indexes = [
+            # user_data filters: containment / key existence via GIN, promoted keys via btree
+            GinIndex(fields=["profile"], name="srcacct_profile_gin"),
+            models.Index(fields=["ud_followers"]),
+            models.Index(fields=["ud_lang"]),
+            # Profiles changed since the last scoring run
+            models.Index(fields=["modified_at"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "plt", "source_id"], name="uq_source_account_per_user_platform"),
+        ]
+
+    def __str__(self):
+        return f"SourceAccount[{self.pk}] u={self.user_id} p={self.plt_id} src={self.source_id}"
+
+
 class QueryResults(SoftDeleteModel):
+    """
+    On PostgreSQL the table is partitioned by HASH (query_id) (migration 0015),
+    so filter by query wherever possible to let the planner prune partitions.
+    Unique constraints added here must include "query".
+
+    The database primary key is (qres_id, query_id), so qres_id alone is not a
+    unique key there and no foreign key can point at QueryResults. Models that
+    need to refer to a result must store its id (and query) without an FK.
+    """
     qres_id = models.BigAutoField(primary_key=True)
     query = models.ForeignKey(Query, on_delete=models.PROTECT, related_name="records")
     plt = models.ForeignKey("social.Platform", on_delete=models.PROTECT, related_name="results")
     poll_result = models.ForeignKey("poll.PollResult", on_delete=models.SET_NULL, related_name="query_results",
                                     blank=True, null=True)
-    user_data = models.JSONField(blank=True, null=True)
+    # The account's profile (what the API calls user_data) lives once on SourceAccount
+    account = models.ForeignKey(SourceAccount, on_delete=models.PROTECT, related_name="results",
+                                blank=True, null=True)
     source_id = models.CharField(max_length=255, db_index=True)
     firescore = models.DecimalField(max_digits=6, decimal_places=3, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination walks (created_at, pk) newest first, per query or per owner
+            AliveIndex(fields=["query", "-created_at", "-qres_id"]),
+            AliveIndex(fields=["-created_at", "-qres_id"]),
+            # Top-K ranking reads the highest firescores of a query first
+            AliveIndex(fields=["query", "-firescore"]),
+            # Incremental re-scoring picks up rows changed since the last run
+            AliveIndex(fields=["query", "modified_at"]),
+        ]
+
     def clean(self):
         
         if self.poll_result_id:
@@ -77,3 +170,123 @@ class QueryResults(SoftDeleteModel):
                 raise ValidationError("poll_result.poll.query must match QueryResult.query.")
 
 
+
+
+class IngestJob(TimeStampedModel):
+    """
+    A QueryResults upsert handed off to Celery; the payload is kept until the
+    worker is done with it so the request can return straight away.
+    """
+    STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("succeeded", "Succeeded"),
+        ("failed", "Failed"),
+    )
+
+    job_id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="ingest_jobs")
+    query = models.ForeignKey(Query, on_delete=models.CASCADE, related_name="ingest_jobs")
+    plt = models.ForeignKey("social.Platform", on_delete=models.PROTECT, related_name="ingest_jobs")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="pending")
+    payload = models.JSONField(blank=True, null=True)
+
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_rows = models.PositiveIntegerField(default=0)
+    updated_rows = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["user", "status", "created_at"])]
+
+    def __str__(self):
+        return f"IngestJob[{self.pk}] q={self.query_id} {self.status}"
+
+    @property
+    def progress(self):
+        if not self.total_rows:
+            return 1.0 if self.status == "succeeded" else 0.0
+        return round(self.processed_rows / self.total_rows, 4)
+
+
+class FirescoreStats(TimeStampedModel):
+    """
+    Running firescore aggregates for the active QueryResults of one (query, plt).
+    Kept up to date by the write paths and rebuilt periodically to fix any drift,
+    see campaign/stats.py
+    """
+    stats_id = models.BigAutoField(primary_key=True)
+    query = models.ForeignKey(Query, on_delete=models.CASCADE, related_name="firescore_stats")
+    plt = models.ForeignKey("social.Platform", on_delete=models.PROTECT, related_name="firescore_stats")
+
+    result_count = models.PositiveIntegerField(default=0)
+    linked_count = models.PositiveIntegerField(default=0)
+    scored_count = models.PositiveIntegerField(default=0)
+    score_sum = models.DecimalField(max_digits=20, decimal_places=3, default=0)
+    score_sq_sum = models.FloatField(default=0)
+    histogram = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["query", "plt"], name="uq_firescore_stats_per_query_platform"),
+        ]
+
+    def __str__(self):
+        return f"FirescoreStats q={self.query_id} p={self.plt_id} n={self.result_count}"
+
+
+class ResultsVersion(models.Model):
+    """
+    Counter bumped by every write to a user's QueryResults or their accounts,
+    so a list of them can be revalidated on this one row, see
+    campaign/stats.py
+    """
+    version_id = models.BigAutoField(primary_key=True)
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="results_version")
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"ResultsVersion u={self.user_id} v={self.version}"
+
+
+class ScoringRun(TimeStampedModel):
+    """
+    One firescore scoring pass over a query, see campaign/scoring.py. The
+    watermark of the latest successful run is where the next incremental run
+    picks up.
+    """
+    STATUS_CHOICES = (
+        ("running", "Running"),
+        ("succeeded", "Succeeded"),
+        ("failed", "Failed"),
+    )
+
+    run_id = models.BigAutoField(primary_key=True)
+    query = models.ForeignKey(Query, on_delete=models.CASCADE, related_name="scoring_runs")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="running")
+    scorer = models.CharField(max_length=255)
+    incremental = models.BooleanField(default=False)
+    # Rows changed after `since` were rescored (all rows when null); `watermark`
+    # is when this run started looking, the next run's `since`
+    since = models.DateTimeField(blank=True, null=True)
+    watermark = models.DateTimeField()
+
+    rows_considered = models.PositiveIntegerField(default=0)
+    rows_scored = models.PositiveIntegerField(default=0)
+    rows_changed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["query", "status", "-watermark"])]
+
+    def __str__(self):
+        return f"ScoringRun[{self.pk}] q={self.query_id} {self.status}"
@@ -0,0 +1,245 @@
+# campaign/scoring.py
+import logging
+import math
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, Func, Value, When
+from django.db.models.fields.json import KeyTextTransform, KeyTransform
+from django.db.models.functions import Cast
+from django.db.models.lookups import Exact
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from poll.models import PollResult
+
+from .models import QueryResults, ScoringRun, SourceAccount
+from .stats import SCORE_QUANTUM, apply_firescore_delta, bump_results_version
+
+logger = logging.getLogger(__name__)
+
+# Top-level profile keys turned into feature columns. Numbers come through as
+# is, booleans as 1.0 / 0.0, anything else (or a missing key) as NaN.
+PROFILE_FEATURES = ("followers", "following", "posts", "verified")
+
+# Rows per round trip when loading a query's results, and ids per UPDATE
+SCORING_CHUNK_SIZE = 5000
+SCORING_WRITE_BATCH_SIZE = 5000
+
+DEFAULT_SCORER = "campaign.scoring.baseline_scorer"
+
+# Incremental runs look back this far before the previous watermark, so rows
+# written by transactions still open when that run started aren't missed.
+# Rescoring a row twice is harmless.
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+
+def _profile_number(key):
+    # Computed in SQL so Python never has to parse the profiles
+    typeof = Func(KeyTransform(key, "account__profile"), function="jsonb_typeof",
+                  output_field=models.TextField())
+    text = KeyTextTransform(key, "account__profile")
+    return Case(
+        When(Exact(typeof, Value("number")), then=Cast(text, models.FloatField())),
+        When(Exact(typeof, Value("boolean")),
+             then=Case(When(Exact(text, Value("true")), then=Value(1.0)), default=Value(0.0))),
+        default=None,
+        output_field=models.FloatField(),
+    )
+
+
+def _flag(lookup):
+    return Case(When(**{f"{lookup}__isnull": False}, then=Value(1.0)), default=Value(0.0),
+                output_field=models.FloatField())
+
+
+def load_features(queryset):
+    """
+    Load the results in `queryset` as feature columns, one float64 array per
+    name, all aligned with features["qres_id"]:
+
+        qres_id, plt_id, firescore     the row itself (NaN when unscored)
+        has_profile                    1.0 when the account has a profile
+        <PROFILE_FEATURES>             see above
+        linked, answered               1.0 when linked to a poll result / one with an answer
+        answer_id                      the linked answer, NaN when none
+    """
+    annotations = {f"f_{key}": _profile_number(key) for key in PROFILE_FEATURES}
+    annotations.update(
+        f_has_profile=_flag("account__profile"),
+        f_linked=_flag("poll_result"),
+        f_answered=_flag("poll_result__answer"),
+        f_answer_id=Cast("poll_result__answer_id", models.FloatField()),
+    )
+    names = ["qres_id", "plt_id", "firescore", *(name[2:] for name in annotations)]
+
+    rows = list(
+        queryset.order_by()
+        .annotate(**annotations)
+        .values_list("qres_id", "plt_id", "firescore", *annotations)
+        .iterator(chunk_size=SCORING_CHUNK_SIZE)
+    )
+    # None becomes NaN on the way into a float array
+    matrix = np.array(rows, dtype=np.float64).reshape(len(rows), len(names))
+    return {name: matrix[:, i] for i, name in enumerate(names)}
+
+
+def changed_result_ids(query_id, since):
+    """
+    Ids of the query's active results that may score differently than they
+    did at `since`: the row itself, its account's profile or its linked poll
+    result changed. Three index-backed lookups rather than one OR across joins.
+    """
+    results = QueryResults.objects.filter(query_id=query_id)
+    ids = set(results.filter(modified_at__gt=since).values_list("qres_id", flat=True))
+    ids.update(results.filter(
+        account__in=SourceAccount.objects.filter(modified_at__gt=since).values("account_id"),
+    ).values_list("qres_id", flat=True))
+    ids.update(results.filter(
+        poll_result__in=PollResult.all_objects.filter(poll__query_id=query_id, modified_at__gt=since)
+        .values("pr_id"),
+    ).values_list("qres_id", flat=True))
+    return sorted(ids)
+
+
+def _load_changed_features(query_id, since):
+    ids = changed_result_ids(query_id, since)
+    chunks = [
+        load_features(QueryResults.objects.filter(query_id=query_id, qres_id__in=ids[start:start + SCORING_CHUNK_SIZE]))
+        for start in range(0, len(ids), SCORING_CHUNK_SIZE)
+    ]
+    if not chunks:
+        return load_features(QueryResults.objects.none())
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+def _score_value(value):
+    return None if np.isnan(value) else Decimal(str(value)).quantize(SCORE_QUANTUM)
+
+
+def baseline_scorer(features):
+    """
+    Default scoring function: a logistic blend of reach (log followers),
+    verification and whether the account answered a poll. Accounts with no
+    profile and no answer are left unscored (NaN).
+    """
+    followers = np.nan_to_num(features["followers"], nan=0.0).clip(min=0)
+    reach = np.log1p(followers) / math.log1p(10_000_000)
+    verified = np.nan_to_num(features["verified"], nan=0.0)
+    z = -2.0 + 3.0 * reach + 0.5 * verified + 1.5 * features["answered"]
+    scores = 1.0 / (1.0 + np.exp(-z))
+    unknown = (features["has_profile"] == 0) & (features["answered"] == 0)
+    return np.where(unknown, np.nan, scores)
+
+
+def get_scorer(path=None):
+    """
+    The scoring function: any callable taking the load_features() dict and
+    returning one score per row (NaN for unscored), set by dotted path in
+    settings.FIRESCORE_SCORER.
+    """
+    return import_string(path or getattr(settings, "FIRESCORE_SCORER", DEFAULT_SCORER))
+
+
+def last_run(query_id):
+    return (
+        ScoringRun.objects.filter(query_id=query_id, status="succeeded")
+        .order_by("-watermark").only("watermark", "scorer").first()
+    )
+
+
+def score_query(query_id, scorer=None, incremental=False):
+    """
+    Recompute firescores for a query's active results in one vectorized pass
+    and write back the ones that changed. With incremental=True only rows
+    changed since the last successful run are loaded; all rows when there is
+    none yet or it used another scorer. Every call is recorded as a ScoringRun; returns
+        { "query": id, "run": id, "incremental": bool, "rows": n, "scored": n, "changed": n }
+    """
+    if not callable(scorer):
+        scorer = get_scorer(scorer)
+    scorer_name = f"{getattr(scorer, '__module__', '')}.{getattr(scorer, '__qualname__', type(scorer).__name__)}"
+
+    since = None
+    previous = last_run(query_id) if incremental else None
+    if previous is not None and previous.scorer == scorer_name[:255]:
+        since = previous.watermark - WATERMARK_OVERLAP
+    # Taken before reading anything, so whatever changes while we run is newer
+    started = timezone.now()
+    run = ScoringRun.objects.create(
+        query_id=query_id, scorer=scorer_name[:255],
+        incremental=since is not None, since=since, watermark=started, started_at=started,
+    )
+
+    try:
+        with transaction.atomic():
+            counts = _score(query_id, scorer, since)
+    except Exception as exc:
+        logger.exception("Scoring run %s for query %s failed.", run.pk, query_id)
+        ScoringRun.objects.filter(pk=run.pk).update(
+            status="failed", error=str(exc), finished_at=timezone.now(), modified_at=timezone.now()
+        )
+        raise
+
+    ScoringRun.objects.filter(pk=run.pk).update(
+        status="succeeded", rows_considered=counts["rows"], rows_scored=counts["scored"],
+        rows_changed=counts["changed"], finished_at=timezone.now(), modified_at=timezone.now(),
+    )
+    return {"query": query_id, "run": run.pk, "incremental": since is not None, **counts}
+
+
+def _score(query_id, scorer, since):
+    if since is None:
+        features = load_features(QueryResults.objects.filter(query_id=query_id))
+    else:
+        features = _load_changed_features(query_id, since)
+    rows = len(features["qres_id"])
+    if not rows:
+        return {"rows": 0, "scored": 0, "changed": 0}
+
+    scores = np.asarray(scorer(features), dtype=np.float64)
+    if scores.shape != (rows,):
+        raise ValueError(f"Scorer returned {scores.shape} scores for {rows} rows.")
+    # Same range and precision as the column; NaN stays NaN
+    scores = np.round(np.clip(scores, 0.0, 1.0), 3)
+
+    old = features["firescore"]
+    unchanged = np.isclose(old, scores, rtol=0, atol=1e-9) | (np.isnan(old) & np.isnan(scores))
+    changed = np.flatnonzero(~unchanged)
+
+    # Scores have three decimals, so there are at most a thousand distinct
+    # values: one UPDATE ... WHERE qres_id IN (...) per value and chunk is
+    # far cheaper than bulk_update()'s per-row CASE. modified_at is left
+    # alone on purpose, it marks data changes, not scoring.
+    ids = features["qres_id"][changed].astype(np.int64)
+    new_scores = scores[changed]
+    targets = QueryResults.objects.filter(query_id=query_id)
+    for value in np.unique(new_scores):
+        is_nan = np.isnan(value)
+        group = ids[np.isnan(new_scores)] if is_nan else ids[new_scores == value]
+        for start in range(0, len(group), SCORING_WRITE_BATCH_SIZE):
+            chunk = group[start:start + SCORING_WRITE_BATCH_SIZE].tolist()
+            targets.filter(qres_id__in=chunk).update(firescore=_score_value(value))
+        if is_nan:
+            break  # np.unique() puts every NaN last
+
+    # Fold only the changed scores into the aggregates, per platform
+    platforms = features["plt_id"][changed]
+    for plt_id in np.unique(platforms):
+        mask = platforms == plt_id
+        apply_firescore_delta(
+            query_id, int(plt_id),
+            removed=[_score_value(v) for v in old[changed][mask]],
+            added=[_score_value(v) for v in new_scores[mask]],
+        )
+    if len(changed):
+        bump_results_version([query_id])
+
+    return {
+        "rows": rows,
+        "scored": int(np.count_nonzero(~np.isnan(scores))),
+        "changed": len(changed),
+    }
@@ -1,9 +1,11 @@
 from rest_framework import serializers
-from .models import Campaign, Query, QueryResults
+from core.serializers import SparseFieldsMixin
+from .models import Campaign, Query, QueryResults, IngestJob
+from .services import sync_source_accounts
 from django.core.exceptions import ValidationError
 
 
-class CampaignSerializer(serializers.ModelSerializer):
+class CampaignSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Campaign
@@ -20,7 +22,22 @@ class CampaignSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         return Campaign.objects.create(user=user, **validated_data)
 
-class QuerySerializer(serializers.ModelSerializer):
+class CampaignOverviewSerializer(CampaignSerializer):
+    # Read from the annotations added by stats.annotate_campaign_overview()
+    query_count = serializers.IntegerField(read_only=True)
+    result_count = serializers.IntegerField(read_only=True)
+    avg_firescore = serializers.FloatField(read_only=True)
+    poll_count = serializers.IntegerField(read_only=True)
+    live_poll_count = serializers.IntegerField(read_only=True)
+    response_count = serializers.IntegerField(read_only=True)
+
+    class Meta(CampaignSerializer.Meta):
+        fields = CampaignSerializer.Meta.fields + [
+            "query_count", "result_count", "avg_firescore", "poll_count", "live_poll_count", "response_count",
+        ]
+
+
+class QuerySerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Query
@@ -54,18 +71,41 @@ class QuerySerializer(serializers.ModelSerializer):
         return Query.objects.create(**validated_data)
     
 
-class QueryResultSerializer(serializers.ModelSerializer):
+class QueryResultSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+
+    # Profiles are stored once per account on SourceAccount
+    user_data = serializers.JSONField(source="account.profile", required=False, allow_null=True)
 
     class Meta:
         model = QueryResults
         fields = ["qres_id", "query", "plt", "poll_result", "user_data",
                   "source_id", "firescore", "is_active"]
+
+    def _with_account(self, validated_data, instance=None):
+        profile = validated_data.pop("account", {}).get("profile")
+        plt = validated_data.get("plt", getattr(instance, "plt", None))
+        source_id = validated_data.get("source_id", getattr(instance, "source_id", None))
+        query = validated_data.get("query", getattr(instance, "query", None))
+        if plt is not None and query is not None and source_id:
+            owner_id = query.campaign.user_id
+            account_id = sync_source_accounts(owner_id, plt.pk, {source_id.strip(): profile})[source_id.strip()]
+            validated_data["account_id"] = account_id
+        return validated_data
+
+    def create(self, validated_data):
+        return super().create(self._with_account(validated_data))
+
+    def update(self, instance, validated_data):
+        instance = super().update(instance, self._with_account(validated_data, instance))
+        # The cached account may hold the profile from before the sync
+        instance.refresh_from_db(fields=["account"])
+        return instance
         
     
     def validate(self, data):
         query = data.get("query", getattr(self.instance, "query", None))
         plt = data.get("plt", getattr(self.instance, "plt", None))
-        pr = data.get("poll_result", getattr(self.instance, None))
+        pr = data.get("poll_result", getattr(self.instance, "poll_result", None))
 
         if query and plt and query.campaign.plt_id != plt.pk:
             raise serializers.ValidationError({"plt": "Platform must match the Campaign's Platform for this query"})
@@ -76,4 +116,15 @@ class QueryResultSerializer(serializers.ModelSerializer):
         
         return data
     
-    
\ No newline at end of file
+    
+
+class IngestJobSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+
+    progress = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = IngestJob
+        fields = ["job_id", "query", "plt", "status", "progress", "total_rows", "processed_rows",
+                  "created_rows", "updated_rows", "errors", "started_at", "finished_at",
+                  "created_at", "modified_at"]
+        read_only_fields = fields
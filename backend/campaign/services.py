@@ -0,0 +1,271 @@
+# campaign/services.py
+import hashlib
+import json
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from poll.models import Poll, PollResult
+
+from .models import Query, QueryResults, SourceAccount
+from .stats import SCORE_QUANTUM, apply_firescore_delta, bump_results_version
+
+# Rows per SELECT when looking up existing results, and per INSERT/UPDATE
+# statement when writing them back.
+LOOKUP_CHUNK_SIZE = 5000
+WRITE_BATCH_SIZE = 1000
+
+# Records per upsert batch for NDJSON ingestion, and how many bad lines we
+# report back before we stop collecting them.
+INGEST_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+
+def _chunks(seq, size):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def profile_hash(profile):
+    # Content hash of a profile, key order doesn't matter
+    if profile is None:
+        return ""
+    canonical = json.dumps(profile, sort_keys=True, separators=(",", ":"), ensure_ascii=False, cls=DjangoJSONEncoder)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def sync_source_accounts(user_id, plt_id, profiles):
+    """
+    Make sure user_id has a SourceAccount for every source_id in profiles
+    ({ source_id: profile or None }) and return { source_id: account_id }.
+    Only new accounts and profiles whose hash changed are written; a None
+    profile never overwrites what we already have.
+    """
+    now = timezone.now()
+    accounts, changed = {}, []
+    for chunk in _chunks(list(profiles), LOOKUP_CHUNK_SIZE):
+        rows = (
+            SourceAccount.objects
+            .filter(user_id=user_id, plt_id=plt_id, source_id__in=chunk)
+            .only("account_id", "source_id", "profile_hash")
+        )
+        for account in rows:
+            accounts[account.source_id] = account.pk
+            profile = profiles[account.source_id]
+            digest = profile_hash(profile)
+            if profile is not None and digest != account.profile_hash:
+                account.profile, account.profile_hash, account.modified_at = profile, digest, now
+                changed.append(account)
+
+    new = [
+        SourceAccount(user_id=user_id, plt_id=plt_id, source_id=source_id,
+                      profile=profile, profile_hash=profile_hash(profile))
+        for source_id, profile in profiles.items() if source_id not in accounts
+    ]
+    # A concurrent ingest may have just created some of these, take them over
+    # instead of failing. Without a profile there is nothing to take over with:
+    # the no-op update on source_id only gets the existing row's id back.
+    with_profile = [account for account in new if account.profile is not None]
+    without_profile = [account for account in new if account.profile is None]
+    for batch, update_fields in ((with_profile, ["profile", "profile_hash", "modified_at"]),
+                                 (without_profile, ["source_id"])):
+        if batch:
+            batch = SourceAccount.objects.bulk_create(
+                batch, batch_size=WRITE_BATCH_SIZE, update_conflicts=True,
+                unique_fields=["user", "plt", "source_id"], update_fields=update_fields,
+            )
+            accounts.update((account.source_id, account.pk) for account in batch)
+    if changed:
+        SourceAccount.objects.bulk_update(changed, ["profile", "profile_hash", "modified_at"],
+                                          batch_size=WRITE_BATCH_SIZE)
+    return accounts
+
+
+def _same_score(old, new):
+    if new is None or old is None:
+        return old is new
+    try:
+        return old == Decimal(str(new)).quantize(SCORE_QUANTUM)
+    except ArithmeticError:
+        return False
+
+
+def bulk_upsert_query_results(query_id, plt_id, items):
+    """
+    Set-based upsert of QueryResults keyed by (query, plt, source_id, is_active=True).
+
+    items: iterable of { "source_id": "...", "user_data": {...}, "firescore": 0.91 }
+    Returns (created, updated) with the same semantics as calling
+    update_or_create() once per item: blank source_ids are skipped and a
+    source_id repeated in the batch counts as one create followed by updates.
+    user_data goes to the query owner's SourceAccount of (plt, source_id); rows whose
+    account and firescore are unchanged are counted as updated but not rewritten.
+    """
+    created, updated = 0, 0
+
+    # Normalize and collapse duplicates, last one wins (like sequential update_or_create)
+    incoming = {}
+    for it in items:
+        source_id = (it.get("source_id") or "").strip()
+        if not source_id:
+            continue
+        user_data = it.get("user_data")
+        if source_id in incoming:
+            updated += 1
+            # As with sequential calls, a missing profile keeps the earlier one
+            if user_data is None:
+                user_data = incoming[source_id]["user_data"]
+        incoming[source_id] = {
+            "user_data": user_data,
+            "firescore": it.get("firescore"),
+        }
+
+    if not incoming:
+        return created, updated
+
+    owner_id = Query.objects.filter(pk=query_id).values_list("campaign__user_id", flat=True).first()
+
+    with transaction.atomic():
+        accounts = sync_source_accounts(
+            owner_id, plt_id, {source_id: values["user_data"] for source_id, values in incoming.items()}
+        )
+
+        # One chunked lookup for every row that already exists
+        existing = {}
+        source_ids = list(incoming)
+        for chunk in _chunks(source_ids, LOOKUP_CHUNK_SIZE):
+            rows = (
+                QueryResults.objects
+                .filter(query_id=query_id, plt_id=plt_id, source_id__in=chunk)
+                .only("qres_id", "source_id", "account_id", "firescore")
+            )
+            for obj in rows:
+                existing.setdefault(obj.source_id, obj)
+
+        now = timezone.now()
+        to_create, to_update, replaced_scores, new_scores = [], [], [], []
+        for source_id, values in incoming.items():
+            obj = existing.get(source_id)
+            if obj is None:
+                to_create.append(QueryResults(
+                    query_id=query_id, plt_id=plt_id, source_id=source_id,
+                    account_id=accounts[source_id], firescore=values["firescore"],
+                ))
+                new_scores.append(values["firescore"])
+                continue
+            updated += 1
+            if obj.account_id == accounts[source_id] and _same_score(obj.firescore, values["firescore"]):
+                continue
+            replaced_scores.append(obj.firescore)
+            new_scores.append(values["firescore"])
+            obj.account_id = accounts[source_id]
+            obj.firescore = values["firescore"]
+            # bulk_update() skips auto_now, so stamp it ourselves
+            obj.modified_at = now
+            to_update.append(obj)
+
+        if to_create:
+            QueryResults.objects.bulk_create(to_create, batch_size=WRITE_BATCH_SIZE)
+        if to_update:
+            QueryResults.objects.filter(query_id=query_id).bulk_update(
+                to_update, ["account", "firescore", "modified_at"], batch_size=WRITE_BATCH_SIZE
+            )
+
+        apply_firescore_delta(query_id, plt_id, removed=replaced_scores, added=new_scores)
+        bump_results_version([query_id])
+
+    created += len(to_create)
+    return created, updated
+
+
+def link_poll_results(query_id, poll_id=None):
+    """
+    Link the query's active, unlinked QueryResults to the poll results of the
+    same query whose user_identifier equals their source_id, in one
+    UPDATE ... FROM. Only polls of the query are joined, so the same-query
+    rule holds by construction. Returns
+        { "linked": n, "skipped": n, "ambiguous": n }
+    counted over results with at least one matching respondent: skipped ones
+    were already linked, ambiguous ones matched several respondents (across
+    the query's polls) and are left for a manual attach_poll_result.
+    """
+    qr_table = QueryResults._meta.db_table
+    poll_table = Poll._meta.db_table
+    pr_table = PollResult._meta.db_table
+
+    params = {"query_id": query_id, "poll_id": poll_id, "now": timezone.now()}
+    poll_filter = "AND p.poll_id = %(poll_id)s" if poll_id is not None else ""
+    sql = f"""
+        WITH matches AS (
+            SELECT qr.qres_id, qr.query_id, qr.poll_result_id AS current_id,
+                   MIN(pr.pr_id) AS pr_id, COUNT(*) AS n
+            FROM {qr_table} qr
+            JOIN {poll_table} p ON p.query_id = qr.query_id AND p.is_active
+            JOIN {pr_table} pr ON pr.poll_id = p.poll_id AND pr.is_active
+                              AND pr.user_identifier = qr.source_id
+            WHERE qr.query_id = %(query_id)s AND qr.is_active {poll_filter}
+            GROUP BY qr.qres_id, qr.query_id, qr.poll_result_id
+        ), linked AS (
+            UPDATE {qr_table} qr
+            SET poll_result_id = m.pr_id, modified_at = %(now)s
+            FROM matches m
+            WHERE qr.query_id = m.query_id AND qr.qres_id = m.qres_id
+              AND m.current_id IS NULL AND m.n = 1
+              -- Rechecked on the locked row: a concurrent attach may have linked it since
+              AND qr.poll_result_id IS NULL AND qr.is_active
+            RETURNING qr.plt_id
+        )
+        SELECT (SELECT COALESCE(json_object_agg(plt_id, n), '{{}}')::text
+                FROM (SELECT plt_id, COUNT(*) AS n FROM linked GROUP BY plt_id) per_platform),
+               COUNT(*) FILTER (WHERE current_id IS NOT NULL),
+               COUNT(*) FILTER (WHERE current_id IS NULL AND n > 1)
+        FROM matches
+    """
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            per_platform, skipped, ambiguous = cursor.fetchone()
+
+        linked = 0
+        for plt_id, count in json.loads(per_platform).items():
+            apply_firescore_delta(query_id, int(plt_id), linked=count)
+            linked += count
+        if linked:
+            bump_results_version([query_id])
+
+    return {"linked": linked, "skipped": skipped, "ambiguous": ambiguous}
+
+
+def iter_ndjson_batches(stream, batch_size, errors):
+    """
+    Read NDJSON records line by line from a binary stream and yield them in
+    lists of at most batch_size. Blank lines are ignored; malformed lines are
+    appended to errors as { "line": n, "error": "..." } and skipped.
+    """
+    batch = []
+    for lineno, raw in enumerate(iter(stream.readline, b""), start=1):
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError as exc:
+            record, error = None, f"Invalid JSON: {exc}"
+        else:
+            error = None if isinstance(record, dict) else "Each line must be a JSON object."
+
+        if error:
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"line": lineno, "error": error})
+            continue
+
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
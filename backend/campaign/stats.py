@@ -0,0 +1,275 @@
+# campaign/stats.py
+import math
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
+
+from poll.models import Poll, PollResult
+
+from .models import Campaign, FirescoreStats, Query, QueryResults, ResultsVersion
+
+# Fixed-width firescore histogram. Scores outside the range fall into the
+# first / last bucket so every scored row is counted exactly once.
+HISTOGRAM_MIN = 0.0
+HISTOGRAM_MAX = 1.0
+HISTOGRAM_BUCKETS = 20
+
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+
+SCORE_QUANTUM = Decimal("0.001")
+
+# First key of the transaction-level advisory lock guarding one query's
+# FirescoreStats: writers hold it shared while they fold in a delta, a rebuild
+# holds it exclusively from before its aggregate read until it has written.
+STATS_LOCK_NAMESPACE = 0x4653
+REBUILD_CHUNK_SIZE = 100
+
+
+def _bucket(score):
+    # Decimal arithmetic so bucket boundaries agree with the SQL rebuild
+    width = Decimal(str(HISTOGRAM_MAX - HISTOGRAM_MIN)) / HISTOGRAM_BUCKETS
+    index = int((score - Decimal(str(HISTOGRAM_MIN))) // width)
+    return min(max(index, 0), HISTOGRAM_BUCKETS - 1)
+
+
+def _bucket_edges():
+    width = (HISTOGRAM_MAX - HISTOGRAM_MIN) / HISTOGRAM_BUCKETS
+    return [round(HISTOGRAM_MIN + i * width, 6) for i in range(HISTOGRAM_BUCKETS + 1)]
+
+
+def _lock_stats(query_ids, shared):
+    # Ascending order so a rebuild and a writer touching two queries can't deadlock.
+    # The second key is an int4, ids past its range just share a lock.
+    if connection.vendor != "postgresql":
+        return
+    function = "pg_advisory_xact_lock_shared" if shared else "pg_advisory_xact_lock"
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT {function}(%s, (q %% 2147483647)::int)
+            FROM (SELECT DISTINCT q FROM unnest(%s::bigint[]) AS q ORDER BY q) ids
+        """, [STATS_LOCK_NAMESPACE, sorted(query_ids)])
+
+
+def apply_firescore_delta(query_id, plt_id, removed=(), added=(), linked=0):
+    """
+    Fold a change of active QueryResults into the (query, plt) aggregate row.
+
+    removed / added: firescores (None for unscored rows) of rows that stopped /
+    started counting, an update is one of each. linked: change in the number
+    of rows with a poll_result. Must run inside the writer's transaction.
+    """
+    removed, added = list(removed), list(added)
+    if not removed and not added and not linked:
+        return
+
+    _lock_stats([query_id], shared=True)
+    stats, _ = FirescoreStats.objects.select_for_update().get_or_create(query_id=query_id, plt_id=plt_id)
+    histogram = stats.histogram if len(stats.histogram) == HISTOGRAM_BUCKETS else [0] * HISTOGRAM_BUCKETS
+
+    stats.result_count = max(stats.result_count + len(added) - len(removed), 0)
+    stats.linked_count = max(stats.linked_count + linked, 0)
+
+    for sign, scores in ((-1, removed), (1, added)):
+        for score in scores:
+            if score is None:
+                continue
+            score = Decimal(str(score)).quantize(SCORE_QUANTUM)
+            stats.scored_count += sign
+            stats.score_sum += sign * score
+            stats.score_sq_sum += sign * float(score) ** 2
+            histogram[_bucket(score)] += sign
+
+    stats.scored_count = max(stats.scored_count, 0)
+    stats.histogram = [max(n, 0) for n in histogram]
+    stats.save()
+
+
+def bump_results_version(query_ids):
+    """
+    Bump the ResultsVersion of the owners of query_ids, creating it on first
+    use. Call it from the writer's transaction, after its last write, so the
+    row lock is held for as short as possible.
+    """
+    query_ids = sorted({int(query_id) for query_id in query_ids})
+    if not query_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {ResultsVersion._meta.db_table} (user_id, version)
+            SELECT DISTINCT c.user_id, 1
+            FROM {Query._meta.db_table} q
+            JOIN {Campaign._meta.db_table} c ON c.campaign_id = q.campaign_id
+            WHERE q.query_id = ANY(%s)
+            ORDER BY c.user_id
+            ON CONFLICT (user_id) DO UPDATE SET version = {ResultsVersion._meta.db_table}.version + 1
+        """, [query_ids])
+
+
+def rebuild_firescore_stats(query_ids=None):
+    """
+    Recompute the aggregates from QueryResults, all (query, plt) pairs or only
+    those of the given queries, one grouped query per chunk of queries.
+    Returns rows written. Each chunk is rebuilt in its own transaction under
+    the exclusive stats lock, so a concurrent writer's delta is either already
+    in what the rebuild reads or folded in on top of what it writes.
+    """
+    if query_ids is None:
+        query_ids = set(QueryResults.objects.order_by().values_list("query_id", flat=True).distinct())
+        query_ids.update(FirescoreStats.objects.values_list("query_id", flat=True))
+    query_ids = sorted({int(query_id) for query_id in query_ids})
+
+    written = 0
+    for i in range(0, len(query_ids), REBUILD_CHUNK_SIZE):
+        chunk = query_ids[i:i + REBUILD_CHUNK_SIZE]
+        with transaction.atomic():
+            _lock_stats(chunk, shared=False)
+            written += _rebuild_chunk(chunk)
+    return written
+
+
+def _rebuild_chunk(query_ids):
+    edges = _bucket_edges()
+    buckets = {}
+    for i in range(HISTOGRAM_BUCKETS):
+        cond = Q(firescore__isnull=False)
+        if i > 0:
+            cond &= Q(firescore__gte=edges[i])
+        if i < HISTOGRAM_BUCKETS - 1:
+            cond &= Q(firescore__lt=edges[i + 1])
+        buckets[f"b{i}"] = Count("qres_id", filter=cond)
+
+    rows = (
+        QueryResults.objects.filter(query_id__in=query_ids)
+        .values("query_id", "plt_id")
+        .annotate(
+            result_count=Count("qres_id"),
+            linked_count=Count("poll_result"),
+            scored_count=Count("firescore"),
+            score_sum=Sum("firescore"),
+            score_sq_sum=Sum(F("firescore") * F("firescore")),
+            **buckets,
+        )
+        .order_by()
+    )
+
+    written, seen = 0, set()
+    for row in rows:
+        seen.add((row["query_id"], row["plt_id"]))
+        FirescoreStats.objects.update_or_create(
+            query_id=row["query_id"], plt_id=row["plt_id"],
+            defaults={
+                "result_count": row["result_count"],
+                "linked_count": row["linked_count"],
+                "scored_count": row["scored_count"],
+                "score_sum": row["score_sum"] or 0,
+                "score_sq_sum": float(row["score_sq_sum"] or 0),
+                "histogram": [row[f"b{i}"] for i in range(HISTOGRAM_BUCKETS)],
+            },
+        )
+        written += 1
+
+    # Pairs whose rows are all gone
+    stale = FirescoreStats.objects.filter(query_id__in=query_ids)
+    for stats in stale.only("stats_id", "query_id", "plt_id"):
+        if (stats.query_id, stats.plt_id) not in seen:
+            stats.delete()
+
+    return written
+
+
+def _percentile(histogram, total, pct):
+    # Linear interpolation inside the bucket that holds the pct-th score
+    edges = _bucket_edges()
+    target = total * pct / 100
+    running = 0
+    for i, n in enumerate(histogram):
+        if n and running + n >= target:
+            return round(edges[i] + (edges[i + 1] - edges[i]) * (target - running) / n, 4)
+        running += n
+    return edges[-1]
+
+
+def summarize(stats_rows):
+    """
+    Combine FirescoreStats rows into the payload served by the API.
+    """
+    result_count = linked_count = scored_count = 0
+    score_sum, score_sq_sum = Decimal(0), 0.0
+    histogram = [0] * HISTOGRAM_BUCKETS
+
+    for stats in stats_rows:
+        result_count += stats.result_count
+        linked_count += stats.linked_count
+        scored_count += stats.scored_count
+        score_sum += stats.score_sum
+        score_sq_sum += stats.score_sq_sum
+        for i, n in enumerate(stats.histogram[:HISTOGRAM_BUCKETS]):
+            histogram[i] += n
+
+    mean = stddev = None
+    percentiles = {}
+    if scored_count:
+        mean = float(score_sum) / scored_count
+        stddev = math.sqrt(max(score_sq_sum / scored_count - mean ** 2, 0.0))
+        percentiles = {f"p{p}": _percentile(histogram, scored_count, p) for p in PERCENTILES}
+        mean, stddev = round(mean, 4), round(stddev, 4)
+
+    return {
+        "result_count": result_count,
+        "linked_count": linked_count,
+        "scored_count": scored_count,
+        "mean": mean,
+        "stddev": stddev,
+        "percentiles": percentiles,
+        "histogram": {"edges": _bucket_edges(), "counts": histogram},
+    }
+
+
+OVERVIEW_FIELDS = (
+    "query_count", "result_count", "avg_firescore", "poll_count", "live_poll_count", "response_count",
+)
+
+
+def _per_campaign(qs, campaign_path, **aggregate):
+    # Correlated aggregate subquery: one value per outer campaign row
+    (name, expression), = aggregate.items()
+    return Subquery(
+        qs.filter(**{campaign_path: OuterRef("pk")})
+        .order_by()
+        .values(campaign_path)
+        .annotate(**{name: expression})
+        .values(name)
+    )
+
+
+def annotate_campaign_overview(campaigns, now=None):
+    """
+    Annotate a Campaign queryset with the dashboard figures in OVERVIEW_FIELDS,
+    each a correlated subquery, so any number of campaigns costs one statement.
+    Result counts and the average firescore come from FirescoreStats rather
+    than from QueryResults itself. Only active queries, polls and responses count.
+    """
+    now = now or timezone.now()
+    stats = FirescoreStats.objects.filter(query__is_active=True)
+    polls = Poll.objects.filter(is_active=True, query__is_active=True)
+    responses = PollResult.objects.filter(poll__is_active=True, poll__query__is_active=True)
+
+    def count(qs, path, **extra):
+        return Coalesce(_per_campaign(qs.filter(**extra), path, n=Count("pk")), 0, output_field=IntegerField())
+
+    return campaigns.annotate(
+        query_count=count(Query.objects.all(), "campaign"),
+        result_count=Coalesce(
+            _per_campaign(stats, "query__campaign", n=Sum("result_count")), 0, output_field=IntegerField()
+        ),
+        avg_firescore=_per_campaign(
+            stats, "query__campaign",
+            avg=Cast(Sum("score_sum"), FloatField()) / NullIf(Cast(Sum("scored_count"), FloatField()), 0.0),
+        ),
+        poll_count=count(polls, "query__campaign"),
+        live_poll_count=count(polls, "query__campaign", starts_at__lte=now, ends_at__gte=now),
+        response_count=count(responses, "poll__query__campaign"),
+    )
@@ -0,0 +1,153 @@
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.db.models import F, Func, JSONField, Value
+from django.utils import timezone
+
+from .models import IngestJob, Query
+from .scoring import score_query
+from .services import INGEST_BATCH_SIZE, bulk_upsert_query_results, link_poll_results
+from .stats import rebuild_firescore_stats
+
+
+logger = logging.getLogger(__name__)
+
+# A running job touches modified_at after every batch; one that has been
+# quiet for this long lost its worker and is failed by reap_stale_ingest_jobs.
+INGEST_JOB_STALE_AFTER = timedelta(minutes=15)
+
+
+def _append_error(row, error):
+    # errors || [{row, error}] in the UPDATE itself, so nothing recorded earlier is lost
+    entry = Func(Value("row"), row, Value("error"), Value(error), function="jsonb_build_object")
+    return Func(
+        F("errors"), Func(entry, function="jsonb_build_array"),
+        template="(%(expressions)s)", arg_joiner=" || ", output_field=JSONField(),
+    )
+
+
+@shared_task
+def run_ingest_job(job_id):
+    """
+    Upsert the stored payload of an IngestJob batch by batch, recording progress
+    after every batch so the status endpoint can follow along. Stops if the
+    job was reaped as stale in the meantime.
+    """
+    # Claim the job atomically so a redelivered message can't run it twice
+    claimed = IngestJob.objects.filter(pk=job_id, status="pending").update(
+        status="running", started_at=timezone.now(), modified_at=timezone.now()
+    )
+    if not claimed:
+        logger.warning("IngestJob %s is missing or already picked up.", job_id)
+        return
+
+    job = IngestJob.objects.get(pk=job_id)
+    items = job.payload or []
+
+    processed, created, updated = 0, 0, 0
+    try:
+        for start in range(0, len(items), INGEST_BATCH_SIZE):
+            batch = items[start:start + INGEST_BATCH_SIZE]
+            b_created, b_updated = bulk_upsert_query_results(job.query_id, job.plt_id, batch)
+            processed += len(batch)
+            created += b_created
+            updated += b_updated
+            still_running = IngestJob.objects.filter(pk=job.pk, status="running").update(
+                processed_rows=processed, created_rows=created, updated_rows=updated,
+                modified_at=timezone.now(),
+            )
+            if not still_running:
+                logger.warning("IngestJob %s was failed as stale after %s rows, stopping.", job_id, processed)
+                return
+    except Exception as exc:
+        logger.exception("IngestJob %s failed after %s rows.", job_id, processed)
+        IngestJob.objects.filter(pk=job.pk, status="running").update(
+            status="failed", errors=_append_error(Value(processed), str(exc)),
+            finished_at=timezone.now(), modified_at=timezone.now(),
+        )
+        return
+
+    # The payload has served its purpose, don't keep a second copy of the data around
+    IngestJob.objects.filter(pk=job.pk, status="running").update(
+        status="succeeded", payload=None, finished_at=timezone.now(), modified_at=timezone.now()
+    )
+
+
+@shared_task
+def reap_stale_ingest_jobs():
+    """
+    Fail running IngestJobs whose worker died: no progress recorded for
+    INGEST_JOB_STALE_AFTER. Runs from beat.
+    """
+    now = timezone.now()
+    reaped = IngestJob.objects.filter(status="running", modified_at__lt=now - INGEST_JOB_STALE_AFTER).update(
+        status="failed",
+        errors=_append_error(F("processed_rows"), "Worker stopped reporting progress."),
+        finished_at=now, modified_at=now,
+    )
+    if reaped:
+        logger.warning("Failed %s stale ingest jobs.", reaped)
+    return reaped
+
+
+@shared_task
+def reconcile_firescore_stats(query_ids=None):
+    """
+    Rebuild FirescoreStats from QueryResults to correct any drift left by the
+    incremental updates. Runs periodically from beat for every query.
+    """
+    written = rebuild_firescore_stats(query_ids)
+    logger.info("Rebuilt %s firescore stats rows.", written)
+    return written
+
+
+@shared_task
+def auto_link_poll_results(query_id, poll_id=None):
+    """
+    Link a query's results to their respondents once a poll has collected its
+    answers, see services.link_poll_results.
+    """
+    counts = link_poll_results(query_id, poll_id)
+    logger.info("Linked poll results for query %s (poll %s): %s", query_id, poll_id, counts)
+    return counts
+
+
+@shared_task
+def score_query_results(query_id, incremental=False):
+    """
+    Recompute the firescores of one query's results, see scoring.score_query.
+    """
+    result = score_query(query_id, incremental=incremental)
+    logger.info("Scored query %s: %s", query_id, result)
+    return result
+
+
+@shared_task
+def score_campaign_results(campaign_id, incremental=False):
+    """
+    Recompute the firescores of every active query of a campaign, one query
+    (and one transaction) at a time.
+    """
+    query_ids = Query.objects.filter(campaign_id=campaign_id).values_list("query_id", flat=True)
+    results = [score_query(query_id, incremental=incremental) for query_id in query_ids]
+    logger.info("Scored %s queries of campaign %s.", len(results), campaign_id)
+    return results
+
+
+@shared_task
+def rescore_changed_results():
+    """
+    Nightly incremental re-scoring of every active query: each only reloads
+    the rows that changed since its last run.
+    """
+    query_ids = Query.objects.filter(campaign__is_active=True).values_list("query_id", flat=True)
+    changed = 0
+    for query_id in query_ids:
+        try:
+            changed += score_query(query_id, incremental=True)["changed"]
+        except Exception:
+            # Already logged and recorded on the failed ScoringRun, carry on with the rest
+            continue
+    logger.info("Incremental re-scoring of %s queries changed %s scores.", len(query_ids), changed)
+    return changed
@@ -1,3 +1,748 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+import pyarrow
+import pyarrow.parquet
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from accounts.models import FireMeUser
+from poll.models import Poll, PollResult
+from question_answers.models import Answer, Question
+from social.models import Platform
+
+from .models import Campaign, FirescoreStats, IngestJob, Query, QueryResults, ScoringRun, SourceAccount
+from .scoring import WATERMARK_OVERLAP, load_features, score_query
+from .services import bulk_upsert_query_results, link_poll_results, sync_source_accounts
+from .stats import rebuild_firescore_stats
+from .tasks import reap_stale_ingest_jobs, run_ingest_job
+from .views import QueryResultViewSet
+
+
+class MigrationTestCase(TransactionTestCase):
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def _apps(self, targets):
+        return MigrationExecutor(connection).loader.project_state(targets).apps
+
+    def _migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return self._apps(targets)
+
+    def _campaign(self, apps, username, plt):
+        user = apps.get_model("accounts", "FireMeUser").objects.create(
+            username=username, email=f"{username}@example.com", institution="x",
+        )
+        return apps.get_model("campaign", "Campaign").objects.create(user=user, plt=plt, name="c")
+
+
+class SourceAccountMigrationTests(MigrationTestCase):
+    """
+    0013_sourceaccount moves user_data onto accounts: two owners who saw the
+    same source keep their own profile.
+    """
+    migrate_from = [("campaign", "0012_queryresults_ud_followers_queryresults_ud_lang_and_more")]
+    migrate_to = [("campaign", "0013_sourceaccount")]
+
+    def setUp(self):
+        apps = self._migrate(self.migrate_from)
+        plt = apps.get_model("social", "Platform").objects.create(name="p")
+        QueryResults = apps.get_model("campaign", "QueryResults")
+        self.owners, self.users = {}, {}
+        for username, profiles in (("a", [{"v": 1}, {"v": 2}]), ("b", [{"v": 3}])):
+            campaign = self._campaign(apps, username, plt)
+            self.users[username] = campaign.user_id
+            for i, profile in enumerate(profiles):
+                query = apps.get_model("campaign", "Query").objects.create(campaign=campaign, search_term=f"t{i}")
+                obj = QueryResults.objects.create(query=query, plt=plt, source_id="s", user_data=profile)
+                self.owners[obj.pk] = campaign.user_id
+
+    def test_forwards_keeps_profiles_per_owner(self):
+        apps = self._migrate(self.migrate_to)
+
+        # Each owner's latest profile, the other owner's never replaces it
+        profiles = dict(apps.get_model("campaign", "SourceAccount").objects.values_list("user_id", "profile"))
+        self.assertEqual(profiles, {self.users["a"]: {"v": 2}, self.users["b"]: {"v": 3}})
+        accounts = dict(apps.get_model("campaign", "QueryResults").objects.values_list("pk", "account__user_id"))
+        self.assertEqual(accounts, self.owners)
+
+    def test_backwards_copies_each_owners_profile(self):
+        self._migrate(self.migrate_to)
+        apps = self._migrate(self.migrate_from)
+
+        QueryResults = apps.get_model("campaign", "QueryResults")
+        a, b = self.users["a"], self.users["b"]
+        self.assertCountEqual(
+            QueryResults.objects.values_list("query__campaign__user_id", "user_data"),
+            [(a, {"v": 2}), (a, {"v": 2}), (b, {"v": 3})],
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "Partitioning is PostgreSQL only.")
+class PartitionQueryResultsMigrationTests(MigrationTestCase):
+    """
+    0015_partition_queryresults rebuilds a populated table: rows, the id
+    sequence and the foreign keys have to survive both ways.
+    """
+    migrate_from = [("campaign", "0014_remove_queryresults_user_data")]
+    migrate_to = [("campaign", "0015_partition_queryresults")]
+    rows = 40
+
+    def setUp(self):
+        apps = self._migrate(self.migrate_from)
+
+        plt = apps.get_model("social", "Platform").objects.create(name="p")
+        campaign = self._campaign(apps, "owner", plt)
+        self.queries = [
+            apps.get_model("campaign", "Query").objects.create(campaign=campaign, search_term=f"t{i}")
+            for i in range(3)
+        ]
+        SourceAccount = apps.get_model("campaign", "SourceAccount")
+        QueryResults = apps.get_model("campaign", "QueryResults")
+        for i in range(self.rows):
+            account = SourceAccount.objects.create(
+                user_id=campaign.user_id, plt=plt, source_id=f"s{i}", profile={"n": i},
+            )
+            QueryResults.objects.create(
+                query=self.queries[i % 3], plt=plt, source_id=f"s{i}", account=account, firescore=i / 100,
+            )
+        self.plt_id, self.user_id = plt.pk, campaign.user_id
+        self.max_id = QueryResults.objects.order_by("-qres_id").values_list("qres_id", flat=True).first()
+
+    def _relkind(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'campaign_queryresults'::regclass")
+            return cursor.fetchone()[0]
+
+    def _foreign_keys(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT conname FROM pg_constraint "
+                "WHERE conrelid = 'campaign_queryresults'::regclass AND contype = 'f' ORDER BY conname"
+            )
+            return [name for (name,) in cursor.fetchall()]
+
+    def test_forwards_keeps_rows_sequence_and_foreign_keys(self):
+        foreign_keys = self._foreign_keys()
+        apps = self._migrate(self.migrate_to)
+        QueryResults = apps.get_model("campaign", "QueryResults")
+
+        self.assertEqual(self._relkind(), "p")
+        self.assertEqual(QueryResults.objects.count(), self.rows)
+        self.assertEqual(self._foreign_keys(), foreign_keys)
+        self.assertEqual(
+            sorted(QueryResults.objects.values_list("source_id", "account__source_id")),
+            sorted((f"s{i}", f"s{i}") for i in range(self.rows)),
+        )
+
+        # The ORM inserts through the new sequence, after every copied id
+        account = apps.get_model("campaign", "SourceAccount").objects.create(
+            user_id=self.user_id, plt_id=self.plt_id, source_id="new",
+        )
+        obj = QueryResults.objects.create(
+            query_id=self.queries[0].pk, plt_id=self.plt_id, source_id="new", account=account,
+        )
+        self.assertGreater(obj.pk, self.max_id)
+        obj.firescore = 0.5
+        obj.save()
+        self.assertEqual(QueryResults.objects.filter(query_id=self.queries[0].pk, pk=obj.pk).get().firescore, 0.5)
+        self.assertEqual(QueryResults.objects.filter(source_id="s1").update(firescore=0.9), 1)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            QueryResults.objects.create(query_id=10 ** 9, plt_id=self.plt_id, source_id="orphan", account=account)
+
+    def test_backwards_restores_plain_table(self):
+        self._migrate(self.migrate_to)
+        apps = self._migrate(self.migrate_from)
+        QueryResults = apps.get_model("campaign", "QueryResults")
+
+        self.assertEqual(self._relkind(), "r")
+        self.assertEqual(QueryResults.objects.count(), self.rows)
+        account = apps.get_model("campaign", "SourceAccount").objects.create(
+            user_id=self.user_id, plt_id=self.plt_id, source_id="back",
+        )
+        obj = QueryResults.objects.create(
+            query_id=self.queries[1].pk, plt_id=self.plt_id, source_id="back", account=account,
+        )
+        self.assertGreater(obj.pk, self.max_id)
+
+
+class CampaignTestCase(TestCase):
+
+    def setUp(self):
+        self.user = FireMeUser.objects.create_user(username="owner", email="owner@example.com", password="x")
+        self.plt = Platform.objects.create(name="p")
+        self.campaign = Campaign.objects.create(user=self.user, plt=self.plt, name="c")
+        self.query = Query.objects.create(campaign=self.campaign, search_term="t")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upsert(self, items, query=None):
+        return bulk_upsert_query_results((query or self.query).pk, self.plt.pk, items)
+
+
+class SourceAccountTests(CampaignTestCase):
+
+    def test_accounts_are_per_owner(self):
+        other = FireMeUser.objects.create_user(username="other", email="other@example.com", password="x")
+        other_query = Query.objects.create(
+            campaign=Campaign.objects.create(user=other, plt=self.plt, name="c"), search_term="t",
+        )
+        self.upsert([{"source_id": "a", "user_data": {"lang": "en"}}])
+        self.upsert([{"source_id": "a", "user_data": {"lang": "fr"}}], query=other_query)
+
+        self.assertEqual(SourceAccount.objects.get(user=self.user, source_id="a").profile, {"lang": "en"})
+        self.assertEqual(SourceAccount.objects.get(user=other, source_id="a").profile, {"lang": "fr"})
+
+    def test_none_profile_keeps_existing(self):
+        self.upsert([{"source_id": "a", "user_data": {"lang": "en"}}])
+        account_id = SourceAccount.objects.get(source_id="a").pk
+
+        self.upsert([{"source_id": "a"}])
+        self.assertEqual(SourceAccount.objects.get(pk=account_id).profile, {"lang": "en"})
+
+        # New accounts without a profile go through the conflict path on their own
+        accounts = sync_source_accounts(self.user.pk, self.plt.pk, {"a": None, "b": None})
+        self.assertEqual(accounts["a"], account_id)
+        self.assertEqual(SourceAccount.objects.get(pk=account_id).profile, {"lang": "en"})
+        self.assertIsNone(SourceAccount.objects.get(pk=accounts["b"]).profile)
+
+    def test_none_profile_later_in_batch_keeps_earlier(self):
+        self.upsert([{"source_id": "a", "user_data": {"lang": "en"}}, {"source_id": "a", "firescore": 0.5}])
+
+        self.assertEqual(SourceAccount.objects.get(source_id="a").profile, {"lang": "en"})
+
+
+class BulkUpsertTests(CampaignTestCase):
+
+    def test_counts_like_update_or_create(self):
+        items = [{"source_id": "a"}, {"source_id": " "}, {"source_id": "b", "firescore": 0.5}, {"source_id": "a"}]
+
+        self.assertEqual(self.upsert(items), (2, 1))
+        self.assertEqual(self.upsert([{"source_id": "b", "firescore": 0.7}, {"source_id": "c"}]), (1, 1))
+        self.assertEqual(
+            dict(QueryResults.objects.values_list("source_id", "firescore")),
+            {"a": None, "b": Decimal("0.7"), "c": None},
+        )
+
+    def test_unchanged_rows_are_not_rewritten(self):
+        self.upsert([{"source_id": "a", "firescore": 0.5, "user_data": {"n": 1}}])
+        long_ago = timezone.now() - timedelta(days=1)
+        QueryResults.objects.update(modified_at=long_ago)
+
+        self.assertEqual(self.upsert([{"source_id": "a", "firescore": 0.5, "user_data": {"n": 1}}]), (0, 1))
+        self.assertEqual(QueryResults.objects.get().modified_at, long_ago)
+
+
+class IngestTests(CampaignTestCase):
+
+    def url(self):
+        return f"/api/query-results/ingest/?query={self.query.pk}&plt={self.plt.pk}"
+
+    def test_reports_per_batch_and_bad_lines(self):
+        body = b'{"source_id": "a", "user_data": {"n": 1}}\n\n{broken\n[1]\n{"source_id": "b"}\n{"source_id": "a"}\n'
+
+        response = self.client.post(self.url(), body, content_type="application/x-ndjson")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["created"], response.data["updated"]), (2, 1))
+        self.assertEqual([error["line"] for error in response.data["errors"]], [3, 4])
+        self.assertEqual(response.data["batches"], [{"batch": 1, "rows": 3, "created": 2, "updated": 1, "skipped": 0}])
+        self.assertEqual(SourceAccount.objects.get(source_id="a").profile, {"n": 1})
+
+    def test_refuses_unreadable_chunked_body(self):
+        body = b'{"source_id": "a"}\n'
+        request = APIRequestFactory().post(self.url(), body, content_type="application/x-ndjson")
+        del request.META["CONTENT_LENGTH"]
+        request.META["wsgi.input"] = io.BytesIO(body)
+        force_authenticate(request, self.user)
+
+        response = QueryResultViewSet.as_view({"post": "ingest"})(request)
+
+        self.assertEqual(response.status_code, 411)
+        self.assertFalse(QueryResults.objects.exists())
+
+
+class IngestJobTests(CampaignTestCase):
+
+    def job(self, **fields):
+        return IngestJob.objects.create(user=self.user, query=self.query, plt=self.plt, **fields)
+
+    def test_failure_is_appended_to_errors(self):
+        job = self.job(payload=[{"source_id": "a", "firescore": "abc"}], errors=[{"row": 0, "error": "earlier"}])
+
+        with self.assertLogs("campaign.tasks", "ERROR"):
+            run_ingest_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual([error["row"] for error in job.errors], [0, 0])
+        self.assertEqual(job.errors[0]["error"], "earlier")
+
+    def test_stale_running_jobs_are_failed(self):
+        stale = self.job(status="running", processed_rows=1000, payload=[])
+        fresh = self.job(status="running", payload=[])
+        IngestJob.objects.filter(pk=stale.pk).update(modified_at=timezone.now() - timedelta(hours=1))
+
+        with self.assertLogs("campaign.tasks", "WARNING"):
+            self.assertEqual(reap_stale_ingest_jobs(), 1)
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, "failed")
+        self.assertEqual(stale.errors, [{"row": 1000, "error": "Worker stopped reporting progress."}])
+        self.assertEqual(IngestJob.objects.get(pk=fresh.pk).status, "running")
+
+    def test_worker_stops_once_its_job_was_reaped(self):
+        job = self.job(payload=[{"source_id": "a"}, {"source_id": "b"}])
+
+        def reaped_meanwhile(query_id, plt_id, batch):
+            IngestJob.objects.filter(pk=job.pk).update(status="failed")
+            return 1, 0
+
+        with mock.patch("campaign.tasks.INGEST_BATCH_SIZE", 1), \
+                mock.patch("campaign.tasks.bulk_upsert_query_results", side_effect=reaped_meanwhile) as upsert, \
+                self.assertLogs("campaign.tasks", "WARNING"):
+            run_ingest_job(job.pk)
+
+        self.assertEqual(upsert.call_count, 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_rows), ("failed", 0))
+
+
+class QueryResultListTests(CampaignTestCase):
+    url = "/api/query-results/"
+
+    def test_etag_follows_writes(self):
+        self.upsert([{"source_id": f"s{i}", "user_data": {"n": i}} for i in range(5)])
+        params = {"query": self.query.pk}
+        etag = self.client.get(self.url, params)["ETag"]
+        self.assertEqual(self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        for write in (
+            lambda: self.upsert([{"source_id": "s1", "user_data": {"n": 10}}]),
+            lambda: score_query(self.query.pk),
+            lambda: self.client.delete(f"{self.url}{QueryResults.objects.first().pk}/"),
+        ):
+            write()
+            response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            etag = response["ETag"]
+
+    def test_keyset_pages_cover_every_row_once(self):
+        self.upsert([{"source_id": f"s{i}"} for i in range(25)])
+        # Rows sharing created_at are told apart by pk
+        QueryResults.objects.filter(query=self.query).update(created_at=timezone.now())
+
+        seen, url = [], f"{self.url}?query={self.query.pk}&page_size=10"
+        while url:
+            page = self.client.get(url).data
+            seen.extend(row["qres_id"] for row in page["results"])
+            url = page["next"]
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(sorted(seen, reverse=True), seen)
+        self.assertEqual(set(seen), set(QueryResults.objects.values_list("qres_id", flat=True)))
+
+    def test_sparse_page_builds_links_without_extra_queries(self):
+        self.upsert([{"source_id": f"s{i}"} for i in range(30)])
+        url = f"{self.url}?query={self.query.pk}&fields=source_id&page_size=10"
+
+        # The results version and the page itself, created_at comes with the page
+        for _ in range(2):
+            with self.assertNumQueries(2):
+                page = self.client.get(url).data
+            url = page["next"]
+        self.assertIsNotNone(page["previous"])
+        self.assertEqual(list(page["results"][0]), ["source_id"])
+
+
+class FirescoreStatsTests(CampaignTestCase):
+
+    def stats(self):
+        return list(FirescoreStats.objects.filter(query=self.query).values(
+            "plt_id", "result_count", "linked_count", "scored_count", "score_sum", "score_sq_sum", "histogram",
+        ))
+
+    def test_write_deltas_match_a_rebuild(self):
+        self.upsert([{"source_id": f"s{i}", "firescore": i / 10} for i in range(6)] + [{"source_id": "x"}])
+        rows = dict(QueryResults.objects.values_list("source_id", "qres_id"))
+        self.upsert([{"source_id": "s1", "firescore": 0.95}])
+        self.client.patch(f"/api/query-results/{rows['s2']}/", {"firescore": 0.25}, format="json")
+        self.client.delete(f"/api/query-results/{rows['s3']}/")
+        self.client.post("/api/query-results/", {
+            "query": self.query.pk, "plt": self.plt.pk, "source_id": "y", "firescore": 0.5,
+        }, format="json")
+
+        incremental = self.stats()
+        self.assertEqual(incremental[0]["result_count"], 7)
+        rebuild_firescore_stats([self.query.pk])
+        rebuilt = self.stats()
+        # Summed in a different order, the float sum of squares may differ in its last bits
+        self.assertAlmostEqual(rebuilt[0].pop("score_sq_sum"), incremental[0].pop("score_sq_sum"))
+        self.assertEqual(rebuilt, incremental)
+
+        response = self.client.get(f"/api/queries/{self.query.pk}/firescore_stats/")
+        self.assertEqual((response.data["result_count"], response.data["scored_count"]), (7, 6))
+
+
+@skipUnless(connection.vendor == "postgresql", "Uses PostgreSQL advisory locks.")
+class FirescoreStatsRebuildRaceTests(TransactionTestCase):
+
+    def test_delta_during_rebuild_is_kept(self):
+        user = FireMeUser.objects.create_user(username="owner", email="owner@example.com", password="x")
+        plt = Platform.objects.create(name="p")
+        query = Query.objects.create(campaign=Campaign.objects.create(user=user, plt=plt, name="c"), search_term="t")
+        bulk_upsert_query_results(query.pk, plt.pk, [{"source_id": f"s{i}"} for i in range(3)])
+
+        # Hold the rebuild between its aggregate read and its write
+        read, resume = threading.Event(), threading.Event()
+        update_or_create = FirescoreStats.objects.update_or_create
+
+        def paused(*args, **kwargs):
+            read.set()
+            resume.wait(10)
+            return update_or_create(*args, **kwargs)
+
+        def run(target, *args):
+            try:
+                target(*args)
+            finally:
+                connections.close_all()
+
+        with mock.patch.object(FirescoreStats.objects, "update_or_create", side_effect=paused):
+            rebuild = threading.Thread(target=run, args=(rebuild_firescore_stats, [query.pk]))
+            rebuild.start()
+            self.assertTrue(read.wait(10))
+            writer = threading.Thread(target=run, args=(
+                bulk_upsert_query_results, query.pk, plt.pk, [{"source_id": "new1"}, {"source_id": "new2"}],
+            ))
+            writer.start()
+            writer.join(0.5)
+            # The writer waits for the rebuild instead of landing its delta underneath it
+            self.assertTrue(writer.is_alive())
+            resume.set()
+            rebuild.join(10)
+            writer.join(10)
+
+        self.assertEqual(FirescoreStats.objects.get(query=query).result_count, 5)
+
+
+class TopTests(CampaignTestCase):
+    url = "/api/query-results/top/"
+
+    def test_ranks_highest_first_with_shared_ties(self):
+        self.upsert([{"source_id": s, "firescore": f} for s, f in (("a", 0.2), ("b", 0.9), ("c", 0.9), ("d", None))])
+
+        response = self.client.get(self.url, {"query": self.query.pk, "k": 3})
+
+        ranked = [(row["source_id"], row["rank"]) for row in response.data]
+        self.assertCountEqual(ranked[:2], [("b", 1), ("c", 1)])
+        self.assertEqual(ranked[2], ("a", 3))
+
+    def test_applies_user_data_filters_before_picking(self):
+        self.upsert([
+            {"source_id": f"s{i}", "firescore": i / 100, "user_data": {"lang": "en" if i % 10 == 0 else "fr"}}
+            for i in range(100)
+        ])
+
+        response = self.client.get(self.url, {"query": self.query.pk, "k": 3, "ud.lang": "en"})
+
+        self.assertEqual([row["source_id"] for row in response.data], ["s90", "s80", "s70"])
+        self.assertEqual([row["rank"] for row in response.data], [1, 2, 3])
+
+    def test_rejects_non_numeric_ids(self):
+        for params in ({"query": "x"}, {"campaign": "x"}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+class UserDataFilterTests(CampaignTestCase):
+    url = "/api/query-results/"
+
+    def setUp(self):
+        super().setUp()
+        self.upsert([
+            {"source_id": "a", "user_data": {"lang": "en", "followers": 10, "verified": True, "geo": {"city": "x"}}},
+            {"source_id": "b", "user_data": {"lang": "fr", "followers": 5000}},
+            {"source_id": "c", "user_data": {"lang": "de", "followers": "many"}},
+            {"source_id": "d"},
+        ])
+
+    def matches(self, **params):
+        response = self.client.get(self.url, {"query": self.query.pk, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return sorted(row["source_id"] for row in response.data["results"])
+
+    def test_filters(self):
+        self.assertEqual(self.matches(**{"ud.lang": "en"}), ["a"])
+        self.assertEqual(self.matches(**{"ud.lang__in": "en,de"}), ["a", "c"])
+        self.assertEqual(self.matches(**{"ud.followers": "5000"}), ["b"])
+        self.assertEqual(self.matches(**{"ud.followers__in": "10,5000"}), ["a", "b"])
+        self.assertEqual(self.matches(**{"ud.followers__gte": "100"}), ["b"])
+        self.assertEqual(self.matches(**{"ud.verified": "true"}), ["a"])
+        self.assertEqual(self.matches(**{"ud.geo.city": "x"}), ["a"])
+        self.assertEqual(self.matches(**{"ud.geo__exists": "false"}), ["b", "c", "d"])
+        self.assertEqual(self.matches(user_data='{"lang": "fr"}'), ["b"])
+
+    def test_bad_values_are_400(self):
+        for name, value in (
+            ("ud.followers", "abc"), ("ud.followers__in", "a,b"), ("ud.followers__gt", "abc"),
+            ("ud.lang__like", "x"), ("user_data", "[1]"),
+        ):
+            response = self.client.get(self.url, {"query": self.query.pk, name: value})
+            self.assertEqual(response.status_code, 400, name)
+            self.assertIn(name, response.data)
+
+
+class ExportTests(CampaignTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.upsert([
+            {"source_id": "a", "firescore": 0.5, "user_data": {"lang": "en", "followers": 10}},
+            {"source_id": "b", "user_data": {"lang": "fr"}},
+        ])
+        self.url = f"/api/queries/{self.query.pk}/export/"
+
+    def export(self, fmt):
+        response = self.client.get(self.url, {"format": fmt, "user_data_keys": "lang,followers"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Disposition"], f'attachment; filename="query-{self.query.pk}.{fmt}"')
+        return b"".join(response.streaming_content)
+
+    def test_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.export("csv").decode("utf-8"))))
+
+        self.assertEqual([(row["source_id"], row["user_data.lang"]) for row in rows], [("a", "en"), ("b", "fr")])
+        self.assertEqual((rows[0]["firescore"], rows[0]["user_data.followers"]), ("0.500", "10"))
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export("ndjson").splitlines()]
+
+        self.assertEqual([row["source_id"] for row in rows], ["a", "b"])
+        self.assertEqual((rows[0]["user_data.lang"], rows[0]["user_data.followers"]), ("en", 10))
+        self.assertIsNone(rows[1]["user_data.followers"])
+
+    def test_parquet(self):
+        table = pyarrow.parquet.read_table(pyarrow.BufferReader(self.export("parquet")))
+
+        self.assertEqual(table.column("source_id").to_pylist(), ["a", "b"])
+        self.assertEqual(table.column("user_data.lang").to_pylist(), ["en", "fr"])
+
+    def test_unknown_format_is_refused(self):
+        # DRF's format negotiation turns it away before the view runs
+        self.assertEqual(self.client.get(self.url, {"format": "xml"}).status_code, 404)
+
+
+class SparseFieldsTests(CampaignTestCase):
+    url = "/api/query-results/"
+
+    def setUp(self):
+        super().setUp()
+        self.upsert([{"source_id": "a", "firescore": 0.5, "user_data": {"lang": "en"}}])
+
+    def get(self, **params):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.url, {"query": self.query.pk, **params})
+        self.assertEqual(response.status_code, 200)
+        page_sql = next(q["sql"] for q in captured if "campaign_queryresults" in q["sql"])
+        return response.data["results"][0], page_sql
+
+    def test_fields_and_exclude(self):
+        row, _ = self.get()
+        self.assertEqual(row["user_data"], {"lang": "en"})
+
+        row, sql = self.get(fields="qres_id,firescore")
+        self.assertEqual(list(row), ["qres_id", "firescore"])
+        # Neither the account join nor its profile column are read
+        self.assertNotIn("campaign_sourceaccount", sql)
+        self.assertNotIn('"source_id"', sql)
+
+        row, sql = self.get(exclude="user_data")
+        self.assertNotIn("user_data", row)
+        self.assertNotIn("campaign_sourceaccount", sql)
+
+
+class QueryResultsReferenceTests(TestCase):
+
+    def test_nothing_has_a_foreign_key_to_query_results(self):
+        # The partitioned table's primary key is (qres_id, query_id), see QueryResults
+        referencing = [
+            f"{model._meta.label}.{field.name}"
+            for model in global_apps.get_models()
+            for field in model._meta.get_fields()
+            if field.concrete and field.is_relation and field.related_model is QueryResults
+        ]
+        self.assertEqual(referencing, [])
+
+
+class LinkPollResultsTests(CampaignTestCase):
+
+    def test_links_single_matches_only(self):
+        self.upsert([{"source_id": s} for s in ("alice", "bob", "carol")])
+        question = Question.objects.create(user=self.user, question="q")
+        answer = Answer.objects.create(question=question, answer="a")
+        now = timezone.now()
+        polls = [
+            Poll.objects.create(query=self.query, question=question, starts_at=now, ends_at=now + timedelta(hours=1))
+            for _ in range(2)
+        ]
+        alice = PollResult.objects.create(poll=polls[0], answer=answer, user_identifier="alice")
+        for poll in polls:
+            PollResult.objects.create(poll=poll, answer=answer, user_identifier="bob")
+
+        self.assertEqual(link_poll_results(self.query.pk), {"linked": 1, "skipped": 0, "ambiguous": 1})
+        self.assertEqual(QueryResults.objects.get(source_id="alice").poll_result_id, alice.pk)
+        self.assertIsNone(QueryResults.objects.get(source_id="bob").poll_result_id)
+        self.assertEqual(FirescoreStats.objects.get(query=self.query).linked_count, 1)
+
+        self.assertEqual(link_poll_results(self.query.pk), {"linked": 0, "skipped": 1, "ambiguous": 1})
+
+
+def constant_scorer(features):
+    return np.full(len(features["qres_id"]), 0.5)
+
+
+def misshapen_scorer(features):
+    return np.zeros(len(features["qres_id"]) + 1)
+
+
+class ScoringTests(CampaignTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.upsert([
+            {"source_id": "big", "user_data": {"followers": 1_000_000, "verified": True}},
+            {"source_id": "small", "user_data": {"followers": 10, "verified": "yes"}},
+            {"source_id": "unknown"},
+        ])
+
+    def scores(self):
+        return dict(QueryResults.objects.values_list("source_id", "firescore"))
+
+    def test_load_features(self):
+        features = load_features(QueryResults.objects.order_by("qres_id"))
+
+        self.assertEqual(features["followers"][:2].tolist(), [1_000_000.0, 10.0])
+        # Non-numbers and missing keys come through as NaN
+        self.assertEqual(features["verified"][0], 1.0)
+        self.assertTrue(np.isnan(features["verified"][1]))
+        self.assertEqual(features["has_profile"].tolist(), [1.0, 1.0, 0.0])
+
+    def test_baseline_scores_and_writes_only_changes(self):
+        result = score_query(self.query.pk)
+
+        self.assertEqual((result["rows"], result["scored"], result["changed"]), (3, 2, 2))
+        scores = self.scores()
+        self.assertGreater(scores["big"], scores["small"])
+        self.assertIsNone(scores["unknown"])
+        self.assertEqual(FirescoreStats.objects.get(query=self.query).scored_count, 2)
+        self.assertEqual(score_query(self.query.pk)["changed"], 0)
+
+    def test_scorer_by_dotted_path(self):
+        score_query(self.query.pk, scorer="campaign.tests.constant_scorer")
+
+        self.assertEqual(set(self.scores().values()), {Decimal("0.5")})
+        self.assertEqual(ScoringRun.objects.get().scorer, "campaign.tests.constant_scorer")
+
+    def test_failed_run_is_recorded(self):
+        with self.assertRaises(ValueError), self.assertLogs("campaign.scoring", "ERROR"):
+            score_query(self.query.pk, scorer=misshapen_scorer)
+
+        run = ScoringRun.objects.get()
+        self.assertEqual(run.status, "failed")
+        self.assertEqual(run.error, "Scorer returned (4,) scores for 3 rows.")
+        self.assertEqual(set(self.scores().values()), {None})
+
+
+class IncrementalScoringTests(CampaignTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.upsert([{"source_id": f"s{i}", "user_data": {"followers": 10 ** i}} for i in range(4)])
+        score_query(self.query.pk)
+        # Put the first run and the data it saw well outside the overlap window
+        hour_ago = timezone.now() - timedelta(hours=1)
+        ScoringRun.objects.update(watermark=hour_ago)
+        QueryResults.objects.update(modified_at=hour_ago - timedelta(hours=1))
+        SourceAccount.objects.update(modified_at=hour_ago - timedelta(hours=1))
+
+    def test_only_changed_rows_are_loaded(self):
+        self.assertEqual(score_query(self.query.pk, incremental=True)["rows"], 0)
+
+        # A profile change (through the account) and a row change
+        self.upsert([{"source_id": "s0", "user_data": {"followers": 10 ** 7}}])
+        QueryResults.objects.filter(source_id="s1").update(modified_at=timezone.now())
+        result = score_query(self.query.pk, incremental=True)
+
+        self.assertTrue(result["incremental"])
+        self.assertEqual((result["rows"], result["changed"]), (2, 1))
+        previous, run = ScoringRun.objects.order_by("run_id")[1:]
+        self.assertEqual(run.since, previous.watermark - WATERMARK_OVERLAP)
+
+    def test_other_scorer_starts_over(self):
+        result = score_query(self.query.pk, scorer="campaign.tests.constant_scorer", incremental=True)
+
+        self.assertFalse(result["incremental"])
+        self.assertEqual(result["rows"], 4)
+        # The next run with that scorer picks up from its watermark
+        again = score_query(self.query.pk, scorer="campaign.tests.constant_scorer", incremental=True)
+        self.assertEqual((again["incremental"], again["rows"]), (True, 0))
+
+
+class CampaignOverviewTests(CampaignTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.upsert([{"source_id": "a", "firescore": 0.2}, {"source_id": "b", "firescore": 0.6}, {"source_id": "c"}])
+        other = Query.objects.create(campaign=self.campaign, search_term="u")
+        self.upsert([{"source_id": "a", "firescore": 0.4}], query=other)
+        # A deleted query's results and polls no longer count
+        deleted = Query.objects.create(campaign=self.campaign, search_term="gone")
+        self.upsert([{"source_id": "z", "firescore": 1.0}], query=deleted)
+
+        question = Question.objects.create(user=self.user, question="q")
+        answer = Answer.objects.create(question=question, answer="a")
+        now = timezone.now()
+        live = Poll.objects.create(query=self.query, question=question,
+                                   starts_at=now - timedelta(hours=1), ends_at=now + timedelta(hours=1))
+        Poll.objects.create(query=other, question=question,
+                            starts_at=now - timedelta(days=2), ends_at=now - timedelta(days=1))
+        Poll.objects.create(query=deleted, question=question, starts_at=now, ends_at=now + timedelta(hours=1))
+        for user_identifier in ("a", "b"):
+            PollResult.objects.create(poll=live, answer=answer, user_identifier=user_identifier)
+        deleted.delete()
+
+    def test_overview_in_one_statement(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/api/campaigns/{self.campaign.pk}/overview/")
+
+        data = dict(response.data)
+        self.assertAlmostEqual(data.pop("avg_firescore"), 0.4)
+        self.assertEqual(data, {
+            "campaign_id": self.campaign.pk, "query_count": 2, "result_count": 4,
+            "poll_count": 2, "live_poll_count": 1, "response_count": 2,
+        })
+
+    def test_list_with_stats(self):
+        response = self.client.get("/api/campaigns/", {"with_stats": "1"})
+
+        self.assertEqual([(row["query_count"], row["result_count"]) for row in response.data], [(2, 4)])
+        self.assertNotIn("query_count", self.client.get("/api/campaigns/").data[0])
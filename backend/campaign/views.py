@@ -1,28 +1,90 @@
-from django.db.models import Q
+from decimal import Decimal
+from django.db.models import Q, F, Window
+from django.db.models.functions import Rank
 from django.db import transaction
 from .permissions import IsOwnerOrReadOnly
+from .filters import filter_user_data
+from .export import (
+    EXPORT_COLUMNS, EXPORT_FORMATS, CSVExportRenderer, NDJSONExportRenderer, ParquetExportRenderer,
+    iter_export_rows, stream_csv, stream_ndjson, stream_parquet,
+)
+from core.pagination import KeysetPagination
+from core.mixins import ConditionalGetMixin, SparseFieldsViewMixin, TrigramSearchMixin
+from .stats import (
+    OVERVIEW_FIELDS, annotate_campaign_overview, apply_firescore_delta, bump_results_version, summarize,
+)
+from .services import INGEST_BATCH_SIZE, bulk_upsert_query_results, iter_ndjson_batches, link_poll_results
 from poll.models import PollResult
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import Campaign, Query, QueryResults
+from rest_framework.renderers import JSONRenderer
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from .models import Campaign, Query, QueryResults, IngestJob, FirescoreStats, ResultsVersion
+from .tasks import auto_link_poll_results, run_ingest_job
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import render, get_object_or_404
-from .serializers import CampaignSerializer, QuerySerializer, QueryResultSerializer
+from .serializers import (
+    CampaignSerializer, CampaignOverviewSerializer, QuerySerializer, QueryResultSerializer, IngestJobSerializer,
+)
 
 # Create your views here.
 
-class CampaignViewSet(viewsets.ModelViewSet):
+TOP_K_DEFAULT = 10
+TOP_K_MAX = 1000
+
+
+def _is_truthy(value):
+    return str(value).strip().lower() in ("1", "true", "yes")
+
+
+class CampaignViewSet(ConditionalGetMixin, TrigramSearchMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
 
     serializer_class = CampaignSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    always_load_fields = ("user",)
+    search_field = "name"
+    search_limited = True
 
     def get_queryset(self):
-        return Campaign.objects.filter(user = self.request.user)
+        qs = Campaign.objects.filter(user = self.request.user)
+        if self._with_stats():
+            qs = annotate_campaign_overview(qs)
+        return qs
+
+    def _with_stats(self):
+        # ?with_stats=1 on list / retrieve, always for the overview action
+        if self.action == "overview":
+            return True
+        return self.action in ("list", "retrieve") and _is_truthy(self.request.query_params.get("with_stats"))
+
+    def get_serializer_class(self):
+        if self._with_stats():
+            return CampaignOverviewSerializer
+        return super().get_serializer_class()
+
+    def get_conditional_querysets(self):
+        # The overview figures depend on other tables, and on the time for live polls
+        if self._with_stats():
+            return None
+        return super().get_conditional_querysets()
     
     def perform_destroy(self, instance):
         instance.delete()
 
+    @action(detail=True, methods=["get"])
+    def overview(self, request, pk=None):
+        """
+        GET /api/campaigns/{id}/overview/
+        Query, result, poll, live poll and response counts plus the average
+        firescore of one campaign, in a single SQL statement.
+        """
+        campaign = self.get_object()
+        data = {"campaign_id": campaign.campaign_id}
+        data.update((name, getattr(campaign, name)) for name in OVERVIEW_FIELDS)
+        return Response(data)
+
     @action(detail=True, methods=["get"])
     def queries(self, request, pk=None):
         """
@@ -55,12 +117,14 @@ class CampaignViewSet(viewsets.ModelViewSet):
         return Response({"success": True, "query_id": obj.query_id}, status=status.HTTP_201_CREATED)
     
 
-class QueryViewSet(viewsets.ModelViewSet):
+class QueryViewSet(ConditionalGetMixin, TrigramSearchMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     CRUD for Queries
     """
     serializer_class = QuerySerializer
     permission_classes = [IsAuthenticated]
+    search_field = "search_term"
+    search_limited = True
 
     def get_queryset(self):
         # join through campaign to enforce ownership
@@ -75,24 +139,150 @@ class QueryViewSet(viewsets.ModelViewSet):
     def perform_destroy(self, instance):
         instance.delete()
 
+    @action(detail=True, methods=["get"])
+    def firescore_stats(self, request, pk=None):
+        """
+        GET /api/queries/{id}/firescore_stats/
+        Mean, spread, percentiles and histogram of the active results' firescores,
+        overall and per platform, read from the maintained FirescoreStats rows.
+        """
+        query = self.get_object()
+        rows = list(FirescoreStats.objects.filter(query=query).order_by("plt_id"))
+        data = summarize(rows)
+        data["query"] = query.query_id
+        data["platforms"] = [dict(summarize([row]), plt=row.plt_id) for row in rows]
+        return Response(data)
+
+    @action(detail=True, methods=["get"],
+            renderer_classes=[CSVExportRenderer, NDJSONExportRenderer, ParquetExportRenderer, JSONRenderer])
+    def export(self, request, pk=None, format=None):
+        """
+        GET /api/queries/{id}/export/?format=csv|ndjson|parquet&user_data_keys=followers,lang
+        Streams every active result of the query without going through serializers.
+        """
+        query = self.get_object()
+        fmt = request.query_params.get("format") or format or "csv"
+        if fmt not in EXPORT_FORMATS:
+            return Response({"format": [f"Must be one of {', '.join(EXPORT_FORMATS)}."]},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-class QueryResultViewSet(viewsets.ModelViewSet):
+        keys = [k.strip() for k in request.query_params.get("user_data_keys", "").split(",") if k.strip()]
+        columns = EXPORT_COLUMNS + [f"user_data.{k}" for k in keys]
+        rows = iter_export_rows(query, keys)
+
+        if fmt == "csv":
+            content, content_type = stream_csv(rows, columns), "text/csv"
+        elif fmt == "ndjson":
+            content, content_type = stream_ndjson(rows), "application/x-ndjson"
+        else:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                return Response({"format": ["Parquet export needs pyarrow installed on the server."]},
+                                status=status.HTTP_400_BAD_REQUEST)
+            content, content_type = stream_parquet(rows, columns), "application/vnd.apache.parquet"
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="query-{query.query_id}.{fmt}"'
+        return response
+
+    @action(detail=True, methods=["post"])
+    def link_poll_results(self, request, pk=None):
+        """
+        POST /api/queries/{id}/link_poll_results/
+        data = { "poll": <id, optional>, "async": false }
+        Links results to the respondents whose user_identifier matches their
+        source_id. Returns { "linked", "skipped", "ambiguous" }, or 202 with the
+        Celery task id when run with "async": true.
+        """
+        query = self.get_object()
+        poll_id = request.data.get("poll")
+        if poll_id is not None and not (str(poll_id).isdigit() and query.polls.filter(pk=poll_id).exists()):
+            return Response({"poll": ["Poll must belong to this query."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        if _is_truthy(request.data.get("async", request.query_params.get("async"))):
+            result = auto_link_poll_results.delay(query.query_id, poll_id)
+            return Response({"task_id": result.id}, status=status.HTTP_202_ACCEPTED)
+
+        return Response(link_poll_results(query.query_id, poll_id), status=status.HTTP_200_OK)
+
+
+class QueryResultViewSet(ConditionalGetMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
 
     serializer_class = QueryResultSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         # Scope to owner via Query → Campaign → user
-        return (
+        qs = (
             QueryResults.objects
-            .select_related("query__campaign__user", "plt", "poll_result__poll__query")
+            .select_related("query__campaign__user", "plt", "poll_result__poll__query", "account")
             .filter(query__campaign__user=self.request.user)
-            .order_by("-created_at")
         )
+        query_id = self.request.query_params.get("query")
+
+        if query_id:
+            qs = qs.filter(query_id=query_id)
+
+        # ?user_data={...} / ?ud.<key>[__op]=... filters, see campaign/filters.py
+        qs = filter_user_data(qs, self.request.query_params)
+
+        return qs.order_by("-created_at", "-qres_id")
+
+    def get_conditional_querysets(self):
+        # Every write to the user's results, scoring included, bumps their
+        # ResultsVersion, so a list revalidates on that one row. The object
+        # is still read on retrieve for its Last-Modified.
+        version = (ResultsVersion.objects.filter(user=self.request.user), ("version",))
+        if not self.detail:
+            return [version]
+        results = super().get_conditional_querysets()
+        return [(results[0][0], ("modified_at", "account__modified_at")), version]
     
+    # Direct writes keep the firescore aggregates in step with the rows
+    @staticmethod
+    def _stats_entry(obj):
+        # ((query, plt) the row counts towards, its firescore, linked or not), None when inactive
+        if not obj.is_active:
+            return None
+        return (obj.query_id, obj.plt_id), obj.firescore, int(obj.poll_result_id is not None)
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            obj = serializer.save()
+            entry = self._stats_entry(obj)
+            if entry is not None:
+                apply_firescore_delta(*entry[0], added=[entry[1]], linked=entry[2])
+            bump_results_version([obj.query_id])
+
+    def perform_update(self, serializer):
+        old_query_id = serializer.instance.query_id
+        before = self._stats_entry(serializer.instance)
+        with transaction.atomic():
+            obj = serializer.save()
+            after = self._stats_entry(obj)
+            if before is not None and after is not None and before[0] == after[0]:
+                apply_firescore_delta(*after[0], removed=[before[1]], added=[after[1]], linked=after[2] - before[2])
+            else:
+                # In query order, the order a rebuild takes its stats locks in
+                deltas = []
+                if before is not None:
+                    deltas.append((before[0], {"removed": [before[1]], "linked": -before[2]}))
+                if after is not None:
+                    deltas.append((after[0], {"added": [after[1]], "linked": after[2]}))
+                for key, delta in sorted(deltas, key=lambda d: d[0]):
+                    apply_firescore_delta(*key, **delta)
+            bump_results_version({old_query_id, obj.query_id})
+
     def perform_destroy(self, instance):
-        instance.is_active = False
-        instance.save(update_fields=["is_active"])
+        with transaction.atomic():
+            instance.delete()
+            apply_firescore_delta(
+                instance.query_id, instance.plt_id,
+                removed=[instance.firescore], linked=-int(instance.poll_result_id is not None),
+            )
+            bump_results_version([instance.query_id])
 
 
     #link a PollResult to an existing QueryResults row
@@ -119,13 +309,33 @@ class QueryResultViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        newly_linked = qres.poll_result_id is None
         qres.poll_result = pr
         qres.full_clean()  # calls your model.clean as well
-        qres.save(update_fields=["poll_result", "modified_at"])
+        with transaction.atomic():
+            qres.save(update_fields=["poll_result", "modified_at"])
+            apply_firescore_delta(qres.query_id, qres.plt_id, linked=int(newly_linked))
+            bump_results_version([qres.query_id])
         return Response(self.get_serializer(qres).data, status=status.HTTP_200_OK)
 
 
 
+    def _check_upsert_target(self, query_id, plt_id):
+        """
+        Ensure the current user owns the query (via campaign) and that plt is the
+        campaign's platform. Returns an error Response, or None when all good.
+        """
+        # Using get_queryset() would miss queries with no records yet, so check the query directly
+        query = get_object_or_404(Query.objects.select_related("campaign"), pk=query_id, is_active=True)
+
+        if query.campaign.user_id != self.request.user.id:
+            return Response({"detail": "Forbidden."}, status=status.HTTP_403_FORBIDDEN)
+
+        if str(query.campaign.plt_id) != str(plt_id):
+            return Response({"plt": ["Platform must match the campaign's platform for this query."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return None
+
     @action(detail=False, methods=["post"])
     def bulk_upsert(self, request):
         """    
@@ -135,8 +345,12 @@ class QueryResultViewSet(viewsets.ModelViewSet):
                     "items": [ 
                         { "source_id": "...", "user_data": {...}, "firescore": 0.91 }, 
                         ... 
-                    ] 
+                    ],
+                    "async": false
                 }
+        With "async": true (or ?async=1) the items are stored on an IngestJob and
+        upserted by a Celery worker; the response is 202 with the job id to poll at
+        GET /api/ingest-jobs/{job_id}/
         """
         query_id = request.data.get("query")
         plt_id   = request.data.get("plt")
@@ -145,38 +359,148 @@ class QueryResultViewSet(viewsets.ModelViewSet):
         if not query_id or not plt_id or not isinstance(items, list):
             return Response({"detail": "query, plt and items[] are required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # ownership check
-        qs = self.get_queryset().filter(query_id=query_id, plt_id=plt_id)
+        error = self._check_upsert_target(query_id, plt_id)
+        if error is not None:
+            return error
 
-        # Using get_queryset() ensures current user owns the query via campaign
-        # If no records exist yet, still need to ensure ownership:
-        
-        query = get_object_or_404(Query.objects.select_related("campaign"), pk=query_id, is_active=True)
-        
-        if query.campaign.user_id != self.request.user.id:
-            return Response({"detail": "Forbidden."}, status=status.HTTP_403_FORBIDDEN)
-        
-        if query.campaign.plt_id != plt_id:
-            return Response({"plt": ["Platform must match the campaign's platform for this query."]}, 
-                            status=status.HTTP_400_BAD_REQUEST)
+        if _is_truthy(request.data.get("async", request.query_params.get("async"))):
+            job = IngestJob.objects.create(
+                user=request.user, query_id=query_id, plt_id=plt_id,
+                payload=items, total_rows=len(items),
+            )
+            # Only hand the job to the worker once the row is committed
+            transaction.on_commit(lambda: run_ingest_job.delay(job.pk))
+            return Response({"job_id": job.pk, "status": job.status}, status=status.HTTP_202_ACCEPTED)
 
-        # Upsert logic: by (query, plt, source_id, is_active=True)
+        # Upsert logic: by (query, plt, source_id, is_active=True), done set-based
+        created, updated = bulk_upsert_query_results(query_id, plt_id, items)
+
+        return Response({"created": created, "updated": updated}, status=status.HTTP_200_OK)
+
+
+    @action(detail=False, methods=["post"])
+    def ingest(self, request):
+        """
+        POST /api/query-results/ingest/?query=123&plt=2
+        body (application/x-ndjson, may be chunked), one item per line:
+                { "source_id": "...", "user_data": {...}, "firescore": 0.91 }
+                ...
+        """
+        query_id = request.query_params.get("query")
+        plt_id = request.query_params.get("plt")
+        if not query_id or not plt_id:
+            return Response({"detail": "query and plt are required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        error = self._check_upsert_target(query_id, plt_id)
+        if error is not None:
+            return error
+
+        # Read the raw body as it arrives instead of letting DRF parse it into memory.
+        # Chunked uploads carry no Content-Length: ASGI hands us the whole body anyway,
+        # WSGI only when the server says the input stream ends (wsgi.input_terminated).
+        # Otherwise the body would read as empty, so refuse it rather than report 0 rows.
+        stream = request._request
+        if not request.META.get("CONTENT_LENGTH") and not isinstance(request._request, ASGIRequest):
+            if not request.META.get("wsgi.input_terminated"):
+                return Response({"detail": "Content-Length is required for chunked uploads on this server."},
+                                status=status.HTTP_411_LENGTH_REQUIRED)
+            stream = request.META["wsgi.input"]
+
+        batches, errors = [], []
         created, updated = 0, 0
-        from campaign.models import QueryResults as QR
-        with transaction.atomic():
-            for it in items:
-                source_id = (it.get("source_id") or "").strip()
-                if not source_id:
-                    continue
-                defaults = {
-                    "user_data": it.get("user_data"),
-                    "firescore": it.get("firescore"),
-                }
-                obj, was_created = QR.objects.update_or_create(
-                    query_id=query_id, plt_id=plt_id, source_id=source_id, is_active=True,
-                    defaults=defaults
-                )
-                created += int(was_created)
-                updated += int(not was_created)
-
-        return Response({"created": created, "updated": updated}, status=status.HTTP_200_OK)
\ No newline at end of file
+        for number, batch in enumerate(iter_ndjson_batches(stream, INGEST_BATCH_SIZE, errors), start=1):
+            b_created, b_updated = bulk_upsert_query_results(query_id, plt_id, batch)
+            batches.append({
+                "batch": number,
+                "rows": len(batch),
+                "created": b_created,
+                "updated": b_updated,
+                "skipped": len(batch) - b_created - b_updated,
+            })
+            created += b_created
+            updated += b_updated
+
+        return Response(
+            {"created": created, "updated": updated, "batches": batches, "errors": errors},
+            status=status.HTTP_200_OK,
+        )
+
+
+    @action(detail=False, methods=["get"])
+    def top(self, request):
+        """
+        GET /api/query-results/top/?query=<id>&k=10&min_score=0.5
+        GET /api/query-results/top/?campaign=<id>&k=10     (ranked across all its queries)
+        Highest firescores first, each row carrying its rank (ties share a rank).
+        """
+        query_id = request.query_params.get("query")
+        campaign_id = request.query_params.get("campaign")
+        if not query_id and not campaign_id:
+            return Response({"detail": "query or campaign is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            query_id = int(query_id) if query_id else None
+            campaign_id = int(campaign_id) if campaign_id else None
+            k = min(max(int(request.query_params.get("k", TOP_K_DEFAULT)), 1), TOP_K_MAX)
+            min_score = request.query_params.get("min_score")
+            min_score = Decimal(min_score) if min_score not in (None, "") else None
+        except (TypeError, ValueError, ArithmeticError):
+            return Response({"detail": "query, campaign and k must be integers and min_score a number."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        scored = QueryResults.objects.filter(firescore__isnull=False)
+        if min_score is not None:
+            scored = scored.filter(firescore__gte=min_score)
+        # ud.* filters narrow the candidates, not the top k picked without them
+        scored = filter_user_data(scored, request.query_params)
+
+        if query_id:
+            query_ids = [query_id]
+        else:
+            query_ids = list(
+                Query.objects.filter(campaign_id=campaign_id, campaign__user=request.user)
+                .values_list("query_id", flat=True)
+            )
+
+        # Each query's top k comes off the alive (query, -firescore) index and stops
+        # after k rows; only those candidates are merged, so work is bounded by k per query.
+        branches = [
+            scored.filter(query_id=qid).order_by("-firescore", "-qres_id").values_list("qres_id", "firescore")[:k]
+            for qid in query_ids
+        ]
+        if not branches:
+            return Response([])
+        candidates = branches[0]
+        if len(branches) > 1:
+            candidates = branches[0].union(*branches[1:], all=True).order_by("-firescore", "-qres_id")[:k]
+        top_ids = [qres_id for qres_id, _ in candidates]
+
+        # Every row scoring above any of these is among them, so ranking them alone gives the real rank
+        rows = (
+            self.get_queryset()
+            .filter(pk__in=top_ids)
+            .annotate(rank=Window(expression=Rank(), order_by=F("firescore").desc()))
+            .order_by("-firescore", "-qres_id")
+        )
+        data = [
+            dict(self.get_serializer(obj).data, rank=obj.rank)
+            for obj in rows
+        ]
+        return Response(data)
+
+
+class IngestJobViewSet(SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    GET /api/ingest-jobs/ and /api/ingest-jobs/{job_id}/ for async ingestion status
+    """
+    serializer_class = IngestJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        qs = IngestJob.objects.filter(user=self.request.user).defer("payload")
+        query_id = self.request.query_params.get("query")
+
+        if query_id:
+            qs = qs.filter(query_id=query_id)
+
+        return qs.order_by("-created_at")
\ No newline at end of file
@@ -0,0 +1,112 @@
+# core/compaction.py
+import gzip
+import json
+import logging
+from datetime import timedelta
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import SoftDeleteModel
+
+logger = logging.getLogger(__name__)
+
+# Children before parents, so a parent's dead children are gone by the time
+# the parent itself is considered
+COMPACTED_MODELS = ("poll.PollResult", "campaign.QueryResults", "poll.Poll", "campaign.Query")
+
+DEFAULT_RETENTION_DAYS = 90
+DEFAULT_BATCH_SIZE = 500
+# Per model per run, so one run can't hold the worker for too long
+DEFAULT_MAX_BATCHES = 200
+
+
+def _blocking_relations(model):
+    """
+    Reverse relations that must be empty before a row may go: PROTECT /
+    RESTRICT ones (the delete would fail), and any coming from another
+    soft-delete model, dead or alive, so compaction never cascades into or
+    nulls out rows it hasn't archived itself.
+    """
+    for rel in model._meta.related_objects:
+        if rel.many_to_many:
+            continue
+        protected = rel.on_delete in (models.PROTECT, models.RESTRICT)
+        if protected or issubclass(rel.related_model, SoftDeleteModel):
+            yield rel
+
+
+def compactable(model, cutoff):
+    """
+    Soft-deleted rows of `model` last modified before `cutoff` that nothing
+    references any more. Soft deletes stamp modified_at, so this is how long
+    a row has been dead unless it was edited after dying.
+    """
+    qs = model.all_objects.dead().filter(modified_at__lt=cutoff)
+    for rel in _blocking_relations(model):
+        related = rel.related_model._base_manager.filter(**{rel.field.name: OuterRef("pk")})
+        qs = qs.filter(~Exists(related))
+    return qs
+
+
+def _archive_path(archive_dir, model, started):
+    folder = Path(archive_dir) / model._meta.label_lower
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder / f"{started:%Y%m%dT%H%M%S}.ndjson.gz"
+
+
+def compact_model(model, cutoff, archive_dir, batch_size=DEFAULT_BATCH_SIZE, max_batches=DEFAULT_MAX_BATCHES):
+    """
+    Archive then hard-delete the compactable rows of one model, batch by batch.
+    Each batch is appended to the run's archive as its own gzip member, and the
+    file is closed before the batch is deleted, so nothing is deleted that
+    isn't on disk. Returns the number of rows removed.
+    """
+    started = timezone.now()
+    path = _archive_path(archive_dir, model, started)
+    columns = [f.attname for f in model._meta.concrete_fields]
+    pk_name = model._meta.pk.attname
+
+    removed = 0
+    for _ in range(max_batches):
+        with transaction.atomic():
+            ids = list(
+                compactable(model, cutoff)
+                .order_by(pk_name)
+                .select_for_update(skip_locked=True)
+                .values_list(pk_name, flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+
+            batch = model.all_objects.filter(pk__in=ids)
+            with gzip.open(path, "at", encoding="utf-8") as archive:
+                for row in batch.values(*columns).iterator():
+                    archive.write(json.dumps(row, cls=DjangoJSONEncoder) + "\n")
+            batch.hard_delete()
+        removed += len(ids)
+
+    if removed:
+        logger.info("Compacted %s %s rows into %s.", removed, model._meta.label, path)
+    return removed
+
+
+def compact_soft_deleted(now=None):
+    """
+    Run compaction over COMPACTED_MODELS with the retention, batch size and
+    archive directory from settings. Returns { "app.Model": rows removed }.
+    """
+    now = now or timezone.now()
+    retention = timedelta(days=getattr(settings, "SOFT_DELETE_RETENTION_DAYS", DEFAULT_RETENTION_DAYS))
+    archive_dir = getattr(settings, "SOFT_DELETE_ARCHIVE_DIR", Path(settings.BASE_DIR) / "archive")
+    batch_size = getattr(settings, "SOFT_DELETE_COMPACTION_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+
+    return {
+        label: compact_model(apps.get_model(label), now - retention, archive_dir, batch_size=batch_size)
+        for label in COMPACTED_MODELS
+    }
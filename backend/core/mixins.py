@@ -0,0 +1,223 @@
+import hashlib
+from datetime import datetime
+
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connection
+from django.db.models import Aggregate, Count, F, Lookup, Max, Q
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import ListSerializer, ModelSerializer
+
+# ?search= type-ahead: how many ranked matches a list returns by default / at most
+SEARCH_PARAM = "search"
+SEARCH_LIMIT_PARAM = "limit"
+SEARCH_LIMIT_DEFAULT = 20
+SEARCH_LIMIT_MAX = 100
+
+
+def _flatten(tree, prefix=""):
+    # select_related() tree {"query": {"campaign": {}}} -> ["query__campaign"]
+    paths = []
+    for name, sub in tree.items():
+        path = f"{prefix}{name}"
+        paths.extend(_flatten(sub, f"{path}__") if sub else [path])
+    return paths
+
+
+class SparseFieldsViewMixin:
+    """
+    Viewset mixin that trims the read queryset down to what the serializer will
+    actually output: only() the backing columns and drop select_related joins
+    no remaining field goes through. Pairs with core.serializers.SparseFieldsMixin,
+    but also helps without ?fields=, since pk-only relations never need the join.
+    Fields the view itself relies on (permissions etc.) go in always_load_fields;
+    the paginator's cursor_fields are always kept too.
+    """
+    always_load_fields = ()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        return self.project_queryset(queryset)
+
+    def project_queryset(self, queryset):
+        serializer = self.get_serializer()
+        if isinstance(serializer, ListSerializer):
+            serializer = serializer.child
+        if not isinstance(serializer, ModelSerializer):
+            return queryset
+
+        opts = queryset.model._meta
+        concrete = {f.name for f in opts.concrete_fields}
+        needed = {opts.pk.name, *self.always_load_fields, *getattr(self.paginator, "cursor_fields", ())}
+        traversed = set()
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            source = field.source.split(".")
+            if source[0] not in concrete:
+                # properties, reverse relations, "*" ... can't tell what they touch, leave it be
+                return queryset
+            needed.add(source[0])
+            if len(source) > 1:
+                traversed.add(source[0])
+
+        # Keep only the joins a remaining field actually goes through
+        related = queryset.query.select_related
+        if isinstance(related, dict):
+            keep = {name: sub for name, sub in related.items() if name in traversed}
+            queryset = queryset.select_related(None)
+            if keep:
+                queryset = queryset.select_related(*_flatten(keep))
+
+        return queryset.only(*needed)
+
+
+class _ILike(Lookup):
+    # column ILIKE pattern on the bare column. __icontains wraps it in
+    # UPPER(col::text), which a gin_trgm_ops index on the column can't serve.
+    lookup_name = "ilike"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} ILIKE {rhs}", (*lhs_params, *rhs_params)
+
+
+class TrigramSearchMixin:
+    """
+    Viewset mixin adding ?search=<text> over one text column, served by a
+    pg_trgm GIN index on it: rows containing the text or sharing enough
+    trigrams with it (word similarity, so typos and partial words still
+    match), best matches first. With search_limited, a searched list
+    returns the top ?limit= rows; otherwise every match.
+    """
+    search_field = None
+    search_limited = False
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        term = (self.request.query_params.get(SEARCH_PARAM) or "").strip()
+        if not term or self.search_field is None:
+            return queryset
+
+        field = self.search_field
+        queryset = (
+            queryset
+            .filter(Q(_ILike(F(field), f"%{connection.ops.prep_for_like_query(term)}%"))
+                    | Q(**{f"{field}__trigram_word_similar": term}))
+            .annotate(search_rank=TrigramWordSimilarity(term, field))
+            .order_by("-search_rank", "-created_at")
+        )
+        if self.action != "list" or not self.search_limited:
+            return queryset
+
+        raw = self.request.query_params.get(SEARCH_LIMIT_PARAM, SEARCH_LIMIT_DEFAULT)
+        try:
+            limit = min(max(int(raw), 1), SEARCH_LIMIT_MAX)
+        except (TypeError, ValueError):
+            raise ValidationError({SEARCH_LIMIT_PARAM: "Must be a number."})
+        return queryset[:limit]
+
+
+class _NotModified(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """
+    Viewset mixin answering GETs of conditional_actions with 304 Not Modified
+    when the client's If-None-Match (or, for single-object actions,
+    If-Modified-Since) still holds. The validators come from aggregates, the
+    max() of some modified_at columns plus a row count per queryset, so an
+    unchanged response costs those queries and no serialization. A row
+    leaving the set changes the count, which is why lists only go by ETag.
+    Views whose timestamps don't follow every change validate on a counter
+    instead and set conditional_last_modified = False.
+    """
+    conditional_actions = ("list", "retrieve")
+    conditional_last_modified = True
+
+    def get_conditional_querysets(self):
+        """
+        [ (queryset, (datetime field paths, ...)), ... ] standing in for the
+        response, or None to skip the check. A path is aggregated with max(),
+        an aggregate expression (e.g. Sum of a counter) is taken as is.
+        Defaults to the view's filtered queryset, narrowed to the object on
+        detail actions.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.detail:
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return [(queryset, ("modified_at",))]
+
+    def get_conditional_validators(self):
+        """
+        (etag, last_modified timestamp or None), or None when the action isn't conditional.
+        """
+        if self.request.method not in ("GET", "HEAD") or self.action not in self.conditional_actions:
+            return None
+        try:
+            querysets = self.get_conditional_querysets()
+            if querysets is None:
+                return None
+            aggregates = [
+                (queryset if queryset.query.is_sliced else queryset.order_by()).aggregate(
+                    rows=Count("pk"),
+                    **{f"max_{i}": field if isinstance(field, Aggregate) else Max(field)
+                       for i, field in enumerate(fields)},
+                )
+                for queryset, fields in querysets
+            ]
+        except (TypeError, ValueError, DjangoValidationError):
+            # A malformed lookup value, the action itself answers 404
+            return None
+
+        parts = [self.request.user.pk, self.request.get_full_path(), self.request.accepted_media_type]
+        last_modified = None
+        for values in aggregates:
+            parts.append(sorted(values.items()))
+            for value in values.values():
+                if not self.conditional_last_modified:
+                    break
+                if isinstance(value, datetime) and (last_modified is None or value > last_modified):
+                    last_modified = value
+
+        digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+        # Weak: the same data may be rendered slightly differently
+        return f'W/"{digest}"', (last_modified.timestamp() if last_modified else None)
+
+    def initial(self, request, *args, **kwargs):
+        # After authentication, permissions and content negotiation
+        super().initial(request, *args, **kwargs)
+        self.conditional_validators = self.get_conditional_validators()
+        if self.conditional_validators is None:
+            return
+        etag, last_modified = self.conditional_validators
+        response = get_conditional_response(
+            request, etag=etag, last_modified=int(last_modified) if last_modified and self.detail else None,
+        )
+        if response is not None:
+            raise _NotModified(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, _NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(self, "conditional_validators", None)
+        if validators is not None and response.status_code in (200, 304):
+            etag, last_modified = validators
+            response.headers["ETag"] = etag
+            if last_modified is not None:
+                response.headers["Last-Modified"] = http_date(last_modified)
+            patch_vary_headers(response, ["Authorization"])
+        return response
@@ -20,6 +20,24 @@ class TimeStampedModel(models.Model):
         abstract = True 
 
 
+# Index over alive rows only (WHERE is_active), for SoftDeleteModel subclasses.
+# The default manager already filters on is_active, so dead rows in an index
+# are dead weight; these stay smaller and hotter. Leave is_active out of the
+# fields, the condition takes care of it. A name is generated when omitted.
+class AliveIndex(models.Index):
+    suffix = "alv"
+    condition_q = Q(is_active=True)
+
+    def __init__(self, *expressions, condition=None, **kwargs):
+        # condition is accepted so migrations can hand it back, but only this one
+        if condition is not None and condition != self.condition_q:
+            raise ValueError("AliveIndex is always partial on is_active=True, use models.Index for other conditions.")
+        # Set after the base init, which only takes conditions on named indexes;
+        # the name comes from the model later on
+        super().__init__(*expressions, **kwargs)
+        self.condition = self.condition_q
+
+
 # This model is for fetching the data with the is active flag
 # It is to allow soft delete functionality using is active flag
 #in our app
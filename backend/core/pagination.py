@@ -0,0 +1,126 @@
+import base64
+from urllib import parse
+
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+# Keyset pagination on (created_at, pk), newest first.
+# Unlike offset pagination every page is a range scan that starts right where the
+# previous one stopped, so page 5,000 costs the same as page 1 as long as the
+# table has a matching (…, created_at, pk) index.
+class KeysetPagination(BasePagination):
+
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+    # Read off every row to build the links, besides pk; views that only() their
+    # querysets must keep them loaded (see SparseFieldsViewMixin)
+    cursor_fields = ("created_at",)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+
+        position, reverse = self.decode_cursor(request)
+
+        if position is None:
+            qs = queryset.order_by("-created_at", "-pk")
+        elif not reverse:
+            created_at, pk = position
+            qs = (
+                queryset.filter(created_at__lte=created_at)
+                .exclude(created_at=created_at, pk__gte=pk)
+                .order_by("-created_at", "-pk")
+            )
+        else:
+            created_at, pk = position
+            qs = (
+                queryset.filter(created_at__gte=created_at)
+                .exclude(created_at=created_at, pk__lte=pk)
+                .order_by("created_at", "pk")
+            )
+
+        # Fetch one extra row to find out whether there is anything beyond this page
+        rows = list(qs[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        if reverse:
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            querystring = base64.urlsafe_b64decode(encoded.encode("ascii")).decode("ascii")
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            created_at = parse_datetime(tokens["c"][0])
+            pk = int(tokens["p"][0])
+            reverse = bool(int(tokens.get("r", ["0"])[0]))
+        except (KeyError, IndexError, TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return (created_at, pk), reverse
+
+    def encode_cursor(self, obj, reverse):
+        tokens = {"c": obj.created_at.isoformat(), "p": obj.pk}
+        if reverse:
+            tokens["r"] = 1
+        querystring = parse.urlencode(tokens)
+        encoded = base64.urlsafe_b64encode(querystring.encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
@@ -0,0 +1,50 @@
+from rest_framework import serializers
+
+
+# Sparse fieldsets: ?fields=a,b keeps only those fields in the response,
+# ?exclude=c,d drops them. Only applies to the top-level serializer of a
+# read request, so nested serializers and write validation are untouched.
+FIELDS_PARAM = "fields"
+EXCLUDE_PARAM = "exclude"
+
+
+def _split(value):
+    return [name.strip() for name in (value or "").split(",") if name.strip()]
+
+
+def requested_field_names(request, available):
+    """
+    Return the subset of `available` field names asked for by the request's
+    ?fields= / ?exclude= params, or None when the request doesn't restrict them.
+    """
+    if request is None or request.method not in ("GET", "HEAD", "OPTIONS"):
+        return None
+
+    params = getattr(request, "query_params", request.GET)
+    only, exclude = _split(params.get(FIELDS_PARAM)), _split(params.get(EXCLUDE_PARAM))
+    if not only and not exclude:
+        return None
+
+    names = [name for name in available if name in only] if only else list(available)
+    return [name for name in names if name not in exclude]
+
+
+class SparseFieldsMixin:
+    """
+    ModelSerializer mixin honouring ?fields= / ?exclude= on read requests.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+
+        # Only the serializer the view asked for, not nested ones
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return fields
+
+        keep = requested_field_names(self.context.get("request"), fields)
+        if keep is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in keep}
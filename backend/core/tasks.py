@@ -1,10 +1,23 @@
 import logging
 from celery import shared_task
 
+from .compaction import compact_soft_deleted
+
 
 logger = logging.getLogger(__name__)
 
 @shared_task
 def heartbeat():
     logger.info("🔥 [Celery heartbeat] Task ran successfully.")
-    print("🔥 [Celery heartbeat] Task ran successfully.")
\ No newline at end of file
+    print("🔥 [Celery heartbeat] Task ran successfully.")
+
+
+@shared_task
+def compact_soft_deleted_rows():
+    """
+    Archive and hard-delete soft-deleted rows past their retention period,
+    see core/compaction.py
+    """
+    removed = compact_soft_deleted()
+    logger.info("Soft-delete compaction removed %s", removed)
+    return removed
@@ -1,3 +1,105 @@
+import gzip
+import json
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from django.db.models import Q
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import FireMeUser
+from campaign.models import Campaign, Query, QueryResults
+from campaign.services import bulk_upsert_query_results
+from question_answers.models import Question
+from social.models import Platform
+
+from .compaction import compact_model, compactable
+from .mixins import SEARCH_LIMIT_DEFAULT
+from .models import AliveIndex
+
+
+class TrigramSearchTests(TestCase):
+
+    def setUp(self):
+        self.user = FireMeUser.objects.create_user(username="owner", email="owner@example.com", password="x")
+        self.campaign = Campaign.objects.create(user=self.user, plt=Platform.objects.create(name="p"), name="c")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, url, term, **params):
+        response = self.client.get(url, {"search": term, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_substring_and_typo_matches_best_first(self):
+        for term in ("bushfire smoke", "bushfires", "flood warning", "smoke bushfir"):
+            Query.objects.create(campaign=self.campaign, search_term=term)
+
+        found = [row["search_term"] for row in self.search("/api/queries/", "bushfire")]
+
+        self.assertEqual(found[0], "bushfire smoke")
+        self.assertCountEqual(found, ["bushfire smoke", "bushfires", "smoke bushfir"])
+        self.assertEqual([row["search_term"] for row in self.search("/api/queries/", "FLOOD")], ["flood warning"])
+
+    def test_limit_applies_to_campaigns_and_queries_only(self):
+        for i in range(SEARCH_LIMIT_DEFAULT + 5):
+            Query.objects.create(campaign=self.campaign, search_term=f"storm {i}")
+            Question.objects.create(user=self.user, question=f"storm {i}")
+
+        self.assertEqual(len(self.search("/api/queries/", "storm")), SEARCH_LIMIT_DEFAULT)
+        self.assertEqual(len(self.search("/api/queries/", "storm", limit=3)), 3)
+        self.assertEqual(len(self.search("/api/questions/", "storm")), SEARCH_LIMIT_DEFAULT + 5)
+
+        response = self.client.get("/api/campaigns/", {"search": "c", "limit": "x"})
+        self.assertEqual(response.status_code, 400)
+
+
+class CompactionTests(TestCase):
+
+    def setUp(self):
+        self.user = FireMeUser.objects.create_user(username="owner", email="owner@example.com", password="x")
+        plt = Platform.objects.create(name="p")
+        campaign = Campaign.objects.create(user=self.user, plt=plt, name="c")
+        self.query = Query.objects.create(campaign=campaign, search_term="t")
+        bulk_upsert_query_results(self.query.pk, plt.pk, [{"source_id": f"s{i}"} for i in range(3)])
+        self.long_ago = timezone.now() - timedelta(days=400)
+        self.cutoff = timezone.now() - timedelta(days=90)
+        QueryResults.objects.update(modified_at=self.long_ago)
+
+    def test_soft_delete_restarts_retention(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        obj = QueryResults.objects.first()
+
+        self.assertEqual(client.delete(f"/api/query-results/{obj.pk}/").status_code, 204)
+
+        self.assertFalse(QueryResults.all_objects.get(pk=obj.pk).is_active)
+        self.assertFalse(compactable(QueryResults, self.cutoff).exists())
+
+    def test_old_dead_rows_are_archived_then_removed(self):
+        dead = QueryResults.objects.first()
+        QueryResults.all_objects.filter(pk=dead.pk).update(is_active=False, modified_at=self.long_ago)
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            self.assertEqual(compact_model(QueryResults, self.cutoff, archive_dir), 1)
+            [archive] = Path(archive_dir).glob("campaign.queryresults/*.ndjson.gz")
+            with gzip.open(archive, "rt", encoding="utf-8") as lines:
+                self.assertEqual([json.loads(line)["qres_id"] for line in lines], [dead.pk])
+
+        self.assertFalse(QueryResults.all_objects.filter(pk=dead.pk).exists())
+        self.assertEqual(QueryResults.objects.count(), 2)
+
+
+class AliveIndexTests(TestCase):
+
+    def test_condition_is_always_alive_rows(self):
+        index = AliveIndex(fields=["created_at"], name="x_alv")
+
+        self.assertEqual(index.deconstruct()[2]["condition"], Q(is_active=True))
+        self.assertEqual(AliveIndex(fields=["created_at"], name="x_alv", condition=Q(is_active=True)), index)
 
-# Create your tests here.
+    def test_other_condition_is_refused(self):
+        with self.assertRaises(ValueError):
+            AliveIndex(fields=["created_at"], name="x_alv", condition=Q(is_active=False))
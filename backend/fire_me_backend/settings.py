@@ -40,12 +40,15 @@ AUTH_USER_MODEL = 'accounts.FireMeUser'
 # Application definition
 
 INSTALLED_APPS = [
+    # Before staticfiles: runserver serves ASGI, see ASGI_APPLICATION
+    'daphne',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 EXTERNAL_APPS = [
@@ -119,6 +122,9 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'fire_me_backend.wsgi.application'
+# The live poll stream (poll/stream.py) needs ASGI: under WSGI a streamed
+# response is only sent once it ends, and a tally stream never does
+ASGI_APPLICATION = 'fire_me_backend.asgi.application'
 
 
 # Database
@@ -186,6 +192,15 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 FRONTEND_BASE_URL = os.getenv("FRONTEND_BASE_URL", "http://localhost:3000")
 
+# Soft-deleted rows are archived to gzipped NDJSON under SOFT_DELETE_ARCHIVE_DIR
+# and hard-deleted once they are this old, see core/compaction.py
+SOFT_DELETE_RETENTION_DAYS = int(os.getenv("SOFT_DELETE_RETENTION_DAYS", "90"))
+SOFT_DELETE_ARCHIVE_DIR = Path(os.getenv("SOFT_DELETE_ARCHIVE_DIR", BASE_DIR / "archive"))
+SOFT_DELETE_COMPACTION_BATCH_SIZE = 500
+
+# Dotted path of the firescore scoring function, see campaign/scoring.py
+FIRESCORE_SCORER = os.getenv("FIRESCORE_SCORER", "campaign.scoring.baseline_scorer")
+
 # CELERY RELEATED SETTINGS
 from celery.schedules import crontab
 
@@ -205,4 +220,28 @@ CELERY_BEAT_SCHEDULE = {
         "task": "core.tasks.heartbeat",
         "schedule": 30.0,  # seconds
     },
+    "reconcile-firescore-stats-hourly": {
+        "task": "campaign.tasks.reconcile_firescore_stats",
+        "schedule": crontab(minute=15),
+    },
+    "advance-poll-lifecycle-every-minute": {
+        "task": "poll.tasks.advance_polls",
+        "schedule": 60.0,
+    },
+    "reconcile-poll-tallies-every-10-minutes": {
+        "task": "poll.tasks.reconcile_poll_tallies",
+        "schedule": crontab(minute="*/10"),
+    },
+    "reap-stale-ingest-jobs-every-5-minutes": {
+        "task": "campaign.tasks.reap_stale_ingest_jobs",
+        "schedule": 300.0,
+    },
+    "rescore-changed-results-nightly": {
+        "task": "campaign.tasks.rescore_changed_results",
+        "schedule": crontab(hour=2, minute=30),
+    },
+    "compact-soft-deleted-rows-daily": {
+        "task": "core.tasks.compact_soft_deleted_rows",
+        "schedule": crontab(hour=3, minute=30),
+    },
 }
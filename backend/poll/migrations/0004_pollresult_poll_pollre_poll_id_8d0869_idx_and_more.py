@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0003_pollresult_uq_active_result_per_user_per_poll'),
+        ('question_answers', '0004_alter_question_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pollresult',
+            index=models.Index(fields=['poll', '-created_at', '-pr_id'], name='poll_pollre_poll_id_8d0869_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pollresult',
+            index=models.Index(fields=['-created_at', '-pr_id'], name='poll_pollre_created_2d2d61_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0004_pollresult_poll_pollre_poll_id_8d0869_idx_and_more'),
+        ('question_answers', '0004_alter_question_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pollresult',
+            index=models.Index(fields=['poll', 'modified_at'], name='poll_pollre_poll_id_bffe30_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:14
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0018_remove_campaign_campaign_ca_user_id_3a9e35_idx_and_more'),
+        ('poll', '0005_pollresult_poll_pollre_poll_id_bffe30_idx'),
+        ('question_answers', '0006_remove_answer_question_an_questio_77c60e_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='poll',
+            name='poll_poll_query_i_d8ce59_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='pollresult',
+            name='poll_pollre_poll_id_7eff26_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='pollresult',
+            name='poll_pollre_poll_id_7f8545_idx',
+        ),
+        migrations.AddIndex(
+            model_name='poll',
+            index=core.models.AliveIndex(condition=models.Q(('is_active', True)), fields=['query', 'starts_at', 'ends_at'], name='poll_poll_query_i_503a65_alv'),
+        ),
+        migrations.AddIndex(
+            model_name='pollresult',
+            index=core.models.AliveIndex(condition=models.Q(('is_active', True)), fields=['poll', 'answer'], name='poll_pollre_poll_id_2a2932_alv'),
+        ),
+    ]
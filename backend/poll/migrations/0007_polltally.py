@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def tally_existing_results(apps, schema_editor):
+    PollResult = apps.get_model("poll", "PollResult")
+    PollTally = apps.get_model("poll", "PollTally")
+    rows = (
+        PollResult.objects.filter(is_active=True)
+        .values("poll_id", "answer_id")
+        .annotate(n=Count("pr_id"))
+        .order_by()
+    )
+    PollTally.objects.bulk_create(
+        [PollTally(poll_id=row["poll_id"], answer_id=row["answer_id"], count=row["n"]) for row in rows],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0006_remove_poll_poll_poll_query_i_d8ce59_idx_and_more'),
+        ('question_answers', '0006_remove_answer_question_an_questio_77c60e_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollTally',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('tally_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('count', models.IntegerField(default=0)),
+                ('answer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='poll_tallies', to='question_answers.answer')),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tallies', to='poll.poll')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('poll', 'answer'), name='uq_poll_tally_per_answer', nulls_distinct=False)],
+            },
+        ),
+        migrations.RunPython(tally_existing_results, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:25
+
+import core.models
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_live_polls(apps, schema_editor):
+    # Polls already past ends_at stay scheduled, the lifecycle task closes them
+    Poll = apps.get_model("poll", "Poll")
+    now = timezone.now()
+    Poll.objects.filter(starts_at__lte=now, ends_at__gte=now).update(status="live")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0018_remove_campaign_campaign_ca_user_id_3a9e35_idx_and_more'),
+        ('poll', '0007_polltally'),
+        ('question_answers', '0006_remove_answer_question_an_questio_77c60e_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollSnapshot',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('snapshot_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('answer_counts', models.JSONField(blank=True, default=list)),
+                ('respondent_count', models.PositiveIntegerField(default=0)),
+                ('answered_count', models.PositiveIntegerField(default=0)),
+                ('submission_count', models.PositiveIntegerField(default=0)),
+                ('closed_at', models.DateTimeField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='poll',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='poll',
+            name='status',
+            field=models.CharField(choices=[('scheduled', 'Scheduled'), ('live', 'Live'), ('closed', 'Closed')], default='scheduled', max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='poll',
+            index=core.models.AliveIndex(condition=models.Q(('is_active', True)), fields=['status', 'starts_at', 'ends_at'], name='poll_poll_status_a72d8d_alv'),
+        ),
+        migrations.AddField(
+            model_name='pollsnapshot',
+            name='poll',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='final_snapshot', to='poll.poll'),
+        ),
+        migrations.RunPython(mark_live_polls, migrations.RunPython.noop),
+    ]
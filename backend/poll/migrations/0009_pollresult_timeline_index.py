@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0008_poll_lifecycle'),
+        ('question_answers', '0006_remove_answer_question_an_questio_77c60e_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='pollresult',
+            name='poll_pollre_poll_id_8d0869_idx',
+        ),
+        migrations.AddIndex(
+            model_name='pollresult',
+            index=models.Index(fields=['poll', '-created_at', '-pr_id'], include=('answer',), name='poll_result_poll_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0009_pollresult_timeline_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='polltally',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
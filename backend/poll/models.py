@@ -1,7 +1,7 @@
 from django.db import models
 from django.utils import timezone
 from django.db.models import Q, F
-from core.models import SoftDeleteModel
+from core.models import AliveIndex, SoftDeleteModel, TimeStampedModel
 from django.core.exceptions import ValidationError
 
 
@@ -11,7 +11,7 @@ class PollQuerySet(models.QuerySet):
 
     def live(self, now=None):
         now = now or timezone.now()
-        return self.filter(is_active = True, starts_at__lte=now, ends_at__gte=now)
+        return self.filter(is_active = True, starts_at__lte=now, ends_at__gte=now).exclude(status="closed")
     
     def upcoming(self, now = None):
         now = now or timezone.now()
@@ -24,6 +24,13 @@ class PollQuerySet(models.QuerySet):
 
 
 class Poll(SoftDeleteModel):
+    # Moved along by the lifecycle task (see poll/services.py) at starts_at /
+    # ends_at. A closed poll takes no more votes and has a PollSnapshot.
+    STATUS_CHOICES = (
+        ("scheduled", "Scheduled"),
+        ("live", "Live"),
+        ("closed", "Closed"),
+    )
 
     poll_id = models.BigAutoField(primary_key=True)
     title = models.CharField(max_length=150, null=True, blank=True)
@@ -31,15 +38,19 @@ class Poll(SoftDeleteModel):
     question = models.ForeignKey("question_answers.Question", on_delete=models.PROTECT, related_name="polls")
     starts_at = models.DateTimeField()
     ends_at = models.DateTimeField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="scheduled")
+    closed_at = models.DateTimeField(null=True, blank=True)
 
     objects = PollQuerySet.as_manager()
 
     class Meta:
         ordering = ["-created_at"]
         indexes = [
-            models.Index(fields=["query", "is_active", "starts_at", "ends_at"]),
+            AliveIndex(fields=["query", "starts_at", "ends_at"]),
             models.Index(fields=["question"]),
-            models.Index(fields=["query", "title"])
+            models.Index(fields=["query", "title"]),
+            # Polls due to open or close, see advance_poll_lifecycle
+            AliveIndex(fields=["status", "starts_at", "ends_at"]),
         ]
         constraints=[
             models.CheckConstraint(
@@ -54,7 +65,7 @@ class Poll(SoftDeleteModel):
     @property
     def is_live(self) -> bool:
         now = timezone.now()
-        return self.is_active and self.starts_at <= now <= self.ends_at
+        return self.is_active and self.status != "closed" and self.starts_at <= now <= self.ends_at
 
 
 class PollResult(SoftDeleteModel):
@@ -67,8 +78,15 @@ class PollResult(SoftDeleteModel):
 
         ordering = ["-created_at"]
         indexes=[
-            models.Index(fields=["poll","is_active", "user_identifier"]),
-            models.Index(fields=["poll", "answer"])
+            # (poll, user_identifier) over alive rows is served by uq_active_result_per_user_per_poll
+            AliveIndex(fields=["poll", "answer"]),
+            # Keyset pagination walks (created_at, pk) newest first, per poll or per owner.
+            # answer is carried along so the vote timeline is an index-only scan.
+            models.Index(fields=["poll", "-created_at", "-pr_id"], include=["answer"],
+                         name="poll_result_poll_created_idx"),
+            models.Index(fields=["-created_at", "-pr_id"]),
+            # Answers changed since the last firescore run, see campaign/scoring.py
+            models.Index(fields=["poll", "modified_at"]),
         ]
         constraints=[
             models.UniqueConstraint(
@@ -86,3 +104,55 @@ class PollResult(SoftDeleteModel):
         if self.user_identifier:
             self.user_identifier = self.user_identifier.strip()
 
+
+class PollTally(TimeStampedModel):
+    """
+    Running count of a poll's active results per answer (answer NULL for
+    results without one). Written in the same transaction as the results
+    themselves and reconciled periodically, see poll/services.py
+    """
+    tally_id = models.BigAutoField(primary_key=True)
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name="tallies")
+    answer = models.ForeignKey("question_answers.Answer", on_delete=models.CASCADE, related_name="poll_tallies",
+                               null=True, blank=True)
+    # Plain integer: deltas are added in SQL, a drifted row is fixed by the reconcile task
+    count = models.IntegerField(default=0)
+    # Bumped by every write to count, in the same statement, so the sum over a
+    # poll's tallies moves with every vote (the summary's ETag, see views.py)
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["poll", "answer"],
+                nulls_distinct=False,
+                name="uq_poll_tally_per_answer",
+            ),
+        ]
+
+    def __str__(self):
+        return f"PollTally poll={self.poll_id} answer={self.answer_id} n={self.count}"
+
+
+class PollSnapshot(TimeStampedModel):
+    """
+    Final results of a poll, written once when it closes and never changed.
+    answer_counts is the summary payload: [ { "answer", "count", "answer_text" }, ... ]
+    """
+    snapshot_id = models.BigAutoField(primary_key=True)
+    poll = models.OneToOneField(Poll, on_delete=models.CASCADE, related_name="final_snapshot")
+    answer_counts = models.JSONField(default=list, blank=True)
+    # Active results (one per respondent), those with an answer, and every
+    # submission including superseded ones
+    respondent_count = models.PositiveIntegerField(default=0)
+    answered_count = models.PositiveIntegerField(default=0)
+    submission_count = models.PositiveIntegerField(default=0)
+    closed_at = models.DateTimeField()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Final poll results can't be changed.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"PollSnapshot poll={self.poll_id} n={self.respondent_count}"
@@ -1,13 +1,15 @@
 from django.utils import timezone
 from .models import Poll, PollResult
 from rest_framework import serializers
+from core.serializers import SparseFieldsMixin
 from question_answers.models import Answer
 
-class PollSerializer(serializers.ModelSerializer):
+class PollSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Poll
-        fields = ["poll_id", "title", "query", "question", "starts_at", "ends_at", "is_active"]
+        fields = ["poll_id", "title", "query", "question", "starts_at", "ends_at", "is_active", "status", "closed_at"]
+        read_only_fields = ["status", "closed_at"]
 
     def validate(self, data):
         
@@ -24,7 +26,7 @@ class PollSerializer(serializers.ModelSerializer):
         return data
     
 
-class PollResultSerializer(serializers.ModelSerializer):
+class PollResultSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = PollResult
@@ -43,7 +45,7 @@ class PollResultSerializer(serializers.ModelSerializer):
         
         if poll:
             now = timezone.now()
-            if not (poll.is_active and poll.starts_at <= now <= poll.ends_at):
+            if not (poll.is_active and poll.status != "closed" and poll.starts_at <= now <= poll.ends_at):
                 raise serializers.ValidationError({"poll": "Poll is not live."})
             
         # Un Comment this if we need to dis allow poll answer edit !
@@ -0,0 +1,505 @@
+# poll/services.py
+from collections import Counter
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from question_answers.models import Answer
+
+from .models import Poll, PollResult, PollSnapshot, PollTally
+
+# Poll metadata for the vote path is cached this long. Writes through the ORM
+# drop it straight away (see signals.py), but only from this process's cache:
+# with the default per-process cache (no CACHES setting) another worker can
+# go on checking votes against the old status or window for up to this long,
+# e.g. keep refusing votes on a poll that was just reopened. Configure a
+# shared cache backend to close that window.
+POLL_META_TTL = 30
+
+# Polls are closed this long after ends_at, so votes checked just before the
+# end have committed by the time the final counts are taken
+POLL_CLOSE_GRACE = timedelta(seconds=30)
+
+# Votes per add_results request, and rows per INSERT when writing them
+MAX_BATCH_VOTES = 10000
+VOTE_WRITE_BATCH_SIZE = 1000
+
+# Postgres NOTIFY channel told the poll_id whenever a poll's tallies move,
+# see poll/stream.py
+TALLY_CHANNEL = "poll_tally"
+
+# Times a single vote is retried after losing a race with the same user
+VOTE_ATTEMPTS = 5
+
+USER_IDENTIFIER_MAX_LENGTH = PollResult._meta.get_field("user_identifier").max_length
+
+# Adds each (answer_id, delta) row of `deltas` to the poll's tallies. Rows go
+# in answer order so concurrent writers lock tallies in the same order.
+_TALLY_UPSERT = """
+    INSERT INTO {tally} (created_at, modified_at, poll_id, answer_id, count, version)
+    SELECT %(now)s, %(now)s, %(poll_id)s, answer_id, SUM(delta), 1 FROM {deltas} AS d
+    GROUP BY answer_id HAVING SUM(delta) <> 0
+    ORDER BY answer_id
+    ON CONFLICT (poll_id, answer_id)
+    DO UPDATE SET count = {tally}.count + EXCLUDED.count, version = {tally}.version + 1,
+                  modified_at = EXCLUDED.modified_at
+"""
+
+
+class VoteError(Exception):
+    """
+    A vote the poll can't take. `field` / `message` follow DRF's error format,
+    `status` is the HTTP status to answer with.
+    """
+
+    def __init__(self, field, message, status=400):
+        super().__init__(message)
+        self.field = field
+        self.message = message
+        self.status = status
+
+
+def poll_meta_key(poll_id):
+    return f"poll:meta:{poll_id}"
+
+
+def question_answers_key(question_id):
+    return f"poll:answers:{question_id}"
+
+
+def get_poll_meta(poll_id):
+    """
+    What a vote is checked against, without touching the database when cached:
+        { "owner_id", "question_id", "is_active", "status", "starts_at", "ends_at", "answer_ids" }
+    or None when the poll doesn't exist.
+    """
+    meta = cache.get(poll_meta_key(poll_id))
+    if meta is None:
+        row = (
+            Poll.objects.filter(pk=poll_id)
+            .values("query__campaign__user_id", "question_id", "is_active", "status", "starts_at", "ends_at")
+            .first()
+        )
+        if row is None:
+            return None
+        meta = {
+            "owner_id": row["query__campaign__user_id"],
+            "question_id": row["question_id"],
+            "is_active": row["is_active"],
+            "status": row["status"],
+            "starts_at": row["starts_at"],
+            "ends_at": row["ends_at"],
+        }
+        cache.set(poll_meta_key(poll_id), meta, POLL_META_TTL)
+
+    answer_ids = cache.get(question_answers_key(meta["question_id"]))
+    if answer_ids is None:
+        answer_ids = frozenset(
+            Answer.objects.filter(question_id=meta["question_id"]).values_list("answer_id", flat=True)
+        )
+        cache.set(question_answers_key(meta["question_id"]), answer_ids, POLL_META_TTL)
+
+    return dict(meta, answer_ids=answer_ids)
+
+
+def final_results_key(poll_id):
+    return f"poll:final:{poll_id}"
+
+
+def forget_poll_meta(poll_id=None, question_id=None):
+    if poll_id is not None:
+        cache.delete(poll_meta_key(poll_id))
+    if question_id is not None:
+        cache.delete(question_answers_key(question_id))
+
+
+def check_poll(meta, user, now=None):
+    """
+    The poll-level checks of a vote: the poll exists, belongs to `user` and is live.
+    """
+    if meta is None or meta["owner_id"] != user.id:
+        raise VoteError("detail", "Not found.", status=404)
+
+    now = now or timezone.now()
+    live = meta["is_active"] and meta.get("status") != "closed" and meta["starts_at"] <= now <= meta["ends_at"]
+    if not live:
+        raise VoteError("poll", "Poll is not live.")
+
+
+def check_answer(meta, answer_id, user_identifier):
+    """
+    The per-vote checks. Returns the cleaned (answer_id, user_identifier).
+    """
+    if not isinstance(user_identifier, str) and user_identifier is not None:
+        raise VoteError("user_identifier", "Not a valid string.")
+    user_identifier = (user_identifier or "").strip()
+    if not user_identifier:
+        raise VoteError("user_identifier", "This field may not be blank.")
+    # Checked here, a batch insert would truncate it to the column instead of failing
+    if len(user_identifier) > USER_IDENTIFIER_MAX_LENGTH:
+        raise VoteError(
+            "user_identifier", f"Ensure this field has no more than {USER_IDENTIFIER_MAX_LENGTH} characters."
+        )
+
+    if answer_id in (None, ""):
+        answer_id = None
+    else:
+        try:
+            answer_id = int(answer_id)
+        except (TypeError, ValueError):
+            raise VoteError("answer", "Incorrect type. Expected pk value.")
+        if answer_id not in meta["answer_ids"]:
+            raise VoteError("answer", "Answer does not belong to this Question !")
+
+    return answer_id, user_identifier
+
+
+def check_vote(meta, user, answer_id, user_identifier, now=None):
+    """
+    Validate one vote against the poll metadata, same rules as
+    PollResultSerializer. Returns the cleaned (answer_id, user_identifier).
+    """
+    if meta is None or meta["owner_id"] != user.id:
+        raise VoteError("detail", "Not found.", status=404)
+    answer_id, user_identifier = check_answer(meta, answer_id, user_identifier)
+    check_poll(meta, user, now)
+    return answer_id, user_identifier
+
+
+def cast_vote(poll_id, answer_id, user_identifier, now=None):
+    """
+    Record a validated vote in one statement: the user's active result for the
+    poll is deactivated, the new one inserted and the poll's tallies moved
+    from the old answer to the new one. Should another vote by the same user
+    commit in between, the insert hits uq_active_result_per_user_per_poll and
+    inserts nothing; that vote's row is then locked and given this answer, so
+    the user still ends up with exactly one active result. Returns the new
+    active result's pr_id.
+    """
+    table = PollResult._meta.db_table
+    tally = PollTally._meta.db_table
+    now = now or timezone.now()
+    sql = f"""
+        WITH superseded AS (
+            UPDATE {table} SET is_active = false, modified_at = %(now)s
+            WHERE poll_id = %(poll_id)s AND user_identifier = %(user_identifier)s AND is_active
+            RETURNING answer_id
+        ), inserted AS (
+            INSERT INTO {table} (created_at, modified_at, is_active, poll_id, answer_id, user_identifier)
+            -- Reading the CTE makes it run before the insert checks the constraint
+            SELECT %(now)s, %(now)s, true, %(poll_id)s, %(answer_id)s, %(user_identifier)s
+            FROM (SELECT COUNT(*) FROM superseded) AS done
+            ON CONFLICT (poll_id, user_identifier) WHERE is_active DO NOTHING
+            RETURNING pr_id, answer_id
+        ), deltas AS (
+            SELECT answer_id, -1 AS delta FROM superseded
+            UNION ALL
+            SELECT answer_id, 1 FROM inserted
+        ), tallied AS (
+            {_TALLY_UPSERT.format(tally=tally, deltas="deltas")}
+        )
+        SELECT pr_id, pg_notify(%(channel)s, %(poll_id)s::text) FROM inserted
+    """
+    params = {"now": now, "poll_id": poll_id, "answer_id": answer_id, "user_identifier": user_identifier,
+              "channel": TALLY_CHANNEL}
+    current = f"""
+        SELECT pr_id, answer_id FROM {table}
+        WHERE poll_id = %(poll_id)s AND user_identifier = %(user_identifier)s AND is_active
+        FOR UPDATE
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+        if row is not None:
+            return row[0]
+
+        # Lost a race with another vote by the same user: lock the vote that
+        # won and change its answer in place, or try again when it has been
+        # superseded in the meantime too.
+        with transaction.atomic():
+            for _ in range(VOTE_ATTEMPTS):
+                cursor.execute(current, params)
+                row = cursor.fetchone()
+                if row is not None:
+                    pr_id, previous = row
+                    PollResult.objects.filter(pk=pr_id).update(answer_id=answer_id, modified_at=now)
+                    apply_tally_delta(poll_id, removed=[previous], added=[answer_id], now=now)
+                    return pr_id
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+                if row is not None:
+                    return row[0]
+    raise IntegrityError(f"Could not record the vote of {user_identifier!r} on poll {poll_id}.")
+
+
+def apply_tally_delta(poll_id, removed=(), added=(), now=None):
+    """
+    Move a poll's tallies: one count off per answer in `removed` (results that
+    stopped counting), one on per answer in `added`. None stands for results
+    without an answer. Must run inside the writer's transaction; listeners on
+    TALLY_CHANNEL hear about it when that commits.
+    """
+    deltas = Counter(added)
+    deltas.subtract(Counter(removed))
+    deltas = {answer_id: n for answer_id, n in deltas.items() if n}
+    if not deltas:
+        return
+
+    tally = PollTally._meta.db_table
+    deltas_sql = "(SELECT * FROM unnest(%(answer_ids)s::bigint[], %(deltas)s::integer[]) AS d(answer_id, delta))"
+    sql = f"""
+        WITH tallied AS (
+            {_TALLY_UPSERT.format(tally=tally, deltas=deltas_sql)}
+            RETURNING poll_id
+        )
+        SELECT pg_notify(%(channel)s, %(poll_id)s::text) FROM tallied LIMIT 1
+    """
+    params = {
+        "now": now or timezone.now(),
+        "poll_id": poll_id,
+        "answer_ids": list(deltas),
+        "deltas": list(deltas.values()),
+        "channel": TALLY_CHANNEL,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def notify_tally_change(poll_id):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", [TALLY_CHANNEL, str(poll_id)])
+
+
+def rebuild_poll_tallies(poll_ids):
+    """
+    Recount the tallies of the given polls from their active results, one
+    poll per transaction. Every answer the poll can take gets a tally row
+    first (a vote landing on a new row would otherwise race our insert),
+    then the poll's rows are locked, so votes landing meanwhile wait rather
+    than being counted twice or lost.
+    Returns the number of tally rows that had drifted.
+    """
+    fixed = 0
+    for poll_id in poll_ids:
+        drifted = False
+        with transaction.atomic():
+            answer_ids = sorted(
+                Answer.all_objects.filter(question__polls__pk=poll_id).values_list("answer_id", flat=True)
+            )
+            # Same order as the vote path's upserts: answers first, no answer last
+            PollTally.objects.bulk_create(
+                [PollTally(poll_id=poll_id, answer_id=answer_id, count=0) for answer_id in answer_ids + [None]],
+                ignore_conflicts=True,
+            )
+            current = {
+                t.answer_id: t
+                for t in PollTally.objects.select_for_update().filter(poll_id=poll_id).order_by("answer_id")
+            }
+            counts = dict(
+                PollResult.objects.filter(poll_id=poll_id)
+                .values_list("answer_id")
+                .annotate(n=Count("pr_id"))
+                .order_by()
+            )
+            for answer_id in current.keys() | counts.keys():
+                n = counts.get(answer_id, 0)
+                row = current.get(answer_id)
+                if row is None:
+                    # An answer of another question, which no vote can add to
+                    PollTally.objects.create(poll_id=poll_id, answer_id=answer_id, count=n)
+                elif row.count != n:
+                    row.count, row.version = n, F("version") + 1
+                    row.save(update_fields=["count", "version", "modified_at"])
+                else:
+                    continue
+                fixed += 1
+                drifted = True
+            if drifted:
+                notify_tally_change(poll_id)
+    return fixed
+
+
+def load_tallies(poll_ids):
+    """
+    Current tallies of several polls in one query:
+        { poll_id: { answer_id: (count, answer_text) } }
+    with every requested poll present. answer_text as in poll_tallies().
+    """
+    tallies = {poll_id: {} for poll_id in poll_ids}
+    rows = (
+        PollTally.objects.filter(poll_id__in=list(poll_ids))
+        .values_list("poll_id", "answer_id", "count", "answer__answer", "answer__is_active")
+    )
+    for poll_id, answer_id, count, text, is_active in rows:
+        tallies[poll_id][answer_id] = (count, text if is_active else None)
+    return tallies
+
+
+def poll_tallies(poll_id):
+    """
+    The poll's summary straight from its tallies, largest first:
+        [ { "answer", "count", "answer_text" }, ... ]
+    answer_text is None for results without an answer and for inactive answers.
+    """
+    rows = (
+        PollTally.objects.filter(poll_id=poll_id, count__gt=0)
+        .values_list("answer_id", "count", "answer__answer", "answer__is_active")
+        .order_by("-count", "answer_id")
+    )
+    return [
+        {"answer": answer_id, "count": count, "answer_text": text if is_active else None}
+        for answer_id, count, text, is_active in rows
+    ]
+
+
+def _record_votes(poll_id, votes, now):
+    identifiers = list(votes)
+    with transaction.atomic():
+        active = PollResult.objects.filter(poll_id=poll_id, user_identifier__in=identifiers)
+        replaced = dict(active.select_for_update().values_list("user_identifier", "answer_id"))
+        if replaced:
+            active.update(is_active=False, modified_at=now)
+
+        rows = PollResult.objects.bulk_create(
+            [
+                PollResult(poll_id=poll_id, answer_id=answer_id, user_identifier=user_identifier,
+                           created_at=now, modified_at=now)
+                for user_identifier, answer_id in votes.items()
+            ],
+            batch_size=VOTE_WRITE_BATCH_SIZE,
+        )
+        apply_tally_delta(poll_id, removed=replaced.values(), added=votes.values(), now=now)
+    return {row.user_identifier: (row.pr_id, row.user_identifier in replaced) for row in rows}
+
+
+def record_votes(poll_id, votes, now=None):
+    """
+    Write validated votes ({ user_identifier: answer_id }) in a few statements:
+    one set-based deactivate of the voters' active results, bulk_create, and
+    one upsert of the poll's tallies.
+    Returns { user_identifier: (pr_id, replaced) }. A single vote committing
+    for one of the same voters midway fails the insert; the batch is then
+    retried once.
+    """
+    now = now or timezone.now()
+    try:
+        return _record_votes(poll_id, votes, now)
+    except IntegrityError:
+        return _record_votes(poll_id, votes, now)
+
+
+def _final_counts(poll):
+    rows = (
+        PollResult.all_objects.filter(poll_id=poll.pk)
+        .values("answer_id")
+        .annotate(active=Count("pr_id", filter=Q(is_active=True)), total=Count("pr_id"))
+        .order_by()
+    )
+    texts = dict(
+        Answer.objects.filter(question_id=poll.question_id, is_active=True).values_list("answer_id", "answer")
+    )
+    answer_counts = sorted(
+        (
+            {"answer": row["answer_id"], "count": row["active"], "answer_text": texts.get(row["answer_id"])}
+            for row in rows if row["active"]
+        ),
+        key=lambda item: (-item["count"], item["answer"] or 0),
+    )
+    return {
+        "answer_counts": answer_counts,
+        "respondent_count": sum(item["count"] for item in answer_counts),
+        "answered_count": sum(item["count"] for item in answer_counts if item["answer"] is not None),
+        "submission_count": sum(row["total"] for row in rows),
+    }
+
+
+def close_poll(poll_id, now=None):
+    """
+    Close a poll and freeze its final results into a PollSnapshot, counted
+    from PollResult itself rather than the tallies. Returns False when the
+    poll is already closed or being closed by another worker.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        poll = (
+            Poll.objects.select_for_update(skip_locked=True)
+            .filter(pk=poll_id).exclude(status="closed")
+            .only("poll_id", "question_id").first()
+        )
+        if poll is None:
+            return False
+        PollSnapshot.objects.create(poll=poll, closed_at=now, **_final_counts(poll))
+        Poll.objects.filter(pk=poll_id).update(status="closed", closed_at=now, modified_at=now)
+        transaction.on_commit(lambda: forget_poll_meta(poll_id=poll_id))
+    return True
+
+
+def sync_poll_status(poll_id, now=None):
+    """
+    Bring a poll's status back in line with its window after starts_at /
+    ends_at were edited: scheduled before starts_at, live inside the window.
+    A closed poll whose window now runs into the future is reopened and its
+    PollSnapshot dropped, to be taken again when it closes. Polls whose window
+    has ended are left to advance_poll_lifecycle. Returns the new status, or
+    None when it didn't change.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        poll = (
+            Poll.objects.select_for_update()
+            .filter(pk=poll_id, is_active=True, ends_at__gte=now)
+            .only("poll_id", "status", "starts_at")
+            .first()
+        )
+        if poll is None:
+            return None
+        status = "scheduled" if now < poll.starts_at else "live"
+        if status == poll.status:
+            return None
+        if poll.status == "closed":
+            PollSnapshot.objects.filter(poll_id=poll_id).delete()
+        Poll.objects.filter(pk=poll_id).update(status=status, closed_at=None, modified_at=now)
+        transaction.on_commit(lambda: forget_poll_meta(poll_id=poll_id))
+    return status
+
+
+def advance_poll_lifecycle(now=None):
+    """
+    Move polls through their states: scheduled ones whose window has started
+    become live, and any not yet closed whose window ended more than
+    POLL_CLOSE_GRACE ago are closed. Returns { "opened": n, "closed": n }.
+    """
+    now = now or timezone.now()
+    polls = Poll.objects.filter(is_active=True)
+    opened = polls.filter(status="scheduled", starts_at__lte=now, ends_at__gte=now).update(
+        status="live", modified_at=now
+    )
+    due = polls.filter(status__in=("scheduled", "live"), ends_at__lt=now - POLL_CLOSE_GRACE)
+    closed = sum(close_poll(poll_id, now) for poll_id in due.values_list("poll_id", flat=True))
+    return {"opened": opened, "closed": closed}
+
+
+def final_results(poll_id, closed_at):
+    """
+    A closed poll's frozen results, cached without expiry since they never change:
+        { "answer_counts", "respondent_count", "answered_count", "submission_count", "closed_at" }
+    or None when the poll hasn't closed. closed_at is the poll's: a poll can be
+    reopened and closed again, and a cached snapshot of an earlier closing
+    doesn't match it.
+    """
+    if closed_at is None:
+        return None
+    data = cache.get(final_results_key(poll_id))
+    if data is None or data["closed_at"] != closed_at:
+        data = (
+            PollSnapshot.objects.filter(poll_id=poll_id)
+            .values("answer_counts", "respondent_count", "answered_count", "submission_count", "closed_at")
+            .first()
+        )
+        if data is None:
+            return None
+        cache.set(final_results_key(poll_id), data, None)
+    return data
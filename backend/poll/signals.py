@@ -0,0 +1,19 @@
+# poll/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from question_answers.models import Answer
+
+from .models import Poll
+from .services import forget_poll_meta
+
+
+# Keep the vote path's cached poll metadata in step with ORM writes
+@receiver([post_save, post_delete], sender=Poll)
+def _poll_changed(sender, instance, **kwargs):
+    forget_poll_meta(poll_id=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Answer)
+def _answer_changed(sender, instance, **kwargs):
+    forget_poll_meta(question_id=instance.question_id)
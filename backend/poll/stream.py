@@ -0,0 +1,220 @@
+# poll/stream.py
+import asyncio
+import logging
+import weakref
+from collections import defaultdict
+
+import psycopg2
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connections
+
+from .services import TALLY_CHANNEL, load_tallies
+
+logger = logging.getLogger(__name__)
+
+# Notifications arriving within this many seconds are folded into one read of
+# the tallies and one event per viewer
+STREAM_COALESCE_SECONDS = 0.5
+# A comment line is sent after this long without changes, so proxies keep the
+# connection open
+STREAM_KEEPALIVE_SECONDS = 15
+# Wait before reconnecting a dropped listener connection
+LISTENER_RETRY_SECONDS = 2
+
+
+def _open_listener():
+    params = connections["default"].get_connection_params()
+    conn = psycopg2.connect(**params)
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    with conn.cursor() as cursor:
+        cursor.execute(f"LISTEN {TALLY_CHANNEL}")
+    return conn
+
+
+def _read_tallies(poll_ids):
+    # Runs in a worker thread, outside of any request
+    close_old_connections()
+    return load_tallies(poll_ids)
+
+
+def _diff(old, new):
+    changes = {}
+    for answer_id in old.keys() | new.keys():
+        before, text = old.get(answer_id, (0, None))
+        # An answer whose tally row is gone keeps the text the viewer already has
+        count, text = new.get(answer_id, (0, text))
+        if count != before:
+            changes[answer_id] = {"answer": answer_id, "count": count, "delta": count - before, "answer_text": text}
+    return changes
+
+
+class Subscriber:
+    """
+    One viewer of a poll. Changes pushed while the viewer is still sending the
+    previous event are merged, so a slow client gets fewer, larger events
+    rather than a growing backlog.
+    """
+
+    def __init__(self, poll_id):
+        self.poll_id = poll_id
+        self.snapshot = {}
+        self.changes = {}
+        self.ready = asyncio.Event()
+
+    def push(self, changes):
+        for answer_id, change in changes.items():
+            merged = self.changes.get(answer_id)
+            if merged is not None:
+                change = dict(change, delta=merged["delta"] + change["delta"])
+            self.changes[answer_id] = change
+        self.ready.set()
+
+    async def next(self, timeout):
+        """
+        The changes since the last call, or None after `timeout` seconds without any.
+        """
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self.ready.clear()
+        changes, self.changes = self.changes, {}
+        return [change for change in changes.values() if change["delta"]]
+
+
+class TallyHub:
+    """
+    Fans poll tally changes out to every viewer in this process. One LISTEN
+    connection hears which polls moved; every STREAM_COALESCE_SECONDS the
+    watched ones among them are read back in a single query and the
+    difference pushed to their subscribers. Lives on the event loop that
+    created it, see get_hub().
+    """
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.tallies = {}  # poll_id -> { answer_id: (count, answer_text) }, watched polls only
+        self.pending = set()
+        self.wakeup = asyncio.Event()
+        self.listener = None
+        self.started = asyncio.Lock()
+        self.flusher = None
+
+    async def subscribe(self, poll_id):
+        """
+        Register a viewer of `poll_id`. Its snapshot is the tallies every later
+        push is relative to.
+        """
+        await self._start()
+        subscriber = Subscriber(poll_id)
+        if poll_id not in self.tallies:
+            loaded = (await sync_to_async(_read_tallies)([poll_id]))[poll_id]
+            self.tallies.setdefault(poll_id, loaded)
+        self.subscribers[poll_id].add(subscriber)
+        subscriber.snapshot = dict(self.tallies[poll_id])
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        viewers = self.subscribers.get(subscriber.poll_id)
+        if viewers is None:
+            return
+        viewers.discard(subscriber)
+        if not viewers:
+            del self.subscribers[subscriber.poll_id]
+            self.tallies.pop(subscriber.poll_id, None)
+
+    async def _start(self):
+        async with self.started:
+            if self.listener is None:
+                await self._connect()
+            if self.flusher is None:
+                self.flusher = asyncio.create_task(self._flush_forever())
+
+    async def _connect(self):
+        self.listener = await asyncio.to_thread(_open_listener)
+        asyncio.get_running_loop().add_reader(self.listener.fileno(), self._on_notify)
+
+    def _on_notify(self):
+        try:
+            self.listener.poll()
+        except psycopg2.Error:
+            logger.warning("Poll tally listener lost its connection, reconnecting.")
+            self._drop_listener()
+            asyncio.get_running_loop().create_task(self._reconnect())
+            return
+        while self.listener.notifies:
+            payload = self.listener.notifies.pop(0).payload
+            if payload.isdigit() and int(payload) in self.subscribers:
+                self.pending.add(int(payload))
+        if self.pending:
+            self.wakeup.set()
+
+    def _drop_listener(self):
+        if self.listener is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(self.listener.fileno())
+        except (ValueError, OSError):
+            pass
+        try:
+            self.listener.close()
+        except psycopg2.Error:
+            pass
+        self.listener = None
+
+    async def _reconnect(self):
+        while self.listener is None:
+            await asyncio.sleep(LISTENER_RETRY_SECONDS)
+            try:
+                async with self.started:
+                    if self.listener is None:
+                        await self._connect()
+            except psycopg2.Error:
+                logger.warning("Poll tally listener could not reconnect, retrying.")
+        # Notifications sent while disconnected are gone: re-read everything watched
+        self.pending.update(self.subscribers)
+        self.wakeup.set()
+
+    async def _flush_forever(self):
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(STREAM_COALESCE_SECONDS)
+            self.wakeup.clear()
+            try:
+                await self._flush()
+            except Exception:
+                logger.exception("Could not read poll tallies for the stream.")
+                await asyncio.sleep(LISTENER_RETRY_SECONDS)
+
+    async def _flush(self):
+        polls = {poll_id for poll_id in self.pending if poll_id in self.subscribers}
+        self.pending.clear()
+        if not polls:
+            return
+        fresh = await sync_to_async(_read_tallies)(polls)
+        # Nothing below awaits, so subscribers see the snapshot and the changes
+        # on top of it in a consistent order
+        for poll_id in polls:
+            viewers = self.subscribers.get(poll_id)
+            if not viewers:
+                continue
+            changes = _diff(self.tallies.get(poll_id, {}), fresh[poll_id])
+            self.tallies[poll_id] = fresh[poll_id]
+            if changes:
+                for subscriber in viewers:
+                    subscriber.push(changes)
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    """
+    The hub of the running event loop. An ASGI server runs one loop per
+    process, so this is one hub and one listener connection per process.
+    """
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = TallyHub()
+    return hub
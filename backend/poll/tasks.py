@@ -0,0 +1,44 @@
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.utils import timezone
+
+from .models import Poll
+from .services import advance_poll_lifecycle, rebuild_poll_tallies
+
+
+logger = logging.getLogger(__name__)
+
+# Polls that finished this recently are still reconciled by default
+TALLY_RECONCILE_LOOKBACK = timedelta(days=1)
+
+
+@shared_task
+def reconcile_poll_tallies(poll_ids=None):
+    """
+    Recount PollTally rows from PollResult to correct any drift left by the
+    write-through updates. By default covers the live polls and those that
+    finished within TALLY_RECONCILE_LOOKBACK; runs periodically from beat.
+    """
+    if poll_ids is None:
+        now = timezone.now()
+        poll_ids = list(
+            Poll.objects.filter(is_active=True, starts_at__lte=now, ends_at__gte=now - TALLY_RECONCILE_LOOKBACK)
+            .values_list("poll_id", flat=True)
+        )
+    fixed = rebuild_poll_tallies(poll_ids)
+    logger.info("Reconciled tallies of %s polls, %s rows had drifted.", len(poll_ids), fixed)
+    return fixed
+
+
+@shared_task
+def advance_polls():
+    """
+    Open polls whose window started and close, with final results, those
+    whose window ended, see services.advance_poll_lifecycle.
+    """
+    counts = advance_poll_lifecycle()
+    if counts["opened"] or counts["closed"]:
+        logger.info("Poll lifecycle: %s", counts)
+    return counts
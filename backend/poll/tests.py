@@ -1,3 +1,349 @@
+import asyncio
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import FireMeUser
+from campaign.models import Campaign, Query
+from question_answers.models import Answer, Question
+from social.models import Platform
+
+from .models import Poll, PollResult, PollSnapshot, PollTally
+from .services import POLL_CLOSE_GRACE, advance_poll_lifecycle, cast_vote, close_poll, rebuild_poll_tallies
+from .stream import Subscriber, _diff
+from .timeline import vote_timeline
+
+
+class PollTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = FireMeUser.objects.create_user(username="owner", email="owner@example.com", password="x")
+        plt = Platform.objects.create(name="p")
+        campaign = Campaign.objects.create(user=self.user, plt=plt, name="c")
+        self.query = Query.objects.create(campaign=campaign, search_term="t")
+        question = Question.objects.create(user=self.user, question="q")
+        self.yes = Answer.objects.create(question=question, answer="yes")
+        self.no = Answer.objects.create(question=question, answer="no")
+        now = timezone.now()
+        self.poll = Poll.objects.create(
+            query=self.query, question=question,
+            starts_at=now - timedelta(hours=1), ends_at=now + timedelta(hours=1),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tallies(self):
+        return dict(PollTally.objects.filter(poll=self.poll, count__gt=0).values_list("answer_id", "count"))
+
+    def counted(self):
+        # What the tallies must match: the active results per answer
+        return dict(
+            PollResult.objects.filter(poll=self.poll)
+            .values_list("answer_id").annotate(n=Count("pr_id")).order_by()
+        )
+
+    def vote(self, answer, user_identifier):
+        return self.client.post(
+            f"/api/polls/{self.poll.pk}/add_result/",
+            {"answer": answer.pk if answer else None, "user_identifier": user_identifier}, format="json",
+        )
+
+
+class CastVoteTests(PollTestCase):
+
+    def test_first_vote(self):
+        pr_id = cast_vote(self.poll.pk, self.yes.pk, "alice")
+
+        result = PollResult.objects.get(pk=pr_id)
+        self.assertEqual((result.answer_id, result.user_identifier), (self.yes.pk, "alice"))
+        self.assertEqual(self.tallies(), {self.yes.pk: 1})
+        self.assertEqual(self.tallies(), self.counted())
+
+    def test_revote_supersedes_previous_answer(self):
+        first = cast_vote(self.poll.pk, self.yes.pk, "alice")
+        second = cast_vote(self.poll.pk, self.no.pk, "alice")
+
+        self.assertNotEqual(first, second)
+        self.assertFalse(PollResult.all_objects.get(pk=first).is_active)
+        self.assertEqual(list(PollResult.objects.filter(poll=self.poll).values_list("pk", flat=True)), [second])
+        self.assertEqual(self.tallies(), {self.no.pk: 1})
+        self.assertEqual(self.tallies(), self.counted())
+
+    def test_duplicate_submit_counts_once(self):
+        for _ in range(2):
+            response = self.vote(self.yes, "alice")
+            self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(PollResult.objects.filter(poll=self.poll).count(), 1)
+        self.assertEqual(PollResult.all_objects.filter(poll=self.poll).count(), 2)
+        self.assertEqual(self.tallies(), {self.yes.pk: 1})
+        self.assertEqual(self.tallies(), self.counted())
+
+    def test_vote_without_answer_is_tallied_apart(self):
+        self.vote(None, "alice")
+        self.vote(self.yes, "bob")
+
+        self.assertEqual(self.tallies(), {None: 1, self.yes.pk: 1})
+        self.assertEqual(self.tallies(), self.counted())
+
+    def test_closed_poll_rejects_votes(self):
+        self.vote(self.yes, "alice")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(close_poll(self.poll.pk))
+
+        response = self.vote(self.no, "alice")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"poll": ["Poll is not live."]})
+        self.assertEqual(self.tallies(), {self.yes.pk: 1})
+        self.assertEqual(self.tallies(), self.counted())
+
+    def test_answer_of_another_question_is_rejected(self):
+        other = Answer.objects.create(question=Question.objects.create(user=self.user, question="o"), answer="x")
+
+        response = self.vote(other, "alice")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.tallies(), {})
+
+    def test_bad_identifiers_are_rejected(self):
+        for user_identifier in (42, ["alice"], "x" * 256, "  "):
+            response = self.vote(self.yes, user_identifier)
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(list(response.data), ["user_identifier"])
+        self.assertEqual(self.tallies(), {})
+        self.assertFalse(PollResult.all_objects.exists())
+
+
+class BatchVoteTests(PollTestCase):
+
+    def add_results(self, results):
+        return self.client.post(f"/api/polls/{self.poll.pk}/add_results/", {"results": results}, format="json")
+
+    def test_statuses_follow_the_batch(self):
+        cast_vote(self.poll.pk, self.yes.pk, "carol")
+
+        response = self.add_results([
+            {"user_identifier": "alice", "answer": self.yes.pk},
+            {"user_identifier": "bob", "answer": self.no.pk},
+            {"user_identifier": "alice", "answer": self.no.pk},
+            {"user_identifier": "carol", "answer": self.no.pk},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["status"] for item in response.data["results"]],
+                         ["superseded", "created", "created", "replaced"])
+        self.assertEqual(self.tallies(), {self.no.pk: 3})
+        self.assertEqual(self.tallies(), self.counted())
+
+    def test_bad_identifiers_are_invalid_not_truncated(self):
+        too_long = "x" * 256
+
+        response = self.add_results([
+            {"user_identifier": 42, "answer": self.yes.pk},
+            {"user_identifier": too_long, "answer": self.yes.pk},
+            {"user_identifier": "alice", "answer": self.yes.pk},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["invalid"], response.data["created"]), (2, 1))
+        self.assertEqual([list(item.get("errors", {})) for item in response.data["results"]],
+                         [["user_identifier"], ["user_identifier"], []])
+        self.assertEqual(list(PollResult.objects.values_list("user_identifier", flat=True)), ["alice"])
+        self.assertEqual(self.tallies(), {self.yes.pk: 1})
+
+
+class PollResultTallyTests(PollTestCase):
+
+    def test_inactive_resubmit_takes_superseded_answer_off(self):
+        self.vote(self.yes, "alice")
+
+        response = self.client.post(
+            "/api/poll-results/",
+            {"poll": self.poll.pk, "answer": self.no.pk, "user_identifier": "alice", "is_active": False},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.tallies(), {})
+        self.assertEqual(self.tallies(), self.counted())
+
+    def test_rebuild_fixes_drift(self):
+        for user_identifier, answer in (("alice", self.yes), ("bob", self.yes), ("carol", self.no)):
+            self.vote(answer, user_identifier)
+        PollTally.objects.filter(poll=self.poll, answer=self.yes).update(count=7)
+        PollTally.objects.filter(poll=self.poll, answer=self.no).delete()
+
+        self.assertEqual(rebuild_poll_tallies([self.poll.pk]), 2)
+        self.assertEqual(self.tallies(), {self.yes.pk: 2, self.no.pk: 1})
+        self.assertEqual(rebuild_poll_tallies([self.poll.pk]), 0)
+
+    def test_summary_reads_tallies(self):
+        self.vote(self.yes, "alice")
+        self.vote(self.no, "bob")
+        self.vote(self.no, "alice")
+
+        response = self.client.get(f"/api/polls/{self.poll.pk}/summary/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row["answer"], row["count"]) for row in response.data], [(self.no.pk, 2)])
+
+    def test_summary_etag_changes_with_votes(self):
+        self.vote(self.yes, "alice")
+        url = f"/api/polls/{self.poll.pk}/summary/"
+        etag = self.client.get(url)["ETag"]
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.vote(self.no, "bob")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_summary_etag_follows_votes_committing_out_of_order(self):
+        now = timezone.now()
+        cast_vote(self.poll.pk, self.no.pk, "carol", now=now - timedelta(minutes=2))
+        cast_vote(self.poll.pk, self.yes.pk, "alice", now=now)
+        url = f"/api/polls/{self.poll.pk}/summary/"
+        etag = self.client.get(url)["ETag"]
+
+        # Checked before alice's vote, committed after it: no timestamp moves past hers
+        cast_vote(self.poll.pk, self.no.pk, "bob", now=now - timedelta(minutes=1))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row["answer"], row["count"]) for row in response.data],
+                         [(self.no.pk, 2), (self.yes.pk, 1)])
+        self.assertNotIn("Last-Modified", response)
+
+
+class PollStreamTests(PollTestCase):
+
+    def test_needs_the_asgi_server(self):
+        url = f"/api/polls/{self.poll.pk}/stream/"
+
+        self.assertEqual(self.client.get(url).status_code, 501)
+        self.assertEqual(self.client.post(url).status_code, 405)
+
+    def test_diff_reports_moved_answers_only(self):
+        old = {self.yes.pk: (2, "yes"), self.no.pk: (1, "no")}
+        new = {self.yes.pk: (2, "yes"), self.no.pk: (3, "no"), None: (1, None)}
+
+        self.assertEqual(_diff(old, new), {
+            self.no.pk: {"answer": self.no.pk, "count": 3, "delta": 2, "answer_text": "no"},
+            None: {"answer": None, "count": 1, "delta": 1, "answer_text": None},
+        })
+        self.assertEqual(_diff(new, {}), {
+            self.yes.pk: {"answer": self.yes.pk, "count": 0, "delta": -2, "answer_text": "yes"},
+            self.no.pk: {"answer": self.no.pk, "count": 0, "delta": -3, "answer_text": "no"},
+            None: {"answer": None, "count": 0, "delta": -1, "answer_text": None},
+        })
+
+    def test_slow_viewer_gets_merged_changes(self):
+        async def read():
+            subscriber = Subscriber(self.poll.pk)
+            subscriber.push({self.yes.pk: {"answer": self.yes.pk, "count": 1, "delta": 1, "answer_text": "yes"}})
+            subscriber.push({self.yes.pk: {"answer": self.yes.pk, "count": 3, "delta": 2, "answer_text": "yes"},
+                             self.no.pk: {"answer": self.no.pk, "count": 1, "delta": 1, "answer_text": "no"}})
+            subscriber.push({self.no.pk: {"answer": self.no.pk, "count": 0, "delta": -1, "answer_text": "no"}})
+            return await subscriber.next(1), await subscriber.next(0.01)
+
+        changes, idle = asyncio.run(read())
+
+        # no went up and back down again, so only yes is left to send
+        self.assertEqual(changes, [{"answer": self.yes.pk, "count": 3, "delta": 3, "answer_text": "yes"}])
+        self.assertIsNone(idle)
+
+
+class PollLifecycleTests(PollTestCase):
+
+    def end_poll(self):
+        ended = timezone.now() - POLL_CLOSE_GRACE - timedelta(minutes=1)
+        Poll.objects.filter(pk=self.poll.pk).update(ends_at=ended)
+
+    def test_lifecycle_opens_then_closes_with_final_results(self):
+        self.vote(self.yes, "alice")
+        self.vote(self.no, "bob")
+        self.vote(self.yes, "bob")
+
+        self.assertEqual(advance_poll_lifecycle(), {"opened": 1, "closed": 0})
+        self.end_poll()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(advance_poll_lifecycle(), {"opened": 0, "closed": 1})
+
+        response = self.client.get(f"/api/polls/{self.poll.pk}/final/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["respondent_count"], response.data["submission_count"]), (2, 3))
+        self.assertEqual([(row["answer"], row["count"]) for row in response.data["answer_counts"]],
+                         [(self.yes.pk, 2)])
+        self.assertEqual(self.vote(self.no, "carol").status_code, 400)
+
+    def test_moving_ends_at_into_the_future_reopens(self):
+        self.vote(self.yes, "alice")
+        self.end_poll()
+        with self.captureOnCommitCallbacks(execute=True):
+            advance_poll_lifecycle()
+        self.assertEqual(self.client.get(f"/api/polls/{self.poll.pk}/final/").status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f"/api/polls/{self.poll.pk}/",
+                                         {"ends_at": timezone.now() + timedelta(hours=1)}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["status"], response.data["closed_at"]), ("live", None))
+        self.assertFalse(PollSnapshot.objects.filter(poll=self.poll).exists())
+        self.assertEqual(self.client.get(f"/api/polls/{self.poll.pk}/final/").status_code, 404)
+        self.assertEqual(self.vote(self.no, "bob").status_code, 201)
+
+        # Closing again takes a new snapshot, the cached one of the first closing isn't served
+        self.end_poll()
+        with self.captureOnCommitCallbacks(execute=True):
+            advance_poll_lifecycle()
+        response = self.client.get(f"/api/polls/{self.poll.pk}/final/")
+        self.assertEqual(response.data["respondent_count"], 2)
+
+
+class VoteTimelineTests(PollTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.start = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=3)
+
+    def vote_at(self, answer, user_identifier, minutes):
+        pr_id = cast_vote(self.poll.pk, answer.pk, user_identifier)
+        PollResult.all_objects.filter(pk=pr_id).update(created_at=self.start + timedelta(minutes=minutes))
+
+    def counts(self, timeline):
+        return [(b["start"], b["total"], {a["answer"]: a["count"] for a in b["answers"]}) for b in timeline]
+
+    def test_hourly_buckets_count_every_submission(self):
+        self.vote_at(self.yes, "alice", 5)
+        self.vote_at(self.no, "alice", 10)
+        self.vote_at(self.no, "bob", 130)
+
+        response = self.client.get(f"/api/polls/{self.poll.pk}/timeline/", {"bucket": "1h"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counts(response.data["buckets"]), [
+            (self.start, 2, {self.yes.pk: 1, self.no.pk: 1}),
+            (self.start + timedelta(hours=2), 1, {self.no.pk: 1}),
+        ])
+        self.assertEqual(self.client.get(f"/api/polls/{self.poll.pk}/timeline/", {"bucket": "2h"}).status_code, 400)
+
+    def test_closed_buckets_come_from_the_cache(self):
+        self.vote_at(self.yes, "alice", 5)
+        now = self.start + timedelta(minutes=90)
+        first = vote_timeline(self.poll.pk, "1h", now=now)
+
+        # Closed and cached: a row stamped into it later isn't counted again
+        self.vote_at(self.no, "bob", 10)
+        self.vote_at(self.no, "carol", 70)
 
-# Create your tests here.
+        self.assertEqual(self.counts(vote_timeline(self.poll.pk, "1h", now=now)), self.counts(first) + [
+            (self.start + timedelta(hours=1), 1, {self.no.pk: 1}),
+        ])
@@ -0,0 +1,76 @@
+# poll/timeline.py
+from datetime import timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .models import PollResult
+
+# ?bucket= value -> (date_trunc unit, bucket width)
+TIMELINE_BUCKETS = {
+    "1m": ("minute", timedelta(minutes=1)),
+    "1h": ("hour", timedelta(hours=1)),
+    "1d": ("day", timedelta(days=1)),
+}
+DEFAULT_TIMELINE_BUCKET = "1h"
+
+# A bucket counts as closed once it ended this long ago, so votes stamped
+# just before its end have committed by the time it is cached
+TIMELINE_SETTLE = timedelta(seconds=30)
+TIMELINE_CACHE_TTL = 60 * 60 * 24
+
+
+def timeline_key(poll_id, bucket):
+    return f"poll:timeline:{poll_id}:{bucket}"
+
+
+def _truncate(value, unit):
+    value = value.astimezone(dt_timezone.utc).replace(second=0, microsecond=0)
+    if unit in ("hour", "day"):
+        value = value.replace(minute=0)
+    if unit == "day":
+        value = value.replace(hour=0)
+    return value
+
+
+def _count_buckets(poll_id, unit, since):
+    # Every submission counts, superseded ones included: this is when votes
+    # came in, not where they stand. Served by the (poll, created_at) index.
+    results = PollResult.all_objects.filter(poll_id=poll_id)
+    if since is not None:
+        results = results.filter(created_at__gte=since)
+    rows = (
+        results.annotate(start=Trunc("created_at", unit, tzinfo=dt_timezone.utc))
+        .values("start", "answer_id")
+        .annotate(count=Count("pr_id"))
+        .order_by("start", "answer_id")
+    )
+    buckets = []
+    for row in rows:
+        if not buckets or buckets[-1]["start"] != row["start"]:
+            buckets.append({"start": row["start"], "total": 0, "answers": []})
+        buckets[-1]["total"] += row["count"]
+        buckets[-1]["answers"].append({"answer": row["answer_id"], "count": row["count"]})
+    return buckets
+
+
+def vote_timeline(poll_id, bucket, now=None):
+    """
+    Submissions per bucket (UTC) and answer, oldest first, only buckets that have any:
+        [ { "start", "total", "answers": [ { "answer", "count" }, ... ] }, ... ]
+    Closed buckets are cached, so a call only counts the rows of the buckets
+    still open since the previous one.
+    """
+    unit, _ = TIMELINE_BUCKETS[bucket]
+    now = now or timezone.now()
+    closed_until = _truncate(now - TIMELINE_SETTLE, unit)
+
+    cached = cache.get(timeline_key(poll_id, bucket)) or {"until": None, "buckets": []}
+    fresh = _count_buckets(poll_id, unit, cached["until"])
+
+    closed = cached["buckets"] + [b for b in fresh if b["start"] < closed_until]
+    if cached["until"] is None or closed_until > cached["until"]:
+        cache.set(timeline_key(poll_id, bucket), {"until": closed_until, "buckets": closed}, TIMELINE_CACHE_TTL)
+    return closed + [b for b in fresh if b["start"] >= closed_until]
@@ -1,5 +1,13 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
@@ -7,17 +15,30 @@ from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 
 from campaign.permissions import IsOwnerOrReadOnly
-from .models import Poll, PollResult
-from django.db.models import Count
+from core.pagination import KeysetPagination
+from core.mixins import ConditionalGetMixin, SparseFieldsViewMixin
+from .models import Poll, PollResult, PollTally
 from django.db import transaction
+from django.db.models import Sum
 from .serializers import PollSerializer, PollResultSerializer
+from .services import (
+    MAX_BATCH_VOTES, VoteError, apply_tally_delta, cast_vote, check_answer, check_poll, check_vote, final_results,
+    get_poll_meta, poll_tallies, record_votes, sync_poll_status,
+)
+from .stream import STREAM_KEEPALIVE_SECONDS, get_hub
+from .timeline import DEFAULT_TIMELINE_BUCKET, TIMELINE_BUCKETS, vote_timeline
 from .utils import user_scoped_poll_queryset
 
 # Create your views here.
-class PollViewSet(viewsets.ModelViewSet):
+class PollViewSet(ConditionalGetMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
 
     serializer_class = PollSerializer
-    permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    # Ownership is the queryset's scoping, like QueryViewSet: a Poll has no
+    # user_id for IsOwnerOrReadOnly, which refused every update
+    permission_classes = [IsAuthenticated]
+    conditional_actions = ("summary",)
+    # Votes racing each other can commit out of modified_at order, see get_conditional_querysets
+    conditional_last_modified = False
 
     def get_queryset(self):
         qs = Poll.objects.order_by("-created_at")
@@ -32,7 +53,16 @@ class PollViewSet(viewsets.ModelViewSet):
             qs = qs.filter(query_id = query_id)
 
         return user_scoped_poll_queryset(self.request.user, qs)
-    
+
+    def get_conditional_querysets(self):
+        # The poll (status, closing) and its answers' text, then its tallies by
+        # the sum of their versions: every tally write bumps one in the same
+        # statement, where a vote committing after a later-stamped one would
+        # leave max(modified_at) where it was
+        poll = self.get_queryset().filter(pk=self.kwargs["pk"])
+        tallies = PollTally.objects.filter(poll__in=poll)
+        return [(poll, ("modified_at", "question__answers__modified_at")), (tallies, (Sum("version"),))]
+
     def perform_create(self, serializer):
         # enforce ownership: the posted query must belong to this user
         query = serializer.validated_data["query"]
@@ -45,11 +75,15 @@ class PollViewSet(viewsets.ModelViewSet):
         query = serializer.validated_data.get("query", serializer.instance.query)
         if query.campaign.user != self.request.user:
             raise PermissionError("You do not own this query.")
-        serializer.save()
+        window = (serializer.instance.starts_at, serializer.instance.ends_at)
+        poll = serializer.save()
+        # A moved window can reopen a closed poll or put a live one back to scheduled
+        if (poll.starts_at, poll.ends_at) != window and sync_poll_status(poll.pk):
+            poll.refresh_from_db(fields=["status", "closed_at", "modified_at"])
 
     def perform_destroy(self, instance):
-        instance.is_active = False
-        instance.save(update_fields=["is_active"])
+        # Soft delete, stamps modified_at for the retention of compaction
+        instance.delete()
 
     @action(detail=False, methods=['get'])
     def live(self, request):
@@ -82,81 +116,176 @@ class PollViewSet(viewsets.ModelViewSet):
     def add_result(self, request, pk=None):
         """
         POST /api/polls/{id}/add_result
+        Checked against cached poll metadata and written in a single statement,
+        see poll/services.py
         """
-        poll = get_object_or_404(self.get_queryset(), pk=pk)
-        payload = {
-            "poll": poll.poll_id,
-            "answer": request.data.get("answer"),  # may be null/blank 
-            "user_identifier": (request.data.get("user_identifier") or "").strip(),
-        }
-        ser = PollResultSerializer(data=payload, context={"request": request})
-        ser.is_valid(raise_exception=True)
-
-        # Replace behavior: deactivate old, then create new (atomic to satisfy the unique constraint)
-        with transaction.atomic():
-            # lock current active rows for this user in this poll to avoid race conditions
-            existing_qs = (
-                PollResult.objects.select_for_update()
-                .filter(poll=poll, user_identifier=ser.validated_data["user_identifier"], is_active=True)
+        if not str(pk).isdigit():
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            answer_id, user_identifier = check_vote(
+                get_poll_meta(int(pk)), request.user,
+                request.data.get("answer"),  # may be null/blank
+                request.data.get("user_identifier"),
             )
-            if existing_qs.exists():
-                existing_qs.update(is_active=False)
+        except VoteError as exc:
+            detail = exc.message if exc.field == "detail" else [exc.message]
+            return Response({exc.field: detail}, status=exc.status)
 
-            obj = PollResult.objects.create(**ser.validated_data)
-
-        return Response(PollResultSerializer(obj).data, status=status.HTTP_201_CREATED)
+        pr_id = cast_vote(int(pk), answer_id, user_identifier)
+        data = {"pr_id": pr_id, "poll": int(pk), "answer": answer_id,
+                "user_identifier": user_identifier, "is_active": True}
+        return Response(data, status=status.HTTP_201_CREATED)
     
     
+    @action(detail=True, methods=["post"])
+    def add_results(self, request, pk=None):
+        """
+        POST /api/polls/{id}/add_results/
+        Body: { "results": [ { "user_identifier", "answer" }, ... ] } (or the bare list)
+        Every entry is checked against the poll's answers, the valid ones are
+        written together (see record_votes) and each entry gets a status back, in
+        order: "created", "replaced" (the voter's previous result was
+        deactivated), "superseded" (a later entry in the batch is for the same
+        voter) or "invalid" with its errors.
+        """
+        if not str(pk).isdigit():
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        meta = get_poll_meta(int(pk))
+        try:
+            check_poll(meta, request.user)
+        except VoteError as exc:
+            detail = exc.message if exc.field == "detail" else [exc.message]
+            return Response({exc.field: detail}, status=exc.status)
+
+        entries = request.data.get("results") if isinstance(request.data, dict) else request.data
+        if not isinstance(entries, list) or not entries:
+            return Response({"results": ["Expected a non-empty list of results."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(entries) > MAX_BATCH_VOTES:
+            return Response({"results": [f"Ensure this list has no more than {MAX_BATCH_VOTES} elements."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        statuses = []
+        votes = {}  # user_identifier -> answer_id, the last entry per voter wins
+        latest = {}  # user_identifier -> index of that entry
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                statuses.append({"index": index, "status": "invalid",
+                                 "errors": {"non_field_errors": ["Expected an object."]}})
+                continue
+            try:
+                answer_id, user_identifier = check_answer(meta, entry.get("answer"), entry.get("user_identifier"))
+            except VoteError as exc:
+                statuses.append({"index": index, "status": "invalid", "errors": {exc.field: [exc.message]}})
+                continue
+            if user_identifier in latest:
+                statuses[latest[user_identifier]]["status"] = "superseded"
+            latest[user_identifier] = index
+            votes.pop(user_identifier, None)
+            votes[user_identifier] = answer_id
+            statuses.append({"index": index, "status": "created", "user_identifier": user_identifier,
+                             "answer": answer_id})
+
+        written = record_votes(int(pk), votes) if votes else {}
+        for user_identifier, (pr_id, replaced) in written.items():
+            item = statuses[latest[user_identifier]]
+            item["pr_id"] = pr_id
+            if replaced:
+                item["status"] = "replaced"
+
+        counts = {key: 0 for key in ("created", "replaced", "superseded", "invalid")}
+        for item in statuses:
+            counts[item["status"]] += 1
+        return Response({"poll": int(pk), **counts, "results": statuses}, status=status.HTTP_200_OK)
+
+
     @action(detail=True, methods=["get"])
     def results(self, request, pk=None):
         """
         GET /api/polls/{id}/results/
         """
         poll = get_object_or_404(self.get_queryset(), pk=pk)
-        qs = poll.results.select_related("answer").order_by("-created_at")
-        ser = PollResultSerializer(qs, many=True)
-        return Response(ser.data)
+        qs = PollResult.objects.filter(poll=poll).select_related("answer")
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(qs, request, view=self)
+        ser = PollResultSerializer(page, many=True)
+        return paginator.get_paginated_response(ser.data)
     
 
+    @action(detail=True, methods=["get"])
+    def timeline(self, request, pk=None):
+        """
+        GET /api/polls/{id}/timeline/?bucket=1m|1h|1d
+        Submissions per time bucket and answer, see poll/timeline.py
+        """
+        poll = get_object_or_404(self.get_queryset(), pk=pk)
+        bucket = request.query_params.get("bucket", DEFAULT_TIMELINE_BUCKET)
+        if bucket not in TIMELINE_BUCKETS:
+            return Response({"bucket": [f"Must be one of {', '.join(TIMELINE_BUCKETS)}."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({"poll": poll.pk, "bucket": bucket, "buckets": vote_timeline(poll.pk, bucket)})
+
+
     @action(detail=True, methods=['get'])
     def summary(self, request, pk=None):
         """
         GET /api/polls/{id}/summary
         """
         poll = get_object_or_404(self.get_queryset(), pk = pk)
-        counts = (
-            PollResult.objects
-            .filter(poll=poll)
-            .values("answer")
-            .annotate(count=Count("pr_id"))
-            .order_by("-count")
-        )
+        if poll.status == "closed":
+            final = final_results(poll.pk, poll.closed_at)
+            if final is not None:
+                return Response(final["answer_counts"])
+        # Read from the write-through tallies, see poll/services.py
+        return Response(poll_tallies(poll.pk))
 
-        # Attach answer text efficiently
-        answers = {a.answer_id: a.answer for a in poll.question.answers.filter(is_active=True)}
-        data = [
-            {"answer": row["answer"], "count": row["count"], "answer_text": answers.get(row["answer"])}
-            for row in counts
-        ]
-        return Response(data)
+    @action(detail=True, methods=["get"])
+    def final(self, request, pk=None):
+        """
+        GET /api/polls/{id}/final/
+        Frozen results of a closed poll, with respondent totals
+        """
+        poll = get_object_or_404(self.get_queryset(), pk=pk)
+        final = final_results(poll.pk, poll.closed_at)
+        if final is None:
+            return Response({"detail": "This poll has not closed yet."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"poll": poll.pk, **final})
     
 
-class PollResultViewSet(viewsets.ModelViewSet):
+class PollResultViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     serializer_class = PollResultSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         # scope by poll -> query.campaign.user
         qs = (
             PollResult.objects
             .select_related("poll__query__campaign", "answer", "poll__question")
-            .order_by("-created_at")
+            .order_by("-created_at", "-pr_id")
         )
+        poll_id = self.request.query_params.get("poll")
+
+        if poll_id:
+            qs = qs.filter(poll_id=poll_id)
+
         return qs.filter(poll__query__campaign__user=self.request.user)
 
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        was_active, old_poll_id, old_answer_id = instance.is_active, instance.poll_id, instance.answer_id
+        with transaction.atomic():
+            obj = serializer.save()
+            if was_active:
+                apply_tally_delta(old_poll_id, removed=[old_answer_id])
+            if obj.is_active:
+                apply_tally_delta(obj.poll_id, added=[obj.answer_id])
+
     def perform_destroy(self, instance):
-        instance.is_active = False
-        instance.save(update_fields=["is_active"])
+        with transaction.atomic():
+            if instance.is_active:
+                apply_tally_delta(instance.poll_id, removed=[instance.answer_id])
+            instance.delete()
 
 
     # Use POST for editing as well
@@ -169,12 +298,85 @@ class PollResultViewSet(viewsets.ModelViewSet):
             return Response({"detail": "Forbidden."}, status=403)
 
         with transaction.atomic():
-            PollResult.objects.select_for_update().filter(
+            previous = PollResult.objects.select_for_update().filter(
                 poll=poll,
                 user_identifier=ser.validated_data["user_identifier"],
                 is_active=True,
-            ).update(is_active=False)
+            )
+            superseded = list(previous.values_list("answer_id", flat=True))
+            previous.update(is_active=False, modified_at=timezone.now())
             obj = PollResult.objects.create(**ser.validated_data)
+            # The superseded results stop counting even when the new one is inactive
+            apply_tally_delta(poll.pk, removed=superseded, added=[obj.answer_id] if obj.is_active else [])
 
         out = self.get_serializer(obj).data
-        return Response(out, status=status.HTTP_201_CREATED)
\ No newline at end of file
+        return Response(out, status=status.HTTP_201_CREATED)
+
+
+def _stream_user(request):
+    # Same authentication as the DRF views (JWT bearer token)
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        return drf_request.user
+    except AuthenticationFailed:
+        return None
+
+
+def _can_view_poll(user, poll_id):
+    return user_scoped_poll_queryset(user, Poll.objects.all()).filter(pk=poll_id).exists()
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _tally_list(tallies):
+    rows = [
+        {"answer": answer_id, "count": count, "answer_text": text}
+        for answer_id, (count, text) in tallies.items() if count > 0
+    ]
+    return sorted(rows, key=lambda row: (-row["count"], row["answer"] or 0))
+
+
+async def poll_stream(request, pk):
+    """
+    GET /api/polls/{id}/stream/
+    Server-sent events: a "snapshot" event with the poll's summary, then a
+    "tally" event with the changed answers ({ "answer", "count", "delta",
+    "answer_text" }) whenever votes land, at most every
+    STREAM_COALESCE_SECONDS. Only served under ASGI (runserver is, through
+    daphne), see poll/stream.py.
+    Authenticated like the rest of the API, with an Authorization: Bearer
+    header. A browser's EventSource can't send headers, so clients read the
+    stream with fetch() and parse the events themselves (or use an
+    EventSource polyfill that takes headers).
+    """
+    if request.method != "GET":
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+    if not isinstance(request, ASGIRequest):
+        # A WSGI server would hold the whole response back until it ends
+        return JsonResponse({"detail": "Live streams need the ASGI server."}, status=501)
+    user = await sync_to_async(_stream_user)(request)
+    if user is None or not user.is_authenticated:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+    if not await sync_to_async(_can_view_poll)(user, pk):
+        return JsonResponse({"detail": "Not found."}, status=404)
+
+    async def events():
+        hub = get_hub()
+        subscriber = await hub.subscribe(pk)
+        try:
+            yield _sse("snapshot", {"poll": pk, "tallies": _tally_list(subscriber.snapshot)})
+            while True:
+                changes = await subscriber.next(STREAM_KEEPALIVE_SECONDS)
+                if changes is None:
+                    yield ": keepalive\n\n"
+                elif changes:
+                    yield _sse("tally", {"poll": pk, "changes": changes})
+        finally:
+            hub.unsubscribe(subscriber)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
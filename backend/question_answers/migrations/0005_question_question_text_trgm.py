@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:11
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0017_campaign_campaign_name_trgm_and_more'),
+        ('question_answers', '0004_alter_question_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['question'], name='question_text_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
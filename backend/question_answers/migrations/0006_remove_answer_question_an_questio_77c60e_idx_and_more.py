@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:14
+
+import core.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('question_answers', '0005_question_question_text_trgm'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='answer',
+            name='question_an_questio_77c60e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='question',
+            name='question_an_user_id_e477dc_idx',
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=core.models.AliveIndex(condition=models.Q(('is_active', True)), fields=['question'], name='question_an_questio_e7fff2_alv'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=core.models.AliveIndex(condition=models.Q(('is_active', True)), fields=['user', 'created_at'], name='question_an_user_id_367d61_alv'),
+        ),
+    ]
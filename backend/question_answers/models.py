@@ -1,7 +1,8 @@
 from django.db import models
 from django.db.models import Q
 from django.conf import settings
-from core.models import SoftDeleteModel
+from django.contrib.postgres.indexes import GinIndex
+from core.models import AliveIndex, SoftDeleteModel
 
 # Create your models here.
 
@@ -13,7 +14,11 @@ class Question(SoftDeleteModel):
 
     class Meta:
         ordering = ["-created_at"]
-        indexes = [models.Index(fields=["user", "is_active", "created_at"])]
+        indexes = [
+            AliveIndex(fields=["user", "created_at"]),
+            # ?search= on the question text, see core/mixins.py
+            GinIndex(fields=["question"], name="question_text_trgm", opclasses=["gin_trgm_ops"]),
+        ]
 
     def __str__(self):
         return self.question[:80] #Upto 80 characters of the question!
@@ -25,7 +30,7 @@ class Answer(SoftDeleteModel):
 
     class Meta:
         ordering = ["-created_at"]
-        indexes = [models.Index(fields=["question", "is_active"])]
+        indexes = [AliveIndex(fields=["question"])]
 
         #Prevent duplicate active answers per question!
         constraints = [
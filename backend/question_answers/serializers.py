@@ -1,7 +1,8 @@
 from rest_framework import serializers
+from core.serializers import SparseFieldsMixin
 from .models import Question, Answer
 
-class AnswerSerializer(serializers.ModelSerializer):
+class AnswerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Answer
@@ -27,7 +28,7 @@ class AnswerSerializer(serializers.ModelSerializer):
             attrs["answer"] = attrs["answer"].strip()
         return attrs
     
-class QuestionSerializer(serializers.ModelSerializer):
+class QuestionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     
     answers = AnswerSerializer(many=True, read_only=True)
 
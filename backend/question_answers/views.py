@@ -5,20 +5,19 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
+from core.mixins import SparseFieldsViewMixin, TrigramSearchMixin
 
 from .serializers import QuestionSerializer, AnswerSerializer
 # Create your views here.
 
-class QuestionViewSet(viewsets.ModelViewSet):
+class QuestionViewSet(TrigramSearchMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     serializer_class = QuestionSerializer
     permission_classes = [IsAuthenticated]
+    # ?search= ranks by trigram similarity, see core/mixins.py
+    search_field = "question"
 
     def get_queryset(self):
         qs = Question.objects.filter(user=self.request.user)
-        term = self.request.query_params.get("search")
-        if term:
-            qs = qs.filter(question__icontains=term.strip())
-
         return qs.order_by("-created_at")
 
     def perform_destroy(self, instance):
@@ -41,7 +40,7 @@ class QuestionViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class AnswerViewSet(viewsets.ModelViewSet):
+class AnswerViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     serializer_class = AnswerSerializer
     permission_classes = [IsAuthenticated]
 
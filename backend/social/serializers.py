@@ -1,8 +1,9 @@
 from rest_framework import serializers
+from core.serializers import SparseFieldsMixin
 from .models import Platform, UserPlatformApp, UserPlatformConnection
 
 
-class PlatformSerializer(serializers.ModelSerializer):
+class PlatformSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     connected = serializers.SerializerMethodField()
 
     class Meta: